@@ -0,0 +1,311 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SEC,
+    ANSWER_CACHE_SIMILARITY,
+)
+
+# Cache of final answers in front of the answer call in retrieval.py. Only
+# the model's text is stored; the evidence/citations footer is rebuilt from
+# the current retrieval.
+#   exact hit    same video, same retrieved evidence ids, same normalized
+#                question, same scope (cache version, answer model, prompt
+#                template hash, whether images were sent)
+#   similar hit  ANSWER_CACHE_SIMILARITY > 0: a cached question with the same
+#                video, evidence ids and scope whose CLIP query vector is at
+#                least that similar (cosine)
+# Entries expire after ANSWER_CACHE_TTL_SEC; beyond ANSWER_CACHE_MAX_ENTRIES
+# the least recently used are evicted. Writers call invalidate() after rows
+# of a video reach the vector store: the video's stamp is moved to now and
+# entries created before their video's stamp are stale. Questions asked
+# without a video filter are filed under ANY_VIDEO, which every re-ingest
+# invalidates.
+# With ANSWER_CACHE_PATH the entries and stamps live in SQLite, shared by the
+# query runners, the UI and ingest processes; an in-process LRU sits in front.
+
+ANY_VIDEO = "*"
+PURGE_EVERY = 100 # stores between expiry/LRU sweeps of the SQLite tier
+
+
+def normalize_query(text):
+    return " ".join((text or "").lower().split()).rstrip(" ?!.")
+
+
+def cache_key(scope, video, evidence, query):
+    raw = json.dumps([scope, video or ANY_VIDEO, evidence, normalize_query(query)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_sec=ANSWER_CACHE_TTL_SEC, similarity=ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = ttl_sec
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._lru = OrderedDict() # key -> entry dict
+        self._stamps = {} # video -> stamp, without a SQLite tier
+        self._stores = 0
+        self._db = None
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.stale = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, video TEXT NOT NULL, scope TEXT NOT NULL, "
+                "evidence TEXT NOT NULL, answer TEXT NOT NULL, vector BLOB, created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_evidence ON answers (video, scope, evidence)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS stamps (video TEXT PRIMARY KEY, stamp REAL NOT NULL)")
+
+    # -- entries -----------------------------------------------------------
+
+    def _stamp(self, video):
+        if self._db is None:
+            return self._stamps.get(video, 0.0)
+        row = self._db.execute("SELECT stamp FROM stamps WHERE video = ?", (video,)).fetchone()
+        return row[0] if row else 0.0
+
+    def _fresh(self, entry, stamp, now):
+        if self.ttl_sec and now - entry["created"] > self.ttl_sec:
+            return False
+        return entry["created"] > stamp
+
+    def _remember(self, key, entry):
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _get(self, key):
+        entry = self._lru.get(key)
+        if entry is not None or self._db is None:
+            return entry
+        row = self._db.execute("SELECT video, scope, evidence, answer, vector, created FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = self._entry(*row)
+        self._remember(key, entry)
+        return entry
+
+    def _entry(self, video, scope, evidence, answer, vector, created):
+        if isinstance(vector, bytes):
+            vector = np.frombuffer(vector, dtype=np.float32)
+        return {"video": video, "scope": scope, "evidence": evidence, "answer": answer, "vector": vector, "created": created}
+
+    def _touch(self, key, now):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+        if self._db is not None:
+            self._db.execute("UPDATE answers SET used = ? WHERE key = ?", (now, key))
+
+    def _drop(self, keys):
+        for key in keys:
+            self._lru.pop(key, None)
+        if self._db is not None and keys:
+            self._db.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+
+    def _similar(self, video, scope, evidence, query_vector, stamp, now):
+        # Best fresh entry of the video/scope/evidence above the similarity threshold
+        if self._db is None:
+            candidates = [
+                (key, entry) for key, entry in self._lru.items()
+                if entry["video"] == video and entry["scope"] == scope and entry["evidence"] == evidence and entry["vector"] is not None
+            ]
+        else:
+            rows = self._db.execute(
+                "SELECT key, video, scope, evidence, answer, vector, created FROM answers "
+                "WHERE video = ? AND scope = ? AND evidence = ? AND vector IS NOT NULL",
+                (video, scope, evidence),
+            ).fetchall()
+            candidates = [(row[0], self._entry(*row[1:])) for row in rows]
+        query_vector = _unit(query_vector)
+        candidates = [
+            (key, entry) for key, entry in candidates
+            if self._fresh(entry, stamp, now) and len(entry["vector"]) == len(query_vector)
+        ]
+        if not candidates:
+            return None
+        sims = np.stack([entry["vector"] for _, entry in candidates]) @ query_vector
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity:
+            return None
+        key, entry = candidates[best]
+        self._touch(key, now)
+        return entry["answer"]
+
+    def _purge(self, now):
+        # Expired rows, then the least recently used beyond the bound
+        if self.ttl_sec:
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_sec,))
+        excess = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute("DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY used LIMIT ?)", (excess,))
+
+    # -- public ------------------------------------------------------------
+
+    def lookup(self, video, query, evidence, query_vector=None, scope=""):
+        # Cached answer text, or None
+        video = video or ANY_VIDEO
+        key = cache_key(scope, video, evidence, query)
+        now = time.time()
+        with self._lock:
+            stamp = self._stamp(video)
+            entry = self._get(key)
+            if entry is not None:
+                if self._fresh(entry, stamp, now):
+                    self._touch(key, now)
+                    self.hits_exact += 1
+                    return entry["answer"]
+                self._drop([key])
+                self.stale += 1
+            if self.similarity > 0 and query_vector is not None:
+                answer = self._similar(video, scope, evidence, query_vector, stamp, now)
+                if answer is not None:
+                    self.hits_similar += 1
+                    return answer
+            self.misses += 1
+            return None
+
+    def store(self, video, query, evidence, answer, query_vector=None, scope=""):
+        video = video or ANY_VIDEO
+        key = cache_key(scope, video, evidence, query)
+        vector = _unit(query_vector) if query_vector is not None else None
+        now = time.time()
+        with self._lock:
+            self._remember(key, self._entry(video, scope, evidence, answer, vector, now))
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, video, scope, evidence, answer, vector, created, used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, video, scope, evidence, answer, vector.tobytes() if vector is not None else None, now, now),
+            )
+            self._stores += 1
+            if self._stores % PURGE_EVERY == 0:
+                self._purge(now)
+
+    def invalidate(self, videos):
+        # Makes every entry of these videos (and of unfiltered questions) stale
+        names = {video for video in videos if video}
+        if not names:
+            return
+        names.add(ANY_VIDEO)
+        now = time.time()
+        with self._lock:
+            self._drop([key for key, entry in self._lru.items() if entry["video"] in names])
+            if self._db is None:
+                self._stamps.update(dict.fromkeys(names, now))
+                return
+            marks = ",".join("?" * len(names))
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO stamps (video, stamp) VALUES (?, ?)", [(name, now) for name in names])
+                self._db.execute(f"DELETE FROM answers WHERE video IN ({marks})", list(names))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_exact + self.hits_similar
+            lookups = hits + self.misses
+            disk_rows = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] if self._db else 0
+            return {
+                "hits_exact": self.hits_exact,
+                "hits_similar": self.hits_similar,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._lru),
+                "disk_entries": disk_rows,
+            }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_cache():
+    global _cache
+
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+    return _cache
+
+
+def invalidate(videos):
+    # Called by writers after rows of these videos were written
+    if ANSWER_CACHE_ENABLED:
+        get_cache().invalidate(videos)
+
+
+def print_stats():
+    # One line for the end of a query run (nothing if the cache was not used)
+    if _cache is None:
+        return
+    stats = _cache.stats()
+    lookups = stats["hits_exact"] + stats["hits_similar"] + stats["misses"]
+    if lookups:
+        print(
+            f"Answer cache: lookups={lookups} exact={stats['hits_exact']} similar={stats['hits_similar']} "
+            f"misses={stats['misses']} stale={stats['stale']} hit_rate={stats['hit_rate']:.1%}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect or clear the answer cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entries per video")
+    clear = sub.add_parser("clear", help="Drop cached answers")
+    clear.add_argument("--video", nargs="+", help="Only these videos (default: all)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = AnswerCache()
+    if cache._db is None:
+        raise SystemExit("ANSWER_CACHE_PATH is not set; the cache only lives inside query processes")
+    if args.command == "stats":
+        rows = cache._db.execute("SELECT video, COUNT(*) FROM answers GROUP BY video ORDER BY COUNT(*) DESC").fetchall()
+        print(f"{sum(n for _, n in rows)} answers for {len(rows)} videos in {cache.path}")
+        for video, n in rows[:50]:
+            print(f"  {n:>6}  {video}")
+    elif args.video:
+        cache.invalidate(args.video)
+        print(f"Invalidated {len(args.video)} video(s)")
+    else:
+        cache.clear()
+        print("Cleared")
+
\ No newline at end of file
@@ -1,5 +1,4 @@
 import ffmpeg
-import whisper
 import os
 import librosa
 import soundfile as sf
@@ -26,7 +25,9 @@ def extract_and_transcribe(return_segments=False):
     # Extract audio from video
     ffmpeg.input(VIDEO_INPUT).output(AUDIO_OUTPUT, acodec='libmp3lame').run(overwrite_output=True, quiet=False)
 
-    # Transcribe with Whisper (speech-aware segments)
+    # Transcribe with Whisper (speech-aware segments); imported here so that
+    # importing this module does not pull in torch
+    import whisper
     model = whisper.load_model(WHISPER_MODEL)
     result = model.transcribe(
         AUDIO_OUTPUT,
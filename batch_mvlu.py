@@ -9,6 +9,7 @@ from urllib.request import urlopen
 
 import config
 import main
+import usage_tracker
 import audio_processing
 import video_processing
 
@@ -249,6 +250,7 @@ def set_pipeline_context(video_path, query_text, frame_dir, audio_out):
     config.USER_DESCRIPTION = query_text or config.USER_DESCRIPTION
     config.FRAME_DIR = frame_dir
     config.AUDIO_OUTPUT = audio_out
+    config.VECTOR_DATASET = "mvlu"
 
     # Update imported module globals (they use "from config import ...")
     main.VIDEO_INPUT = video_path
@@ -450,26 +452,30 @@ def parse_args():
 
 def main_cli():
     args = parse_args()
-    if args.hf:
-        token = os.getenv(args.hf_token_env)
-        return run_streaming(
-            args.hf_dataset,
-            args.hf_split,
-            token,
-            args.hf_config or None,
-            args.video_dir,
-            args.frames_root,
-            args.audio_root,
-            args.cache_dir,
-            args.limit,
-            args.download_urls,
-            args.hf_task,
-        )
-
-    root_dir = args.root
-    json_dir = args.json_dir or root_dir
-    video_dir = args.video_dir or resolve_default_video_dir(root_dir)
-    return run_batch(root_dir, json_dir, video_dir, args.frames_root, args.audio_root, args.limit, args.task)
+    usage_tracker.reset()
+    try:
+        if args.hf:
+            token = os.getenv(args.hf_token_env)
+            return run_streaming(
+                args.hf_dataset,
+                args.hf_split,
+                token,
+                args.hf_config or None,
+                args.video_dir,
+                args.frames_root,
+                args.audio_root,
+                args.cache_dir,
+                args.limit,
+                args.download_urls,
+                args.hf_task,
+            )
+
+        root_dir = args.root
+        json_dir = args.json_dir or root_dir
+        video_dir = args.video_dir or resolve_default_video_dir(root_dir)
+        return run_batch(root_dir, json_dir, video_dir, args.frames_root, args.audio_root, args.limit, args.task)
+    finally:
+        usage_tracker.write_report("batch_mvlu")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import clip_runtime
+
+# Parity and speed check for the CLIP runtimes in clip_runtime.py.
+#   parity: cosine between each runtime's vectors and the fp32 PyTorch
+#           reference on CPU, plus nearest-neighbour agreement
+#   speed:  per-batch latency and items/sec for text and image encoding
+
+SAMPLE_TEXTS = [
+    "A man in a dark coat walks into a dimly lit room.",
+    "Two people argue at a kitchen table while a child watches.",
+    "A crowded street market at night with neon signs.",
+    "A car speeds along a wet highway in heavy rain.",
+    "A woman reads a letter and starts to cry.",
+    "Soldiers march across a dusty field under a bright sun.",
+    "A close-up of hands typing on a laptop keyboard.",
+    "A dog runs along a beach chasing a ball.",
+    "SHORT: A police officer questions a suspect. | LONG: In a small interrogation room, an officer leans over the table.",
+    "A train pulls into a station as passengers wait on the platform.",
+    "Fireworks explode over a city skyline.",
+    "A chef chops vegetables in a busy restaurant kitchen.",
+    "A boy falls off his bicycle and scrapes his knee.",
+    "An old man feeds pigeons in a quiet park.",
+    "A crowd cheers as a singer walks onto the stage.",
+    "A helicopter lands on the roof of a tall building.",
+]
+
+
+def _load_texts(path, limit):
+    if not path:
+        return SAMPLE_TEXTS[:limit]
+    with open(path, "r", encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    return texts[:limit]
+
+
+def _load_images(frame_dir, limit):
+    if not frame_dir:
+        return []
+    paths = sorted(glob.glob(os.path.join(frame_dir, "*.jpg")) + glob.glob(os.path.join(frame_dir, "*.png")))
+    return paths[:limit]
+
+
+def _agreement(reference, candidate):
+    # Share of items whose nearest neighbour (excluding itself) is unchanged
+    if reference.shape[0] < 3:
+        return 1.0
+    ref_sims = reference @ reference.T
+    cand_sims = candidate @ candidate.T
+    ref_sims.fill_diagonal_(-2.0)
+    cand_sims.fill_diagonal_(-2.0)
+    return (ref_sims.argmax(dim=1) == cand_sims.argmax(dim=1)).float().mean().item()
+
+
+def parity(runtimes, texts, images, min_cosine):
+    reference = clip_runtime.build_encoder("torch", device="cpu")
+    ref_text = clip_runtime.encode_texts(texts, encoder=reference).float()
+    ref_image = clip_runtime.encode_images(images, encoder=reference).float() if images else None
+
+    ok = True
+    for runtime in runtimes:
+        encoder = clip_runtime.build_encoder(runtime, device="cpu")
+        results = [("text", ref_text, clip_runtime.encode_texts(texts, encoder=encoder).float())]
+        if images:
+            results.append(("image", ref_image, clip_runtime.encode_images(images, encoder=encoder).float()))
+        for modality, ref, cand in results:
+            if cand.shape != ref.shape:
+                print(f"{runtime:<18} {modality:<6} shape mismatch {tuple(cand.shape)} vs {tuple(ref.shape)}")
+                ok = False
+                continue
+            cosines = (ref * cand).sum(dim=1).tolist()
+            passed = min(cosines) >= min_cosine
+            ok = ok and passed
+            print(
+                f"{runtime:<18} {modality:<6} n={len(cosines):<4} dim={cand.shape[1]} "
+                f"cos mean={statistics.mean(cosines):.4f} min={min(cosines):.4f} "
+                f"nn-agree={_agreement(ref, cand):.2%} {'OK' if passed else 'FAIL'}"
+            )
+    return ok
+
+
+def speed(runtimes, texts, images, batch_sizes, iterations):
+    for runtime in runtimes:
+        encoder = clip_runtime.build_encoder(runtime, device="cpu")
+        for modality, items, encode in (
+            ("text", texts, clip_runtime.encode_texts),
+            ("image", images, clip_runtime.encode_images),
+        ):
+            if not items:
+                continue
+            for batch_size in batch_sizes:
+                batch = (items * (batch_size // len(items) + 1))[:batch_size]
+                encode(batch, batch_size=batch_size, encoder=encoder)  # warm-up pass
+                latencies = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    encode(batch, batch_size=batch_size, encoder=encoder)
+                    latencies.append(time.perf_counter() - start)
+                p50 = statistics.median(latencies)
+                print(
+                    f"{runtime:<18} {modality:<6} batch={batch_size:<4} "
+                    f"p50={p50 * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms "
+                    f"throughput={batch_size / p50:.1f}/s"
+                )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CLIP runtime parity and latency benchmark")
+    parser.add_argument("--mode", choices=["parity", "speed", "both"], default="both")
+    parser.add_argument("--runtimes", nargs="+", default=list(clip_runtime.RUNTIMES), choices=clip_runtime.RUNTIMES)
+    parser.add_argument("--texts-file", default="", help="One text per line (default: built-in captions)")
+    parser.add_argument("--frames", default="", help="Directory of .jpg/.png keyframes for image checks")
+    parser.add_argument("--limit", type=int, default=64, help="Max texts / images to use")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    texts = _load_texts(args.texts_file, args.limit)
+    images = _load_images(args.frames, args.limit)
+    ok = True
+    if args.mode in ("parity", "both"):
+        ok = parity(args.runtimes, texts, images, args.min_cosine)
+    if args.mode in ("speed", "both"):
+        speed(args.runtimes, texts, images, args.batch_sizes, max(1, args.iterations))
+    sys.exit(0 if ok else 1)
+
\ No newline at end of file
@@ -0,0 +1,117 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+import clip
+import torch
+
+from config import CLIP_MODEL
+from image_captioning import remote_generate_captions
+
+# Upload size / latency vs caption agreement for different keyframe payload
+# settings. Captions from the unchanged keyframe are the reference; agreement
+# is the CLIP text cosine between a setting's caption and the reference caption
+# (the same space retrieval searches in).
+
+
+def parse_settings(sides, qualities, crops):
+    settings = [{"max_side": 0, "quality": None, "center_crop": 0}] # file bytes as written, whatever CAPTION_CENTER_CROP is
+    for side in sides:
+        for quality in qualities:
+            for crop in crops:
+                settings.append({"max_side": side, "quality": quality, "center_crop": crop})
+    return settings
+
+
+def setting_label(s):
+    if not s["max_side"] and not s["center_crop"]:
+        return "original"
+    crop = f" crop={s['center_crop']}" if s["center_crop"] else ""
+    return f"side={s['max_side']} q={s['quality']}{crop}"
+
+
+def text_agreement(model, refs, outs):
+    tokens_ref = clip.tokenize(refs, truncate=True)
+    tokens_out = clip.tokenize(outs, truncate=True)
+    with torch.no_grad():
+        a = model.encode_text(tokens_ref)
+        b = model.encode_text(tokens_out)
+        a = a / a.norm(dim=-1, keepdim=True)
+        b = b / b.norm(dim=-1, keepdim=True)
+    return (a * b).sum(dim=-1).tolist()
+
+
+def run(frames, settings, output):
+    model, _ = clip.load(CLIP_MODEL, device="cpu")
+    reference = None
+    rows = []
+
+    for setting in settings:
+        options = {"max_side": setting["max_side"], "center_crop": setting["center_crop"]}
+        if setting["quality"] is not None:
+            options["quality"] = setting["quality"]
+
+        sizes, tokens, latencies, captions = [], [], [], []
+        for frame in frames:
+            info = {}
+            start = time.perf_counter()
+            captions.append(remote_generate_captions(frame, image_options=options, image_info=info))
+            latencies.append(time.perf_counter() - start)
+            sizes.append(info["bytes"])
+            tokens.append(info["est_tokens"])
+
+        if reference is None:
+            reference = captions
+        short_agree = text_agreement(model, [c[0] for c in reference], [c[0] for c in captions])
+        long_agree = text_agreement(model, [c[1] for c in reference], [c[1] for c in captions])
+
+        row = {
+            "setting": setting_label(setting),
+            **setting,
+            "frames": len(frames),
+            "avg_bytes": statistics.mean(sizes),
+            "avg_est_tokens": statistics.mean(tokens),
+            "avg_latency_sec": statistics.mean(latencies),
+            "p50_latency_sec": statistics.median(latencies),
+            "short_agreement": statistics.mean(short_agree),
+            "long_agreement": statistics.mean(long_agree),
+        }
+        rows.append(row)
+        print(
+            f"{row['setting']:<28} bytes={row['avg_bytes']:>9.0f} tokens={row['avg_est_tokens']:>6.0f} "
+            f"latency={row['avg_latency_sec']:.2f}s short_agree={row['short_agreement']:.3f} "
+            f"long_agree={row['long_agreement']:.3f}"
+        )
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Wrote {output}")
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark keyframe payload size vs caption agreement")
+    parser.add_argument("--frames", default="data/frames/*.jpg", help="Glob of keyframes to caption")
+    parser.add_argument("--limit", type=int, default=20, help="Max keyframes to use")
+    parser.add_argument("--sides", default="1024,768,512,384", help="Comma-separated max side lengths")
+    parser.add_argument("--qualities", default="85,70", help="Comma-separated JPEG qualities")
+    parser.add_argument("--crops", default="", help="Comma-separated center-crop fractions (empty = no crop)")
+    parser.add_argument("--output", default="", help="Optional JSON report path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    frames = sorted(glob.glob(args.frames))[: args.limit]
+    if not frames:
+        raise SystemExit(f"No frames match {args.frames}")
+    sides = [int(x) for x in args.sides.split(",") if x.strip()]
+    qualities = [int(x) for x in args.qualities.split(",") if x.strip()]
+    crops = [float(x) for x in args.crops.split(",") if x.strip()] or [0]
+    print(f"Benchmarking {len(frames)} frames from {os.path.dirname(frames[0]) or '.'}")
+    run(frames, parse_settings(sides, qualities, crops), args.output)
+
\ No newline at end of file
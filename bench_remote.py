@@ -0,0 +1,86 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Throughput/latency benchmark for the remote model calls. Run it against
+# mock_llm_server.py (see NEBIUS_BASE_URL / GROQ_BASE_URL in config) to
+# measure the client side offline, or against the real providers.
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def build_call(stage, image):
+    if stage == "caption":
+        from image_captioning import remote_generate_captions
+        if not image:
+            raise SystemExit("--image is required for the caption stage")
+        return lambda i: remote_generate_captions(image)
+    if stage == "causal":
+        from causal_analysis import get_causal_knowledge
+        from config import USER_DESCRIPTION
+        return lambda i: get_causal_knowledge(USER_DESCRIPTION, f"Scene {i}: a person walks into a dark room.")
+    if stage == "answer":
+        from clients import get_groq_client
+        from config import VLM_MODEL
+        from remote_calls import call_with_retry
+        return lambda i: call_with_retry(
+            "groq",
+            get_groq_client().chat.completions.create,
+            stage="answer",
+            model=VLM_MODEL,
+            messages=[{"role": "user", "content": f"Question {i}: what happens in the video?"}],
+        )
+    raise SystemExit(f"Unknown stage: {stage}")
+
+
+def run(stage, requests, concurrency, image):
+    call = build_call(stage, image)
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def timed(i):
+            t0 = time.perf_counter()
+            call(i)
+            return time.perf_counter() - t0
+
+        futures = [pool.submit(timed, i) for i in range(requests)]
+        for fut in as_completed(futures):
+            try:
+                latencies.append(fut.result())
+            except Exception as e:
+                errors += 1
+                print(f"Request failed: {e}")
+    wall = time.perf_counter() - start
+
+    print(
+        f"stage={stage} requests={requests} concurrency={concurrency} ok={len(latencies)} errors={errors} "
+        f"wall={wall:.2f}s throughput={len(latencies) / wall if wall else 0.0:.2f} req/s"
+    )
+    if latencies:
+        print(
+            f"latency mean={statistics.mean(latencies):.3f}s p50={_percentile(latencies, 50):.3f}s "
+            f"p95={_percentile(latencies, 95):.3f}s p99={_percentile(latencies, 99):.3f}s"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark remote model calls")
+    parser.add_argument("--stage", choices=["caption", "causal", "answer"], default="causal")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--image", default="", help="Keyframe used for the caption stage")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.stage, args.requests, args.concurrency, args.image)
+
\ No newline at end of file
@@ -0,0 +1,106 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Startup-time benchmark for the entry points. Every measurement runs in a
+# fresh interpreter so nothing is cached between runs. "import" is the cost
+# of importing the module; "warmup" adds the module's warmup() (CLIP, Chroma,
+# API clients), i.e. what the first request would otherwise pay.
+
+ENTRY_POINTS = [
+    "config",
+    "view_collection",
+    "manage_chroma",
+    "knowledge_base",
+    "retrieval",
+    "main",
+    "query_mvlu",
+    "query_moviechat1k",
+    "query_activitynetqa",
+    "query_vista400k",
+]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module} as mod
+imported = time.perf_counter()
+if {warmup} and hasattr(mod, "warmup"):
+    mod.warmup()
+done = time.perf_counter()
+print("STARTUP", imported - start, done - start)
+"""
+
+
+def measure(module, warmup=False):
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, warmup=warmup)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            _, import_sec, total_sec = line.split()
+            return float(import_sec), float(total_sec), None
+    error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+    return None, None, error
+
+
+def import_profile(module, top=10):
+    # Slowest imports (cumulative) from python -X importtime
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def run(modules, repeat, warmup, profile):
+    print(f"{'entry point':<22} {'import p50':>11} {'import min':>11}" + (f" {'+warmup p50':>12}" if warmup else ""))
+    for module in modules:
+        imports, totals, error = [], [], None
+        for _ in range(repeat):
+            import_sec, total_sec, error = measure(module, warmup)
+            if error:
+                break
+            imports.append(import_sec)
+            totals.append(total_sec)
+        if error:
+            print(f"{module:<22} failed: {error}")
+            continue
+        line = f"{module:<22} {statistics.median(imports):>10.3f}s {min(imports):>10.3f}s"
+        if warmup:
+            line += f" {statistics.median(totals):>11.3f}s"
+        print(line)
+        if profile:
+            for cumulative_us, name in import_profile(module):
+                print(f"    {cumulative_us / 1e6:>8.3f}s  {name}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark entry point startup time")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="Also time warmup() where the module has one")
+    parser.add_argument("--profile", action="store_true", help="Show the slowest imports per entry point")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.modules, max(1, args.repeat), args.warmup, args.profile)
+
\ No newline at end of file
@@ -0,0 +1,256 @@
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Vector store benchmark: ingest rate, query latency, recall and memory of
+# Chroma vs the flat store (flat_store.py) at several collection sizes.
+# Every (store, size) runs in a fresh interpreter on a scratch directory so
+# RSS is not shared between runs. Data is a synthetic clustered set of unit
+# vectors (CLIP-sized by default) grouped into "videos" of --video-rows rows,
+# generated in deterministic chunks so exact ground truth can be computed
+# without holding the whole set in memory.
+#
+#   chroma     Chroma PersistentClient (HNSW, settings from config)
+#   flat       flat store, float32, exact scan
+#   flat16     flat store, float16, exact scan
+#   flat_ivf   flat store, float32, IVF quantizer (sqrt(N) lists, --probes)
+
+STORES = ["chroma", "flat", "flat16", "flat_ivf"]
+CHUNK = 5000
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _rss_mb():
+    # Current resident set (Linux), else the peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _disk_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+# -- synthetic data --------------------------------------------------------
+
+def _centers(dim, seed, clusters=256):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers / np.linalg.norm(centers, axis=1, keepdims=True)
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _chunk(index, centers, seed):
+    rng = np.random.default_rng((seed, index))
+    labels = rng.integers(len(centers), size=CHUNK)
+    noise = rng.normal(size=(CHUNK, centers.shape[1])) * (0.6 / math.sqrt(centers.shape[1]))
+    return _unit(centers[labels] + noise)
+
+
+def _rows(start, stop, centers, seed):
+    parts = []
+    for index in range(start // CHUNK, (stop - 1) // CHUNK + 1):
+        chunk = _chunk(index, centers, seed)
+        lo = max(start, index * CHUNK) - index * CHUNK
+        hi = min(stop, (index + 1) * CHUNK) - index * CHUNK
+        parts.append(chunk[lo:hi])
+    return np.concatenate(parts)
+
+
+def _queries(count, centers, seed):
+    rng = np.random.default_rng((seed, 1 << 40))
+    labels = rng.integers(len(centers), size=count)
+    noise = rng.normal(size=(count, centers.shape[1])) * (0.6 / math.sqrt(centers.shape[1]))
+    return _unit(centers[labels] + noise)
+
+
+# -- child: one store, one size --------------------------------------------
+
+def _open_store(store, root, probes):
+    import vector_db
+
+    if store == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=root)
+    else:
+        import flat_store
+        flat_store.FLAT_STORE_DTYPE = "float16" if store == "flat16" else "float32"
+        flat_store.FLAT_IVF_LISTS = 0 # trained explicitly below
+        flat_store.FLAT_IVF_PROBES = probes
+        client = flat_store.FlatClient(root)
+    return client.get_or_create_collection("bench", metadata=vector_db.hnsw_metadata())
+
+
+def run_child(store, size, dim, k, queries, video_queries, video_rows, probes, seed):
+    root = tempfile.mkdtemp(prefix=f"bench_{store}_")
+    try:
+        centers = _centers(dim, seed)
+        rss_start = _rss_mb()
+        collection = _open_store(store, root, probes)
+
+        ingest_sec = 0.0
+        for start in range(0, size, CHUNK):
+            vectors = _rows(start, min(size, start + CHUNK), centers, seed)
+            ids = [str(i) for i in range(start, start + len(vectors))]
+            metas = [{"video": f"video_{i // video_rows}", "timestamp": i} for i in range(start, start + len(vectors))]
+            t = time.perf_counter()
+            collection.upsert(ids=ids, embeddings=vectors.tolist() if store == "chroma" else vectors, metadatas=metas)
+            ingest_sec += time.perf_counter() - t
+
+        train_sec = 0.0
+        if store == "flat_ivf":
+            t = time.perf_counter()
+            collection.train_ivf(max(1, int(math.sqrt(size))))
+            train_sec = time.perf_counter() - t
+        rss_ingest = _rss_mb()
+
+        # Exact ground truth, streamed over the chunks
+        query_vectors = _queries(queries, centers, seed)
+        best_sims = np.full((queries, k), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((queries, k), dtype=np.int64)
+        for start in range(0, size, CHUNK):
+            block = _rows(start, min(size, start + CHUNK), centers, seed)
+            sims = np.concatenate([best_sims, query_vectors @ block.T], axis=1)
+            ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(block)), (queries, len(block)))], axis=1)
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            best_sims = np.take_along_axis(sims, top, axis=1)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+
+        latencies, recalls = [], []
+        for q, truth in zip(query_vectors, best_ids):
+            t = time.perf_counter()
+            result = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+            latencies.append(time.perf_counter() - t)
+            recalls.append(len({int(i) for i in result["ids"][0]} & set(truth.tolist())) / k)
+
+        rng = np.random.default_rng((seed, 1 << 41))
+        videos = max(1, size // video_rows)
+        video_latencies, video_recalls = [], []
+        for v in rng.integers(videos, size=video_queries).tolist():
+            q = _queries(1, centers, seed + 1 + v)[0]
+            lo, hi = v * video_rows, min(size, (v + 1) * video_rows)
+            sims = _rows(lo, hi, centers, seed) @ q
+            truth = {lo + int(i) for i in np.argsort(-sims)[:k]}
+            t = time.perf_counter()
+            result = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[], where={"video": f"video_{v}"})
+            video_latencies.append(time.perf_counter() - t)
+            video_recalls.append(len({int(i) for i in result["ids"][0]} & truth) / min(k, len(truth)))
+
+        return {
+            "store": store,
+            "size": size,
+            "ingest_rows_per_sec": size / ingest_sec if ingest_sec else 0.0,
+            "train_sec": train_sec,
+            "query_p50_ms": _percentile(latencies, 50) * 1000,
+            "query_p99_ms": _percentile(latencies, 99) * 1000,
+            "recall": statistics.mean(recalls),
+            "video_p50_ms": _percentile(video_latencies, 50) * 1000,
+            "video_p99_ms": _percentile(video_latencies, 99) * 1000,
+            "video_recall": statistics.mean(video_recalls),
+            "rss_ingest_mb": rss_ingest - rss_start,
+            "rss_mb": _rss_mb(),
+            "peak_rss_mb": _peak_rss_mb(),
+            "disk_mb": _disk_mb(root),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# -- parent ----------------------------------------------------------------
+
+def measure(store, size, args):
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child", store, "--sizes", str(size),
+        "--dim", str(args.dim), "--k", str(args.k), "--queries", str(args.queries),
+        "--video-queries", str(args.video_queries), "--video-rows", str(args.video_rows),
+        "--probes", str(args.probes), "--seed", str(args.seed),
+    ]
+    proc = subprocess.run(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):]), None
+    return None, (proc.stderr.strip().splitlines() or ["no output"])[-1]
+
+
+def run(args):
+    print(
+        f"{'store':<9} {'rows':>8} {'ingest/s':>9} {'q p50':>8} {'q p99':>8} {'recall':>7} "
+        f"{'video p50':>10} {'video p99':>10} {'v.recall':>8} {'RSS':>8} {'disk':>8}"
+    )
+    for size in args.sizes:
+        for store in args.stores:
+            result, error = measure(store, size, args)
+            if error:
+                print(f"{store:<9} {size:>8} failed: {error}")
+                continue
+            print(
+                f"{store:<9} {size:>8} {result['ingest_rows_per_sec']:>9.0f} "
+                f"{result['query_p50_ms']:>6.2f}ms {result['query_p99_ms']:>6.2f}ms {result['recall']:>7.3f} "
+                f"{result['video_p50_ms']:>8.2f}ms {result['video_p99_ms']:>8.2f}ms {result['video_recall']:>8.3f} "
+                f"{result['rss_mb']:>6.0f}MB {result['disk_mb']:>6.0f}MB"
+                + (f"  (IVF train {result['train_sec']:.1f}s)" if result["train_sec"] else "")
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare vector stores: ingest rate, query latency, recall, RSS")
+    parser.add_argument("--stores", nargs="+", default=STORES, choices=STORES)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="Unfiltered queries")
+    parser.add_argument("--video-queries", type=int, default=200, help="Queries filtered to one video")
+    parser.add_argument("--video-rows", type=int, default=300, help="Rows per synthetic video")
+    parser.add_argument("--probes", type=int, default=16, help="IVF lists scanned per query (flat_ivf)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", choices=STORES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        result = run_child(
+            args.child, args.sizes[0], args.dim, args.k, args.queries,
+            args.video_queries, args.video_rows, args.probes, args.seed,
+        )
+        print("RESULT " + json.dumps(result))
+    else:
+        run(args)
+
\ No newline at end of file
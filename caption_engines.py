@@ -0,0 +1,145 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import usage_tracker
+from config import (
+    CAPTION_ENGINE,
+    CAPTION_BATCH_SIZE,
+    LOCAL_CAPTION_MODEL,
+    LOCAL_CAPTION_WORKERS,
+    LOCAL_CAPTION_BATCH_SIZE,
+    LOCAL_CAPTION_SHORT_TOKENS,
+    LOCAL_CAPTION_LONG_TOKENS,
+)
+
+# Captioning engines behind image_captioning.generate_captions. Every engine
+# returns (short_cap, long_cap) per keyframe.
+
+
+class CaptionEngine:
+    name = "base"
+
+    def caption(self, frame_path, image_options=None, short_only=False, long_only=False):
+        raise NotImplementedError
+
+    def caption_batch(self, frame_paths, image_options=None, short_only=False):
+        return [self.caption(p, image_options=image_options, short_only=short_only) for p in frame_paths]
+
+
+class RemoteVLMEngine(CaptionEngine):
+    # REASONING_MODEL on Nebius; CAPTION_BATCH_SIZE keyframes per request.
+    name = "remote"
+
+    def caption(self, frame_path, image_options=None, short_only=False, long_only=False):
+        from image_captioning import remote_generate_captions
+        return remote_generate_captions(frame_path, image_options, short_only, long_only=long_only)
+
+    def caption_batch(self, frame_paths, image_options=None, short_only=False):
+        from image_captioning import remote_generate_captions_batch
+        batch_size = max(1, CAPTION_BATCH_SIZE)
+        captions = []
+        for start in range(0, len(frame_paths), batch_size):
+            captions.extend(remote_generate_captions_batch(frame_paths[start:start + batch_size], image_options, short_only))
+        return captions
+
+
+class LocalCaptionEngine(CaptionEngine):
+    # Small transformers image-to-text model on CPU. Keyframes are split into
+    # mini-batches that a pool of worker threads runs through one shared model
+    # (torch releases the GIL during inference).
+    name = "local"
+
+    def __init__(self, model_name=LOCAL_CAPTION_MODEL, workers=LOCAL_CAPTION_WORKERS, batch_size=LOCAL_CAPTION_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._model = None
+        self._processor = None
+        self._pool = None
+
+    def _load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import AutoProcessor
+            try:
+                from transformers import AutoModelForImageTextToText as AutoCaptionModel
+            except ImportError:
+                from transformers import AutoModelForVision2Seq as AutoCaptionModel
+
+            print(f"-> Loading local caption model {self.model_name} ({self.workers} workers)...")
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.workers))
+            self._processor = AutoProcessor.from_pretrained(self.model_name)
+            self._model = AutoCaptionModel.from_pretrained(self.model_name).eval()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="caption")
+
+    @staticmethod
+    def _clean(text):
+        text = " ".join((text or "").split())
+        return text[:1].upper() + text[1:]
+
+    def _caption_chunk(self, frame_paths, short_only=False, long_only=False):
+        import torch
+        from PIL import Image
+
+        images = []
+        for path in frame_paths:
+            with Image.open(path) as img:
+                images.append(img.convert("RGB"))
+        inputs = self._processor(images=images, return_tensors="pt")
+        with torch.no_grad():
+            short_ids = None if long_only else self._model.generate(**inputs, max_new_tokens=LOCAL_CAPTION_SHORT_TOKENS)
+            if short_only:
+                shorts = self._processor.batch_decode(short_ids, skip_special_tokens=True)
+                return [(self._clean(s), "") for s in shorts]
+            long_ids = self._model.generate(
+                **inputs,
+                min_new_tokens=LOCAL_CAPTION_LONG_TOKENS // 2,
+                max_new_tokens=LOCAL_CAPTION_LONG_TOKENS,
+                num_beams=3,
+                no_repeat_ngram_size=3,
+                repetition_penalty=1.2,
+            )
+        shorts = [""] * len(images) if long_only else self._processor.batch_decode(short_ids, skip_special_tokens=True)
+        longs = self._processor.batch_decode(long_ids, skip_special_tokens=True)
+        return [(self._clean(s), self._clean(l)) for s, l in zip(shorts, longs)]
+
+    def caption(self, frame_path, image_options=None, short_only=False, long_only=False):
+        return self.caption_batch([frame_path], short_only=short_only, long_only=long_only)[0]
+
+    def caption_batch(self, frame_paths, image_options=None, short_only=False, long_only=False):
+        # image_options only apply to uploads; the processor resizes locally.
+        if not frame_paths:
+            return []
+        self._load()
+        chunks = [frame_paths[i:i + self.batch_size] for i in range(0, len(frame_paths), self.batch_size)]
+        with usage_tracker.track_stage("caption_local"):
+            results = list(self._pool.map(lambda chunk: self._caption_chunk(chunk, short_only, long_only), chunks))
+        return [caps for chunk in results for caps in chunk]
+
+
+ENGINES = {
+    "remote": RemoteVLMEngine,
+    "local": LocalCaptionEngine,
+}
+
+_engines_lock = threading.Lock()
+_engines = {}
+
+
+def register_engine(name, engine_cls):
+    ENGINES[name] = engine_cls
+
+
+def get_engine(name=None):
+    name = name or CAPTION_ENGINE
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            if name not in ENGINES:
+                raise ValueError(f"Unknown caption engine '{name}'. Available: {', '.join(sorted(ENGINES))}")
+            engine = ENGINES[name]()
+            _engines[name] = engine
+        return engine
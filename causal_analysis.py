@@ -1,18 +1,72 @@
 import os
-from openai import OpenAI
-from config import REASONING_MODEL, NEBIUS_API_KEY
-
-# Fixed the missing 'os' and defined the client properly
-client_nebius = OpenAI(
-    base_url ="https://api.studio.nebius.ai/v1",
-    api_key =NEBIUS_API_KEY
-)
+from config import REASONING_MODEL, CAUSAL_CHUNK_SIZE, CAUSAL_CONTEXT_SCENES
+from clients import get_nebius_client
+from indexed_blocks import split_indexed_blocks
+from remote_calls import call_with_retry
 
 def get_causal_knowledge(user_desc, captions):
     prompt = f"Context: {user_desc}\nVisuals: {captions}\nIdentify the cause and effect (CR0)."
     
-    response = client_nebius.chat.completions.create(
+    response = call_with_retry(
+        "nebius",
+        get_nebius_client().chat.completions.create,
+        stage="causal",
         model=REASONING_MODEL, 
         messages=[{"role": "user", "content": prompt}]
     )
-    return response.choices[0].message.content
\ No newline at end of file
+    return response.choices[0].message.content
+
+def _scene_line(index, caption, scene_time=None):
+    when = f" ({scene_time})" if scene_time else ""
+    return f"[{index}]{when} {caption}"
+
+def get_causal_knowledge_batch(user_desc, captions, scene_times=None, chunk_size=None):
+    # Video-level causal reasoning: scenes are sent in temporal order, chunk_size
+    # per request, and one causal string is returned per scene (aligned by index).
+    # Scenes the model skips or mangles are analysed one by one.
+    chunk_size = max(1, chunk_size or CAUSAL_CHUNK_SIZE)
+    scene_times = scene_times or [None] * len(captions)
+    results = [None] * len(captions)
+
+    for start in range(0, len(captions), chunk_size):
+        end = min(len(captions), start + chunk_size)
+        context_start = max(0, start - CAUSAL_CONTEXT_SCENES)
+        lines = [f"Context: {user_desc}"]
+        if context_start < start:
+            lines.append("Earlier scenes (context only, do not analyse):")
+            lines.extend(
+                _scene_line(f"E{i + 1}", captions[i], scene_times[i]) for i in range(context_start, start)
+            )
+        lines.append("Scenes in temporal order:")
+        lines.extend(
+            _scene_line(i - start + 1, captions[i], scene_times[i]) for i in range(start, end)
+        )
+        lines.append(
+            "For each numbered scene, identify the cause and effect (CR0), using the other scenes "
+            "as context. Return one block per scene, in order, starting with its number in "
+            "brackets, e.g. [1] ... [2] ... Do not add any other text."
+        )
+
+        try:
+            response = call_with_retry(
+                "nebius",
+                get_nebius_client().chat.completions.create,
+                stage="causal_batch",
+                model=REASONING_MODEL,
+                messages=[{"role": "user", "content": "\n".join(lines)}]
+            )
+            blocks = split_indexed_blocks(response.choices[0].message.content, end - start)
+        except Exception as e:
+            print(f"-> Batched causal analysis failed ({e}). Falling back to per-scene calls.")
+            blocks = {}
+
+        for i in range(start, end):
+            results[i] = blocks.get(i - start + 1)
+
+    missing = [i for i, text in enumerate(results) if not text]
+    if missing:
+        print(f"-> Batched causal analysis: {len(missing)}/{len(captions)} scenes unparsed, retrying individually.")
+    for i in missing:
+        results[i] = get_causal_knowledge(user_desc, captions[i])
+
+    return results
@@ -0,0 +1,126 @@
+import threading
+import httpx
+from config import (
+    NEBIUS_API_KEY,
+    NEBIUS_BASE_URL,
+    GROQ_API_KEY,
+    GROQ_BASE_URL,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP2_ENABLED,
+)
+
+# One connection pool per provider, shared by every module that talks to it.
+# httpx cannot share a pool between sync and async code, so each provider gets
+# one sync and one async pool built with the same settings.
+
+_lock = threading.Lock()
+_http_clients = {}
+_api_clients = {}
+
+
+def _http2_supported():
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _pool_settings():
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "http2": _http2_supported(),
+    }
+
+
+def get_http_client(provider, use_async=False):
+    key = (provider, "async" if use_async else "sync")
+    with _lock:
+        client = _http_clients.get(key)
+        if client is None:
+            cls = httpx.AsyncClient if use_async else httpx.Client
+            client = cls(**_pool_settings())
+            _http_clients[key] = client
+        return client
+
+
+def _get_api_client(key, build):
+    with _lock:
+        client = _api_clients.get(key)
+    if client is not None:
+        return client
+    client = build()
+    with _lock:
+        return _api_clients.setdefault(key, client)
+
+
+def _require_key(name, value):
+    if not value:
+        raise ValueError(f"❌ {name} is missing! Please create a .env file in this folder with: {name}=your_key_here")
+    return value
+
+
+# Retries are handled by remote_calls.call_with_retry, so SDK retries are off.
+# Clients are built on first use; a missing API key fails here, not at import.
+
+def get_nebius_client():
+    from openai import OpenAI
+    return _get_api_client(("nebius", "sync"), lambda: OpenAI(
+        base_url=NEBIUS_BASE_URL,
+        api_key=_require_key("NEBIUS_API_KEY", NEBIUS_API_KEY),
+        http_client=get_http_client("nebius"),
+        max_retries=0,
+    ))
+
+
+def get_async_nebius_client():
+    from openai import AsyncOpenAI
+    return _get_api_client(("nebius", "async"), lambda: AsyncOpenAI(
+        base_url=NEBIUS_BASE_URL,
+        api_key=_require_key("NEBIUS_API_KEY", NEBIUS_API_KEY),
+        http_client=get_http_client("nebius", use_async=True),
+        max_retries=0,
+    ))
+
+
+def get_groq_client():
+    from groq import Groq
+    return _get_api_client(("groq", "sync"), lambda: Groq(
+        base_url=GROQ_BASE_URL,
+        api_key=_require_key("GROQ_API_KEY", GROQ_API_KEY),
+        http_client=get_http_client("groq"),
+        max_retries=0,
+    ))
+
+
+def get_async_groq_client():
+    from groq import AsyncGroq
+    return _get_api_client(("groq", "async"), lambda: AsyncGroq(
+        base_url=GROQ_BASE_URL,
+        api_key=_require_key("GROQ_API_KEY", GROQ_API_KEY),
+        http_client=get_http_client("groq", use_async=True),
+        max_retries=0,
+    ))
+
+
+def close_clients():
+    # Async pools must be closed with "await client.aclose()" by their owner.
+    with _lock:
+        for (provider, kind), client in list(_http_clients.items()):
+            if kind == "sync":
+                client.close()
+                del _http_clients[(provider, kind)]
+        for key in [k for k in _api_clients if k[1] == "sync"]:
+            del _api_clients[key]
+
\ No newline at end of file
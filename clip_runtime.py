@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import embedding_cache
+from config import CLIP_MODEL, CLIP_RUNTIME, CLIP_NUM_THREADS, CLIP_EXPORT_DIR, EMBED_BATCH_SIZE, EMBED_CACHE_ENABLED
+
+# CLIP is loaded once per process, on first use, and shared by ingest
+# (knowledge_base) and query (retrieval) code. torch and clip are imported
+# lazily so that modules which never embed anything start fast.
+#
+# CLIP_RUNTIME picks the encoder:
+#   "torch"            - clip.load() as-is (fp32 on CPU, fp16 on GPU)
+#   "torchscript_int8" - text/image towers with int8 dynamic-quantized Linear
+#                        layers, traced to TorchScript (CPU)
+#   "onnx_int8"        - the towers exported to ONNX and int8-quantized with
+#                        onnxruntime (CPU)
+# The exported runtimes are built once into CLIP_EXPORT_DIR and reloaded from
+# there; every runtime returns the same 512-dim vectors, normalized below.
+
+RUNTIMES = ("torch", "torchscript_int8", "onnx_int8")
+
+_lock = threading.Lock()
+_loaded = False
+model = None
+preprocess = None
+device = None
+
+
+def _export_paths(runtime):
+    base = os.path.join(CLIP_EXPORT_DIR, CLIP_MODEL.replace("/", "-").replace("@", "-"))
+    ext = "pt" if runtime == "torchscript_int8" else "onnx"
+    return f"{base}_text_int8.{ext}", f"{base}_image_int8.{ext}", f"{base}_{ext}_meta.json"
+
+
+def _towers(clip_model):
+    import torch
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, tokens):
+            return self.m.encode_text(tokens)
+
+    class ImageTower(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, pixels):
+            return self.m.encode_image(pixels)
+
+    return TextTower(clip_model).eval(), ImageTower(clip_model).eval()
+
+
+def _export(runtime, text_path, image_path, meta_path):
+    import clip
+    import torch
+
+    print(f"-> Exporting CLIP {CLIP_MODEL} ({runtime}) to {CLIP_EXPORT_DIR}...")
+    clip_model, _ = clip.load(CLIP_MODEL, device="cpu", jit=False)
+    clip_model = clip_model.float().eval()
+    resolution = clip_model.visual.input_resolution
+    text_tower, image_tower = _towers(clip_model)
+    examples = [
+        (text_tower, clip.tokenize(["a video frame", "a person walks into a dark room"]), "tokens", text_path),
+        (image_tower, torch.randn(2, 3, resolution, resolution), "pixels", image_path),
+    ]
+    os.makedirs(CLIP_EXPORT_DIR, exist_ok=True)
+
+    with torch.no_grad():
+        for tower, example, input_name, path in examples:
+            if runtime == "torchscript_int8":
+                quantized = torch.ao.quantization.quantize_dynamic(tower, {torch.nn.Linear}, dtype=torch.qint8)
+                torch.jit.save(torch.jit.trace(quantized, example, check_trace=False), path)
+            else:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                fp32_path = path.replace("_int8.onnx", "_fp32.onnx")
+                torch.onnx.export(
+                    tower,
+                    (example,),
+                    fp32_path,
+                    input_names=[input_name],
+                    output_names=["features"],
+                    dynamic_axes={input_name: {0: "batch"}, "features": {0: "batch"}},
+                    opset_version=17,
+                )
+                quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+
+    # Written last: a missing meta file means the export is incomplete
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"model": CLIP_MODEL, "runtime": runtime, "input_resolution": resolution}, f)
+
+
+class _ScriptedCLIP:
+    def __init__(self, text_path, image_path):
+        import torch
+        self.text = torch.jit.load(text_path, map_location="cpu").eval()
+        self.image = torch.jit.load(image_path, map_location="cpu").eval()
+
+    def encode_text(self, tokens):
+        return self.text(tokens)
+
+    def encode_image(self, pixels):
+        return self.image(pixels)
+
+
+class _OnnxCLIP:
+    def __init__(self, text_path, image_path, threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ["CPUExecutionProvider"]
+        self.text = ort.InferenceSession(text_path, options, providers=providers)
+        self.image = ort.InferenceSession(image_path, options, providers=providers)
+
+    def encode_text(self, tokens):
+        import torch
+        return torch.from_numpy(self.text.run(None, {"tokens": tokens.cpu().numpy()})[0])
+
+    def encode_image(self, pixels):
+        import torch
+        return torch.from_numpy(self.image.run(None, {"pixels": pixels.cpu().numpy()})[0])
+
+
+def build_encoder(runtime=None, device=None):
+    # Returns (model, preprocess, device); model has encode_text / encode_image.
+    # Not cached: use load() for the shared instance.
+    import clip
+    import torch
+
+    runtime = runtime or CLIP_RUNTIME
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown CLIP_RUNTIME '{runtime}'. Available: {', '.join(RUNTIMES)}")
+    if CLIP_NUM_THREADS:
+        torch.set_num_threads(CLIP_NUM_THREADS)
+
+    if runtime == "torch":
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        clip_model, clip_preprocess = clip.load(CLIP_MODEL, device=device)
+        return clip_model, clip_preprocess, device
+
+    text_path, image_path, meta_path = _export_paths(runtime)
+    if not all(os.path.exists(p) for p in (text_path, image_path, meta_path)):
+        _export(runtime, text_path, image_path, meta_path)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    from clip.clip import _transform  # the preprocessing clip.load() returns
+    clip_preprocess = _transform(meta["input_resolution"])
+    if runtime == "torchscript_int8":
+        encoder = _ScriptedCLIP(text_path, image_path)
+    else:
+        encoder = _OnnxCLIP(text_path, image_path, CLIP_NUM_THREADS)
+    return encoder, clip_preprocess, "cpu"
+
+
+def load():
+    global _loaded, model, preprocess, device
+
+    if _loaded:
+        return model, preprocess, device
+
+    with _lock:
+        if not _loaded:
+            print(f"-> Loading CLIP {CLIP_MODEL} ({CLIP_RUNTIME})...")
+            model, preprocess, device = build_encoder(CLIP_RUNTIME)
+            _loaded = True
+    return model, preprocess, device
+
+
+def _cached_encode(items, digests, modality, encode):
+    # Look every item up in the embedding cache and encode only the misses
+    # (each distinct input once). Returns a CPU float32 tensor.
+    import numpy as np
+    import torch
+
+    if not items:
+        return torch.empty(0)
+    cache = embedding_cache.get_cache()
+    model_id = f"{CLIP_MODEL}:{CLIP_RUNTIME}"
+    keys = [embedding_cache.cache_key(model_id, modality, d) for d in digests]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+    pending = {}
+    for i, key in enumerate(keys):
+        if key not in found and key not in pending:
+            pending[key] = items[i]
+    if pending:
+        features = encode(list(pending.values())).float().cpu().numpy()
+        fresh = dict(zip(pending, features))
+        cache.put_many(fresh)
+        found.update(fresh)
+    return torch.from_numpy(np.stack([found[key] for key in keys]))
+
+
+def encode_texts(texts, batch_size=None, encoder=None):
+    # CLIP text features for many strings, normalized. Goes through the
+    # embedding cache unless a specific encoder is given.
+    if encoder is None and EMBED_CACHE_ENABLED:
+        digests = [embedding_cache.text_digest(t) for t in texts]
+        return _cached_encode(texts, digests, "text", lambda todo: _encode_texts(todo, batch_size))
+    return _encode_texts(texts, batch_size, encoder)
+
+
+def encode_images(paths, batch_size=None, encoder=None):
+    # CLIP image features for many frames, normalized; cached by file content
+    if encoder is None and EMBED_CACHE_ENABLED:
+        digests = [embedding_cache.file_digest(p) for p in paths]
+        return _cached_encode(paths, digests, "image", lambda todo: _encode_images(todo, batch_size))
+    return _encode_images(paths, batch_size, encoder)
+
+
+def _encode_texts(texts, batch_size=None, encoder=None):
+    # CLIP text features for many strings, normalized, in mini-batches.
+    # encoder: a build_encoder() result; defaults to the shared instance.
+    import clip
+    import torch
+
+    model, _, device = encoder or load()
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            tokens = clip.tokenize(texts[start:start + batch_size], truncate=True).to(device)
+            features = model.encode_text(tokens)
+            chunks.append(features / features.norm(dim=-1, keepdim=True))
+    return torch.cat(chunks) if chunks else torch.empty(0)
+
+
+def _encode_images(paths, batch_size=None, encoder=None):
+    # CLIP image features for many frames, normalized, in mini-batches
+    import torch
+    from PIL import Image
+
+    model, preprocess, device = encoder or load()
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(paths), batch_size):
+            images = []
+            for path in paths[start:start + batch_size]:
+                with Image.open(path) as img:
+                    images.append(preprocess(img))
+            features = model.encode_image(torch.stack(images).to(device))
+            chunks.append(features / features.norm(dim=-1, keepdim=True))
+    return torch.cat(chunks) if chunks else torch.empty(0)
+
\ No newline at end of file
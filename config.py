@@ -16,6 +16,25 @@ DATASET_NAME = "TIGER-Lab/VISTA-400K"
 
 # Model Configs
 CLIP_MODEL = "ViT-B/16" # 512-dim
+CLIP_RUNTIME = "torch" # "torch" = fp32 PyTorch (GPU if available), "torchscript_int8" / "onnx_int8" = CPU int8 export
+CLIP_NUM_THREADS = 0 # CPU threads for CLIP inference (0 = library default)
+CLIP_EXPORT_DIR = "data/clip_export" # exported/quantized encoders are written here on first use
+EMBED_BATCH_SIZE = 32 # frames/texts per CLIP forward pass at ingest
+CHROMA_UPSERT_BATCH = 1000 # rows per Chroma upsert call
+# HNSW settings for new Chroma collections (existing ones keep theirs; use
+# tune_hnsw.py to pick values for a collection size)
+HNSW_SPACE = "cosine" # stored CLIP vectors are unit-normalized: "cosine" / "ip" (Chroma default is "l2")
+HNSW_M = 16 # graph degree: higher = better recall, more memory
+HNSW_CONSTRUCTION_EF = 200 # build-time candidate list
+HNSW_SEARCH_EF = 64 # query-time candidate list (>= n_results)
+EMBED_CACHE_ENABLED = True # reuse CLIP vectors for identical texts / image files (see embedding_cache.py)
+EMBED_CACHE_DIR = "data/embed_cache" # on-disk tier (None = in-process LRU only)
+EMBED_CACHE_LRU_SIZE = 20000 # vectors kept in memory
+WRITE_BUFFER_ENABLED = True # queue Chroma upserts and write them from a background thread (see write_buffer.py)
+WRITE_BUFFER_MAX_ROWS = 2000 # flush once this many rows are pending
+WRITE_BUFFER_FLUSH_INTERVAL = 5.0 # seconds; smaller batches are flushed after this long
+WRITE_BUFFER_JOURNAL_DIR = "data/write_journal" # pending rows are journaled here until written (None = no journal)
+WRITE_BUFFER_FSYNC = False # fsync every journal append (survives power loss, slower)
 WHISPER_MODEL = "medium"
 REASONING_MODEL = "Qwen/Qwen2.5-VL-72B-Instruct" # DeepSeek V3.2 logic
 VLM_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct" # Groq
@@ -23,9 +42,112 @@ VLM_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct" # Groq
 #VL_MODEL = "Qwen/Qwen2.5-VL-72B-Instruct"
 USER_DESCRIPTION = "A video showing a movie schene"
 
+# Captioning
+CAPTION_ENGINE = "remote" # "remote" = REASONING_MODEL on Nebius, "local" = LOCAL_CAPTION_MODEL on CPU
+CAPTION_BATCH_SIZE = 1 # keyframes packed per VLM request (1 = one image per request)
+CAPTION_IMAGE_MAX_SIDE = 0 # longest side in px before upload (0 = send the keyframe unchanged)
+CAPTION_JPEG_QUALITY = 85 # used when the keyframe is re-encoded
+CAPTION_CENTER_CROP = None # keep this central fraction of the frame, e.g. 0.9 (None = no crop)
+VLM_TOKEN_PATCH = 28 # px per image token side, for payload token estimates
+LOCAL_CAPTION_MODEL = "Salesforce/blip-image-captioning-base" # any transformers image-to-text model
+LOCAL_CAPTION_WORKERS = 2 # inference threads sharing the CPU cores
+LOCAL_CAPTION_BATCH_SIZE = 8 # keyframes per forward pass
+LOCAL_CAPTION_SHORT_TOKENS = 24
+LOCAL_CAPTION_LONG_TOKENS = 96
+
+# Ingest tier: "full" = SHORT + LONG captions and causal text at ingest,
+# "lazy" = SHORT caption + image only; LONG and causal are generated on first retrieval hit
+INGEST_TIER = "full"
+LAZY_ENRICH_ON_RETRIEVAL = True # enrich "short" tier frames when they are retrieved
+LAZY_ENRICH_ENGINE = "remote" # caption engine used for on-demand LONG captions
+LAZY_ENRICH_CACHE_SIZE = 10000 # enriched frame documents kept per query process (LRU)
+
+# Causal reasoning
+CAUSAL_MODE = "frame" # "frame" = one request per keyframe, "video" = all scenes of a video in chunked requests
+CAUSAL_CHUNK_SIZE = 12 # scenes per request in "video" mode
+CAUSAL_CONTEXT_SCENES = 2 # preceding scenes repeated as context at the start of each chunk
+
+# Remote model calls (rate limit, retry, circuit breaker)
+REMOTE_RATE_LIMITS = {
+    "nebius": {"rpm": 60, "burst": 10},
+    "groq": {"rpm": 30, "burst": 5},
+}
+RATE_LIMIT_STATE_PATH = "data/rate_limiter.sqlite" # shared by all worker processes; None = per-process
+REMOTE_MAX_RETRIES = 5
+REMOTE_BACKOFF_BASE = 1.0 # seconds, doubled per attempt (with jitter)
+REMOTE_BACKOFF_MAX = 30.0
+REMOTE_REQUEST_TIMEOUT = 120.0 # per attempt
+REMOTE_DEADLINE = 300.0 # per call, across all retries
+CIRCUIT_FAILURE_THRESHOLD = 5 # consecutive failures before the circuit opens
+CIRCUIT_RESET_TIMEOUT = 60.0
+
+# Shared HTTP connection pools (one per provider, see clients.py)
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE = 16
+HTTP_KEEPALIVE_EXPIRY = 60.0 # seconds an idle connection is kept open
+HTTP_CONNECT_TIMEOUT = 10.0
+HTTP_READ_TIMEOUT = 120.0
+HTTP2_ENABLED = True # used only when the h2 package is installed
+
+# Usage accounting (see usage_tracker.py)
+USAGE_REPORT_DIR = "data/reports"
+USAGE_REPORT_PER_VIDEO = True # write a report at the end of every run_ingestion_pipeline
+# USD per 1M tokens, e.g. {"Qwen/Qwen2.5-VL-72B-Instruct": {"prompt": 0.13, "completion": 0.40}}
+MODEL_PRICES_PER_MTOK = {}
+
+# Frame retrieval. Image and text vectors are stored in separate collections
+# (vector_db.py) and fused at query time, so weights can change without
+# re-embedding. "fused" searches the averaged (text+image)/2 vectors instead.
+RETRIEVAL_FUSION = "late" # "late" or "fused"
+RETRIEVAL_TEXT_WEIGHT = 0.5 # 1.0 / 0.0 = text-only search
+RETRIEVAL_IMAGE_WEIGHT = 0.5 # 1.0 / 0.0 = image-only search
+RETRIEVAL_CANDIDATES = 5 # frames fetched per collection before fusion
+STORE_FUSED_FRAME_VECTORS = RETRIEVAL_FUSION == "fused" # also write the averaged vector (video_frames_v1); only "fused" mode reads it
+RAG_BATCH_SIZE = 32 # questions per query_video_rag_batch call in the query_* runners
+RAG_ANSWER_WORKERS = 8 # concurrent enrichment + answer calls per batch
+RETRIEVAL_IO_WORKERS = 8 # threads for concurrent vector searches and frame image reads
+ANSWER_CACHE_ENABLED = False # reuse answers to repeated questions (see answer_cache.py); keep off for evaluation runs
+ANSWER_CACHE_PATH = "data/answer_cache.sqlite" # shared by all processes; None = in-process only
+ANSWER_CACHE_MAX_ENTRIES = 20000 # LRU bound (memory and disk)
+ANSWER_CACHE_TTL_SEC = 7 * 24 * 3600 # 0 = answers never expire
+ANSWER_CACHE_SIMILARITY = 0.0 # >0: also reuse the answer of a question with the same video and evidence whose CLIP vector is this similar (e.g. 0.95)
+ANSWER_CACHE_VERSION = 1 # part of every cache key; bump to drop all cached answers
+
+# MovieChat-1K breakpoint questions: "time" is a frame index, converted with
+# the annotation's info.fps (else MOVIECHAT_FPS) and searched in a window
+MOVIECHAT_FPS = 30.0 # fallback when an annotation has no info.fps
+MOVIECHAT_TIME_WINDOW_SEC = 20.0 # search [t - w, t + w] around the breakpoint; 0 = whole video
+
+# Collection sharding (see shard_router.py; migrate_shards.py moves existing data)
+VECTOR_SHARDS = 1 # hash shards per collection, by video name (1 = no hash sharding)
+VECTOR_SHARD_BY_DATASET = False # one set of collections per dataset (VECTOR_DATASET)
+VECTOR_DATASET = "" # dataset label written at ingest; the ingest_* / batch_* runners set it
+SHARD_REGISTRY_PATH = "data/shard_registry.sqlite" # video -> dataset, used to route queries
+
+# Vector search backend (vector_backends.py). "memory" answers per-video
+# queries with an exact matmul over the video's rows instead of HNSW.
+VECTOR_BACKEND = "chroma" # "chroma" or "memory"
+VECTOR_MEMORY_MAX_VIDEOS = 256 # per-video matrices kept in memory (LRU)
+VECTOR_NPY_DIR = "data/vector_npy" # per-video .npz snapshots shared between processes (None = in memory only)
+
+# Vector store behind vector_db.py: "chroma" (DB_PATH) or "flat", the local
+# memory-mapped store in flat_store.py (bench_vector_stores.py compares them)
+VECTOR_STORE = "chroma"
+FLAT_STORE_DIR = "data/flat_store"
+FLAT_STORE_DTYPE = "float32" # "float16" halves disk and page cache but full scans are slower; set before the first write
+FLAT_IVF_LISTS = 0 # IVF coarse quantizer lists (0 = always exact)
+FLAT_IVF_PROBES = 8 # lists scanned per IVF query
+FLAT_IVF_TRAIN_MIN = 50000 # rows a collection needs before the quantizer is trained
+
+# Provider endpoints (point both at mock_llm_server.py for offline benchmarks)
+NEBIUS_BASE_URL = os.getenv("NEBIUS_BASE_URL", "https://api.studio.nebius.ai/v1")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None # None = Groq SDK default
+
+# Keys are checked when a client is first created (clients.py), so tools that
+# never call a provider (view_collection, manage_chroma, ...) run without them.
 NEBIUS_API_KEY = os.getenv("NEBIUS_API_KEY")
 if not NEBIUS_API_KEY:
-    raise ValueError("❌ NEBIUS_API_KEY is missing! Please create a .env file in this folder with: NEBIUS_API_KEY=your_key_here")
+    print("⚠️ Warning: NEBIUS_API_KEY is missing. Captioning and causal analysis will fail.")
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
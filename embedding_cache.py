@@ -0,0 +1,205 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import EMBED_CACHE_DIR, EMBED_CACHE_LRU_SIZE
+
+# Content-addressed cache for CLIP vectors, keyed by (model, modality, sha256
+# of the input: the text, or the image file bytes).
+#   tier 1: in-process LRU (OrderedDict of float32 rows)
+#   tier 2: on disk, a memory-mapped float32 matrix (vectors.f32) plus a
+#           SQLite key -> row index (index.sqlite). Rows are appended; the
+#           file grows in GROW_ROWS steps. Several processes can share it:
+#           row allocation happens inside a SQLite write transaction and a
+#           key only becomes visible once its row has been written.
+
+GROW_ROWS = 16384
+SQL_CHUNK = 500 # keys per IN (...) query, below SQLite's host-parameter limit
+
+
+def text_digest(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(model, modality, digest):
+    return f"{model}|{modality}|{digest}"
+
+
+def _key_rows(db, keys):
+    # (key, row) pairs of the keys present in the index, SQL_CHUNK keys per query
+    for start in range(0, len(keys), SQL_CHUNK):
+        chunk = keys[start:start + SQL_CHUNK]
+        marks = ",".join("?" * len(chunk))
+        yield from db.execute(f"SELECT key, row FROM keys WHERE key IN ({marks})", chunk).fetchall()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=EMBED_CACHE_DIR, lru_size=EMBED_CACHE_LRU_SIZE):
+        self.cache_dir = cache_dir
+        self.lru_size = max(0, lru_size)
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._db = None
+        self._matrix = None
+        self._capacity = 0
+        self._dim = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row:
+                self._dim = row[0]
+
+    # -- disk tier ---------------------------------------------------------
+
+    def _vectors_path(self):
+        return os.path.join(self.cache_dir, "vectors.f32")
+
+    def _map(self, min_rows=0):
+        # (Re)map the matrix, growing the file to hold at least min_rows rows
+        import numpy as np
+
+        path = self._vectors_path()
+        row_bytes = self._dim * 4
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        rows = size // row_bytes
+        if rows < min_rows:
+            rows = (min_rows // GROW_ROWS + 1) * GROW_ROWS
+            with open(path, "ab") as f:
+                f.truncate(rows * row_bytes)
+        if rows == 0:
+            self._matrix, self._capacity = None, 0
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+        self._capacity = rows
+
+    def _disk_get(self, keys):
+        found = {}
+        if self._db is None or not keys:
+            return found
+        if self._dim is None:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if not row:
+                return found
+            self._dim = row[0]
+        for key, row in _key_rows(self._db, keys):
+            if row >= self._capacity:
+                self._map()  # another process grew the file
+            if row < self._capacity:
+                found[key] = self._matrix[row].copy()
+        return found
+
+    def _disk_put(self, items):
+        if self._db is None or not items:
+            return
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._dim is None:
+                row = db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+                self._dim = row[0] if row else len(next(iter(items.values())))
+                db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (self._dim,))
+            existing = {k for k, _ in _key_rows(db, list(items))}
+            new_items = [(k, v) for k, v in items.items() if k not in existing and len(v) == self._dim]
+            if new_items:
+                next_row = db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM keys").fetchone()[0]
+                self._map(next_row + len(new_items))
+                for offset, (_, vector) in enumerate(new_items):
+                    self._matrix[next_row + offset] = vector
+                self._matrix.flush()
+                db.executemany(
+                    "INSERT INTO keys (key, row) VALUES (?, ?)",
+                    [(k, next_row + offset) for offset, (k, _) in enumerate(new_items)],
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    # -- memory tier -------------------------------------------------------
+
+    def _remember(self, key, vector):
+        if not self.lru_size:
+            return
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    # -- public ------------------------------------------------------------
+
+    def get_many(self, keys):
+        # Returns {key: float32 vector} for the keys that are cached
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+                    self.hits_memory += 1
+                else:
+                    missing.append(key)
+            if missing:
+                from_disk = self._disk_get(missing)
+                for key, vector in from_disk.items():
+                    self._remember(key, vector)
+                found.update(from_disk)
+                self.hits_disk += len(from_disk)
+                self.misses += len(missing) - len(from_disk)
+        return found
+
+    def put_many(self, items):
+        # items: {key: float32 vector}
+        if not items:
+            return
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            self._disk_put(items)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            disk_rows = self._db.execute("SELECT COUNT(*) FROM keys").fetchone()[0] if self._db else 0
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "memory_entries": len(self._lru),
+                "disk_entries": disk_rows,
+            }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_cache():
+    global _cache
+
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
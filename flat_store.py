@@ -0,0 +1,535 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from config import FLAT_STORE_DIR, FLAT_STORE_DTYPE, FLAT_IVF_LISTS, FLAT_IVF_PROBES, FLAT_IVF_TRAIN_MIN
+
+# Local vector store with the subset of the Chroma client/collection API the
+# rest of the code uses (vector_db.py picks it with VECTOR_STORE = "flat").
+#
+# One directory per collection:
+#   vectors_00000.f32 ...  append-only memory-mapped shards of SHARD_ROWS rows
+#                          (float32, or float16 with FLAT_STORE_DTYPE)
+#   meta.sqlite            rows(row, id, video, list, live, metadata, document)
+#                          plus info (dim, dtype, space, next row, version)
+#   centroids.npy          optional IVF coarse quantizer
+# Upserting an existing id tombstones its old row and appends a new one;
+# delete() only tombstones. Row allocation happens inside a SQLite write
+# transaction, so several processes can append to the same collection.
+#
+# Search is exact (chunked matmul over the shards) unless the collection has
+# an IVF quantizer (FLAT_IVF_LISTS > 0, trained once FLAT_IVF_TRAIN_MIN rows
+# exist, or with "python flat_store.py train"): then only the FLAT_IVF_PROBES
+# nearest lists are scanned. Queries with a where filter score exactly the
+# rows that match it (the common per-video case).
+
+SHARD_ROWS = 65536
+SCAN_CHUNK = 16384
+_DTYPES = {"float32": (np.float32, "f32"), "float16": (np.float16, "f16")}
+_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where):
+    # Chroma-style metadata filter -> (SQL condition, params)
+    clauses, params = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(w) for w in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(p[0] for p in parts) + ")")
+            for _, p in parts:
+                params.extend(p)
+            continue
+        if key == "video":
+            column, column_params = "video", []
+        else:
+            column, column_params = "json_extract(metadata, ?)", [f'$."{key}"']
+        op, value = ("$eq", cond) if not isinstance(cond, dict) else next(iter(cond.items()))
+        if op in ("$in", "$nin"):
+            marks = ",".join("?" * len(value)) or "NULL"
+            clauses.append(f"{column} {'IN' if op == '$in' else 'NOT IN'} ({marks})")
+            params.extend(column_params + list(value))
+        elif op in _OPS:
+            clauses.append(f"{column} {_OPS[op]} ?")
+            params.extend(column_params + [value])
+        else:
+            raise ValueError(f"Unsupported where operator '{op}'")
+    return " AND ".join(clauses) or "1", params
+
+
+class _State:
+    # Per-process view of the row table: which rows are live and their IVF list
+    def __init__(self, version, live, lists):
+        self.version = version
+        self.live = live
+        self.lists = lists
+        self._inverted = None
+
+    def inverted(self):
+        # Rows sorted by IVF list and their list numbers (searchsorted gives a
+        # list's slice); built on the first IVF query after a change
+        if self._inverted is None:
+            order = np.argsort(self.lists, kind="stable")
+            keys = self.lists[order]
+            self._inverted = (order, keys)
+        return self._inverted
+
+
+class FlatCollection:
+    def __init__(self, path, name, metadata=None):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._state = None
+        self._centroids = None
+        self._centroids_mtime = None
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "meta.sqlite"), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT NOT NULL, video TEXT, "
+            "list INTEGER NOT NULL DEFAULT -1, live INTEGER NOT NULL DEFAULT 1, metadata TEXT, document TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rows_live_id ON rows(id) WHERE live = 1")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rows_live_video ON rows(video) WHERE live = 1")
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "INSERT OR IGNORE INTO info (name, value) VALUES ('metadata', ?)", (json.dumps(metadata or {}),)
+        )
+        self._db.execute("INSERT OR IGNORE INTO info (name, value) VALUES ('dtype', ?)", (FLAT_STORE_DTYPE,))
+        self.metadata = json.loads(self._info("metadata"))
+        self.space = self.metadata.get("hnsw:space", "l2")
+        self.dtype, self._suffix = _DTYPES[self._info("dtype")]
+        dim = self._info("dim")
+        self.dim = int(dim) if dim is not None else None
+
+    # -- storage -----------------------------------------------------------
+
+    def _info(self, name, default=None):
+        row = self._db.execute("SELECT value FROM info WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_info(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO info (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def _shard(self, k, create=False):
+        mm = self._shards.get(k)
+        if mm is not None:
+            return mm
+        path = os.path.join(self.path, f"vectors_{k:05d}.{self._suffix}")
+        size = SHARD_ROWS * self.dim * np.dtype(self.dtype).itemsize
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            if not create:
+                return None
+            with open(path, "ab") as f:
+                f.truncate(size)
+        mm = np.memmap(path, dtype=self.dtype, mode="r+", shape=(SHARD_ROWS, self.dim))
+        self._shards[k] = mm
+        return mm
+
+    def _gather(self, rows):
+        # float32 vectors of the given row numbers
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int64)
+        shards = rows // SHARD_ROWS
+        for k in np.unique(shards):
+            mask = shards == k
+            out[mask] = self._shard(int(k))[rows[mask] % SHARD_ROWS]
+        return out
+
+    def _prepare(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if self.space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+        return vectors
+
+    # -- state / IVF -------------------------------------------------------
+
+    def _load_state(self):
+        version = int(self._info("version", 0))
+        if self._state is not None and self._state.version == version:
+            return self._state
+        self._db.execute("BEGIN") # one snapshot of info and rows
+        try:
+            version = int(self._info("version", 0))
+            total = int(self._info("rows", 0))
+            data = self._db.execute("SELECT row, live, list FROM rows").fetchall()
+        finally:
+            self._db.execute("COMMIT")
+        live = np.zeros(total, dtype=bool)
+        lists = np.full(total, -1, dtype=np.int32)
+        if data:
+            arr = np.asarray(data, dtype=np.int64)
+            live[arr[:, 0]] = arr[:, 1] > 0
+            lists[arr[:, 0]] = arr[:, 2]
+        if self.dim is None and self._info("dim") is not None:
+            self.dim = int(self._info("dim")) # first rows written by another process
+        self._state = _State(version, live, lists)
+        self._load_centroids()
+        return self._state
+
+    def _centroids_path(self):
+        return os.path.join(self.path, "centroids.npy")
+
+    def _load_centroids(self):
+        path = self._centroids_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._centroids, self._centroids_mtime = None, None
+            return
+        if mtime != self._centroids_mtime:
+            self._centroids, self._centroids_mtime = np.load(path), mtime
+
+    def _similarity(self, vectors, query):
+        # Higher is closer: dot product, or -squared l2 for "l2"
+        sims = vectors @ query
+        if self.space == "l2":
+            sims = 2 * sims - np.einsum("ij,ij->i", vectors, vectors) - float(query @ query)
+        return sims
+
+    def _distance(self, sims):
+        if self.space == "l2":
+            return -sims
+        return 1.0 - sims
+
+    def _assign(self, vectors):
+        if self._centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SCAN_CHUNK):
+            chunk = vectors[start:start + SCAN_CHUNK]
+            if self.space == "l2":
+                scores = 2 * chunk @ self._centroids.T - np.einsum("ij,ij->i", self._centroids, self._centroids)
+            else:
+                scores = chunk @ self._centroids.T
+            lists[start:start + len(chunk)] = np.argmax(scores, axis=1)
+        return lists
+
+    def train_ivf(self, n_lists=FLAT_IVF_LISTS, iterations=10, sample=None, seed=0):
+        # k-means over a sample of live rows, then (re)assign every row
+        with self._lock:
+            state = self._load_state()
+            rows = np.flatnonzero(state.live)
+            if len(rows) < n_lists:
+                raise ValueError(f"{self.name}: {len(rows)} rows is too few for {n_lists} IVF lists")
+            rng = np.random.default_rng(seed)
+            sample = min(len(rows), sample or 64 * n_lists)
+            points = self._gather(np.sort(rng.choice(rows, size=sample, replace=False)))
+            centroids = points[rng.choice(len(points), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                self._centroids = centroids
+                labels = self._assign(points)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, points)
+                counts = np.bincount(labels, minlength=n_lists)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+                if self.space != "l2":
+                    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            self._centroids = centroids
+
+            tmp = self._centroids_path() + f".tmp{os.getpid()}"
+            with open(tmp, "wb") as f:
+                np.save(f, centroids)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                updates = []
+                for start in range(0, len(rows), SHARD_ROWS):
+                    chunk = rows[start:start + SHARD_ROWS]
+                    updates.extend(zip(self._assign(self._gather(chunk)).tolist(), chunk.tolist()))
+                self._db.executemany("UPDATE rows SET list = ? WHERE row = ?", updates)
+                os.replace(tmp, self._centroids_path())
+                self._set_info("version", int(self._info("version", 0)) + 1)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._state = None
+            self._centroids_mtime = None
+            self._load_state()
+            return n_lists
+
+    # -- writes ------------------------------------------------------------
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        latest = {row_id: i for i, row_id in enumerate(ids)} # later duplicates win
+        order = sorted(latest.values())
+        vectors = self._prepare(embeddings)[order]
+        ids = [ids[i] for i in order]
+        metadatas = [(metadatas[i] if metadatas is not None else None) or {} for i in order]
+        documents = [documents[i] if documents is not None else None for i in order]
+
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    dim = self._info("dim")
+                    self.dim = int(dim) if dim is not None else vectors.shape[1]
+                    self._set_info("dim", self.dim)
+                if vectors.shape[1] != self.dim:
+                    raise ValueError(f"{self.name}: embedding dimension {vectors.shape[1]} != {self.dim}")
+                self._load_centroids()
+                old = []
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    old += [r for (r,) in db.execute(f"SELECT row FROM rows WHERE live = 1 AND id IN ({marks})", chunk)]
+                if old:
+                    db.executemany("UPDATE rows SET live = 0 WHERE row = ?", [(r,) for r in old])
+
+                first = int(self._info("rows", 0))
+                start = 0
+                while start < len(vectors):
+                    k, offset = divmod(first + start, SHARD_ROWS)
+                    count = min(SHARD_ROWS - offset, len(vectors) - start)
+                    self._shard(k, create=True)[offset:offset + count] = vectors[start:start + count]
+                    start += count
+                for mm in self._shards.values():
+                    mm.flush()
+                lists = self._assign(vectors)
+                db.executemany(
+                    "INSERT INTO rows (row, id, video, list, live, metadata, document) VALUES (?, ?, ?, ?, 1, ?, ?)",
+                    [
+                        (first + i, row_id, metadatas[i].get("video"), int(lists[i]), json.dumps(metadatas[i], default=_json_default), documents[i])
+                        for i, row_id in enumerate(ids)
+                    ],
+                )
+                self._set_info("rows", first + len(ids))
+                version = int(self._info("version", 0))
+                self._set_info("version", version + 1)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+            # Keep this process's view current without re-reading the table
+            state = self._state
+            if state is not None and state.version == version and len(state.live) == first:
+                state.live = np.concatenate([state.live, np.ones(len(ids), dtype=bool)])
+                state.live[old] = False
+                state.lists = np.concatenate([state.lists, lists])
+                state.version = version + 1
+                state._inverted = None
+            live_rows = int(db.execute("SELECT COUNT(*) FROM rows WHERE live = 1").fetchone()[0]) if FLAT_IVF_LISTS else 0
+
+        if FLAT_IVF_LISTS and self._centroids is None and live_rows >= max(FLAT_IVF_TRAIN_MIN, FLAT_IVF_LISTS):
+            print(f"-> Training IVF quantizer for {self.name} ({FLAT_IVF_LISTS} lists over {live_rows} rows)...")
+            self.train_ivf(FLAT_IVF_LISTS)
+
+    add = upsert
+
+    def delete(self, ids=None, where=None):
+        if ids is None and not where:
+            raise ValueError("delete() needs ids or a where filter")
+        with self._lock:
+            condition, params = self._filter(ids, where)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(f"UPDATE rows SET live = 0 WHERE {condition}", params)
+                self._set_info("version", int(self._info("version", 0)) + 1)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # -- reads -------------------------------------------------------------
+
+    @staticmethod
+    def _filter(ids=None, where=None):
+        condition, params = "live = 1", []
+        if ids is not None:
+            condition += f" AND id IN ({','.join('?' * len(ids)) or 'NULL'})"
+            params += list(ids)
+        if where:
+            sql, where_params = _where_sql(where)
+            condition += f" AND ({sql})"
+            params += where_params
+        return condition, params
+
+    def _rows_info(self, rows, include):
+        # {row: (id, metadata, document)} for the rows that will be returned
+        found = {}
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for row, row_id, meta, doc in self._db.execute(
+                f"SELECT row, id, metadata, document FROM rows WHERE row IN ({marks})", chunk
+            ):
+                found[row] = (row_id, json.loads(meta) if "metadatas" in include else None, doc)
+        return found
+
+    def _result(self, rows, include):
+        info = self._rows_info(rows, include)
+        rows = [r for r in rows if r in info]
+        result = {"ids": [info[r][0] for r in rows]}
+        if "metadatas" in include:
+            result["metadatas"] = [info[r][1] for r in rows]
+        if "documents" in include:
+            result["documents"] = [info[r][2] for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self._gather(rows) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+    def count(self):
+        return int(self._db.execute("SELECT COUNT(*) FROM rows WHERE live = 1").fetchone()[0])
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        include = list(include if include is not None else ["metadatas", "documents"])
+        condition, params = self._filter(ids, where)
+        sql = f"SELECT row FROM rows WHERE {condition} ORDER BY row"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset or 0]
+        with self._lock:
+            rows = [r for (r,) in self._db.execute(sql, params)]
+            return self._result(rows, include)
+
+    def _candidates(self, query, where, state):
+        # Row numbers to score, or None for a full scan
+        if where:
+            condition, params = self._filter(None, where)
+            return np.asarray([r for (r,) in self._db.execute(f"SELECT row FROM rows WHERE {condition}", params)], dtype=np.int64)
+        if self._centroids is None:
+            return None
+        if self.space == "l2":
+            scores = 2 * self._centroids @ query - np.einsum("ij,ij->i", self._centroids, self._centroids)
+        else:
+            scores = self._centroids @ query
+        probes = np.argsort(-scores)[:max(1, FLAT_IVF_PROBES)].tolist() + [-1] # -1: rows not assigned yet
+        order, keys = state.inverted()
+        parts = []
+        for p in probes:
+            lo, hi = np.searchsorted(keys, p, "left"), np.searchsorted(keys, p, "right")
+            parts.append(order[lo:hi])
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return rows[state.live[rows]]
+
+    def _scan(self, query, state):
+        # Exact scores of every row (dead rows get -inf)
+        total = len(state.live)
+        sims = np.full(total, -np.inf, dtype=np.float32)
+        for k in range((total + SHARD_ROWS - 1) // SHARD_ROWS):
+            mm = self._shard(k)
+            if mm is None:
+                continue
+            end = min(SHARD_ROWS, total - k * SHARD_ROWS)
+            for start in range(0, end, SCAN_CHUNK):
+                stop = min(end, start + SCAN_CHUNK)
+                block = np.asarray(mm[start:stop], dtype=np.float32)
+                sims[k * SHARD_ROWS + start:k * SHARD_ROWS + stop] = self._similarity(block, query)
+        sims[~state.live] = -np.inf
+        return sims
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None):
+        include = list(include if include is not None else ["metadatas", "documents", "distances"])
+        fields = [key for key in include if key != "distances"]
+        result = {key: [] for key in ["ids"] + include}
+        with self._lock:
+            state = self._load_state()
+            for query in self._prepare(query_embeddings):
+                rows, dists = [], []
+                if self.dim is not None and state.live.any():
+                    candidates = self._candidates(query, where, state)
+                    if candidates is None:
+                        sims = self._scan(query, state)
+                        valid = int(state.live.sum())
+                        pool = np.arange(len(sims))
+                    else:
+                        sims = self._similarity(self._gather(candidates), query) if len(candidates) else np.zeros(0, dtype=np.float32)
+                        valid = len(candidates)
+                        pool = candidates
+                    k = min(n_results, valid)
+                    if k > 0:
+                        top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+                        top = top[np.argsort(-sims[top], kind="stable")]
+                        rows = pool[top].tolist()
+                        dists = self._distance(sims[top]).tolist()
+                part = self._result(rows, fields)
+                result["ids"].append(part["ids"])
+                for key in fields:
+                    result[key].append(part[key])
+                if "distances" in include:
+                    result["distances"].append([float(d) for d in dists])
+        return result
+
+
+def _json_default(value):
+    # numpy scalars in metadata
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class FlatClient:
+    # Drop-in for the chromadb client calls made by vector_db / shard_router
+    def __init__(self, root=FLAT_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._collections = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self._path(name), "meta.sqlite"))
+        )
+
+    def get_or_create_collection(self, name, metadata=None):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FlatCollection(self._path(name), name, metadata)
+            return self._collections[name]
+
+    def create_collection(self, name, metadata=None):
+        if name in self.list_collections():
+            raise ValueError(f"Collection '{name}' already exists")
+        return self.get_or_create_collection(name, metadata)
+
+    def get_collection(self, name):
+        if name not in self.list_collections():
+            raise ValueError(f"Collection '{name}' does not exist")
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection._db.close()
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintenance for the flat vector store")
+    parser.add_argument("command", choices=["stats", "train"])
+    parser.add_argument("--collection", nargs="*", help="Collections (default: all)")
+    parser.add_argument("--lists", type=int, default=FLAT_IVF_LISTS or 256, help="IVF lists for 'train'")
+    parser.add_argument("--root", default=FLAT_STORE_DIR)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = FlatClient(args.root)
+    for name in args.collection or client.list_collections():
+        collection = client.get_collection(name)
+        if args.command == "train":
+            collection.train_ivf(args.lists)
+        total = int(collection._info("rows", 0))
+        collection._load_state()
+        ivf = f"{len(collection._centroids)} lists" if collection._centroids is not None else "none"
+        print(f"{name}: {collection.count()} live / {total} stored rows, dim={collection.dim}, dtype={np.dtype(collection.dtype).name}, space={collection.space}, ivf={ivf}")
+
\ No newline at end of file
@@ -1,54 +1,217 @@
+import io
 import os
+import math
 import base64
-from openai import OpenAI
-from config import REASONING_MODEL, NEBIUS_API_KEY
+from PIL import Image
+from config import (
+    REASONING_MODEL,
+    CAPTION_IMAGE_MAX_SIDE,
+    CAPTION_JPEG_QUALITY,
+    CAPTION_CENTER_CROP,
+    VLM_TOKEN_PATCH,
+)
+from clients import get_nebius_client
+from caption_engines import get_engine
+from remote_calls import call_with_retry
+from indexed_blocks import split_indexed_blocks
+
+CAPTION_PROMPT = (
+    "Describe this video frame. Provide two levels of detail:\n"
+    "1. SHORT: A 10-20 word summary.\n"
+    "2. LONG: A 60-70 word descriptive paragraph.\n"
+    "Return only the labels SHORT: and LONG: followed by the text."
+)
 
-# Initialize Nebius Client
-client_nebius = OpenAI(
-    base_url="https://api.studio.nebius.ai/v1",
-    api_key=NEBIUS_API_KEY
+SHORT_CAPTION_PROMPT = (
+    "Describe this video frame in a 10-20 word summary.\n"
+    "Return only the label SHORT: followed by the text."
+)
+
+LONG_CAPTION_PROMPT = (
+    "Describe this video frame in a 60-70 word descriptive paragraph.\n"
+    "Return only the label LONG: followed by the text."
+)
+
+BATCH_CAPTION_PROMPT = (
+    "You are given {count} keyframes from the same video, labelled IMAGE 1 to IMAGE {count} in order.\n"
+    "Describe each frame on its own. For every image provide two levels of detail:\n"
+    "1. SHORT: A 10-20 word summary.\n"
+    "2. LONG: A 60-70 word descriptive paragraph.\n"
+    "Return one block per image, in order, using exactly this format:\n"
+    "[1]\nSHORT: ...\nLONG: ...\n[2]\nSHORT: ...\nLONG: ...\n"
+    "Do not add any other text."
+)
+
+BATCH_SHORT_CAPTION_PROMPT = (
+    "You are given {count} keyframes from the same video, labelled IMAGE 1 to IMAGE {count} in order.\n"
+    "Describe each frame on its own in a 10-20 word summary.\n"
+    "Return one block per image, in order, using exactly this format:\n"
+    "[1]\nSHORT: ...\n[2]\nSHORT: ...\n"
+    "Do not add any other text."
 )
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
-def generate_captions(frame_path):
-    base64_image = encode_image(frame_path)
-    
-    # We use Qwen2-VL or similar vision model on Nebius
-    response = client_nebius.chat.completions.create(
+def estimate_image_tokens(width, height, patch=VLM_TOKEN_PATCH):
+    # Qwen2.5-VL style: one token per patch x patch pixel block
+    return math.ceil(width / patch) * math.ceil(height / patch)
+
+def prepare_image(image_path, max_side=None, quality=None, center_crop=None):
+    # Shrink a keyframe before upload. Returns (base64_jpeg, info) where info has
+    # the bytes sent, final size and an image-token estimate.
+    max_side = CAPTION_IMAGE_MAX_SIDE if max_side is None else max_side
+    quality = CAPTION_JPEG_QUALITY if quality is None else quality
+    center_crop = CAPTION_CENTER_CROP if center_crop is None else center_crop
+
+    if not max_side and not center_crop:
+        # Nothing to change: send the file as written by cv2.imwrite
+        with open(image_path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    else:
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            if center_crop and 0 < center_crop < 1:
+                w, h = img.size
+                cw, ch = int(w * center_crop), int(h * center_crop)
+                left, top = (w - cw) // 2, (h - ch) // 2
+                img = img.crop((left, top, left + cw, top + ch))
+            if max_side and max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.BICUBIC)
+            width, height = img.size
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality, optimize=True)
+            data = buf.getvalue()
+
+    info = {
+        "bytes": len(data),
+        "width": width,
+        "height": height,
+        "est_tokens": estimate_image_tokens(width, height),
+    }
+    return base64.b64encode(data).decode("utf-8"), info
+
+def _image_content(frame_path, image_options=None, image_info=None):
+    base64_image, info = prepare_image(frame_path, **(image_options or {}))
+    if image_info is not None:
+        image_info.update(info)
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+    }
+
+def parse_caption(raw_text):
+    # Parsing logic to separate Short and Long captions
+    try:
+        short_cap = raw_text.split("SHORT:")[1].split("LONG:")[0].strip()
+        long_cap = raw_text.split("LONG:")[1].strip()
+    except IndexError:
+        # Fallback if the model doesn't follow formatting perfectly
+        short_cap = raw_text[:50]
+        long_cap = raw_text
+
+    return short_cap, long_cap
+
+def parse_short_caption(raw_text):
+    # SHORT-only responses (lazy ingest tier); long caption is left empty
+    text = raw_text.split("SHORT:", 1)[1] if "SHORT:" in raw_text else raw_text
+    return text.split("LONG:")[0].strip(), ""
+
+def parse_long_caption(raw_text):
+    # LONG-only responses (lazy enrichment keeps the stored SHORT caption)
+    text = raw_text.split("LONG:", 1)[1] if "LONG:" in raw_text else raw_text
+    return "", text.strip()
+
+def _clean_label_text(text):
+    return text.strip().strip("*").strip()
+
+def _parse_batch_captions(raw_text, count, short_only=False):
+    # Returns a list with (short, long) per image, or None where the block is unusable.
+    parsed = [None] * count
+    for idx, block in split_indexed_blocks(raw_text, count).items():
+        if "SHORT:" not in block or ("LONG:" not in block and not short_only):
+            continue
+        short_cap = _clean_label_text(block.split("SHORT:")[1].split("LONG:")[0])
+        long_cap = "" if short_only else _clean_label_text(block.split("LONG:")[1])
+        if short_cap and (long_cap or short_only):
+            parsed[idx - 1] = (short_cap, long_cap)
+    return parsed
+
+def remote_generate_captions(frame_path, image_options=None, short_only=False, image_info=None, long_only=False):
+    # We use Qwen2-VL or similar vision model on Nebius. If an image_info dict
+    # is given it receives prepare_image's info for the uploaded frame.
+    if short_only:
+        prompt, parse = SHORT_CAPTION_PROMPT, parse_short_caption
+    elif long_only:
+        prompt, parse = LONG_CAPTION_PROMPT, parse_long_caption
+    else:
+        prompt, parse = CAPTION_PROMPT, parse_caption
+    response = call_with_retry(
+        "nebius",
+        get_nebius_client().chat.completions.create,
+        stage="caption",
         model=REASONING_MODEL, # Using the Qwen VL model defined in config
         messages=[
             {
                 "role": "user",
                 "content": [
-                    {
-                        "type": "text", 
-                        "text": "Describe this video frame. Provide two levels of detail:\n"
-                                "1. SHORT: A 10-20 word summary.\n"
-                                "2. LONG: A 60-70 word descriptive paragraph.\n"
-                                "Return only the labels SHORT: and LONG: followed by the text."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                    },
+                    {"type": "text", "text": prompt},
+                    _image_content(frame_path, image_options, image_info),
                 ],
             }
         ],
-        max_tokens=300
+        max_tokens=60 if short_only else 300
     )
-    
-    raw_text = response.choices[0].message.content
-    
-    # Parsing logic to separate Short and Long captions
+
+    return parse(response.choices[0].message.content)
+
+def remote_generate_captions_batch(frame_paths, image_options=None, short_only=False):
+    # Caption several keyframes of the same video in one request.
+    # Frames whose block cannot be parsed are re-captioned one by one.
+    frame_paths = list(frame_paths)
+    if not frame_paths:
+        return []
+    if len(frame_paths) == 1:
+        return [remote_generate_captions(frame_paths[0], image_options, short_only)]
+
+    prompt = BATCH_SHORT_CAPTION_PROMPT if short_only else BATCH_CAPTION_PROMPT
+    content = [{"type": "text", "text": prompt.format(count=len(frame_paths))}]
+    for i, frame_path in enumerate(frame_paths, start=1):
+        content.append({"type": "text", "text": f"IMAGE {i}:"})
+        content.append(_image_content(frame_path, image_options))
+
     try:
-        short_cap = raw_text.split("SHORT:")[1].split("LONG:")[0].strip()
-        long_cap = raw_text.split("LONG:")[1].strip()
-    except IndexError:
-        # Fallback if the model doesn't follow formatting perfectly
-        short_cap = raw_text[:50]
-        long_cap = raw_text
-        
-    return short_cap, long_cap
\ No newline at end of file
+        response = call_with_retry(
+            "nebius",
+            get_nebius_client().chat.completions.create,
+            stage="caption_batch",
+            model=REASONING_MODEL,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=(60 if short_only else 300) * len(frame_paths)
+        )
+        parsed = _parse_batch_captions(response.choices[0].message.content, len(frame_paths), short_only)
+    except Exception as e:
+        print(f"-> Batched captioning failed ({e}). Falling back to single-image calls.")
+        parsed = [None] * len(frame_paths)
+
+    missing = [i for i, caps in enumerate(parsed) if caps is None]
+    if missing and len(missing) < len(frame_paths):
+        print(f"-> Batched captioning: {len(missing)}/{len(frame_paths)} frames unparsed, retrying individually.")
+    for i in missing:
+        parsed[i] = remote_generate_captions(frame_paths[i], image_options, short_only)
+
+    return parsed
+
+def generate_captions(frame_path, image_options=None, engine=None, short_only=False, long_only=False):
+    # Caption one keyframe with the configured engine (CAPTION_ENGINE) -> (short, long).
+    # short_only skips the LONG caption (long is returned as ""), long_only the SHORT one.
+    return get_engine(engine).caption(frame_path, image_options=image_options, short_only=short_only, long_only=long_only)
+
+def generate_captions_batch(frame_paths, image_options=None, engine=None, short_only=False):
+    # Caption all keyframes of a video; the engine decides how to batch them.
+    return get_engine(engine).caption_batch(list(frame_paths), image_options=image_options, short_only=short_only)
+
+
\ No newline at end of file
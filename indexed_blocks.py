@@ -0,0 +1,30 @@
+import re
+
+# Parser for numbered multi-item responses ("[1] ... [2] ..."), shared by
+# batched captioning (image_captioning.py) and batched causal analysis
+# (causal_analysis.py).
+
+# Matches block headers such as "[2]", "[Image 2]", "IMAGE 2:", "**Image 2**" or
+# "### Image 2". The unbracketed forms must be alone on their line, so a
+# caption line such as "Image 2 shows..." is not taken for a header.
+_BLOCK_HEADER = re.compile(
+    r"^[\s#*>-]*(?:\[\s*(?:image\s*)?(\d+)\s*\][\s*:.)-]*|image\s*(\d+)[ \t*:.)-]*$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def split_indexed_blocks(raw_text, count):
+    # Split a "[1] ... [2] ..." style response into {index: block_text}.
+    # Only indices 1..count are kept; the first occurrence of an index wins.
+    blocks = {}
+    matches = list(_BLOCK_HEADER.finditer(raw_text or ""))
+    for pos, match in enumerate(matches):
+        idx = int(match.group(1) or match.group(2))
+        if idx < 1 or idx > count or idx in blocks:
+            continue
+        end = matches[pos + 1].start() if pos + 1 < len(matches) else len(raw_text)
+        body = raw_text[match.end():end].strip()
+        if body:
+            blocks[idx] = body
+    return blocks
+
\ No newline at end of file
@@ -200,6 +200,7 @@ def set_pipeline_context(video_path, query_text, frame_dir, audio_out):
     config.USER_DESCRIPTION = query_text or config.USER_DESCRIPTION
     config.FRAME_DIR = frame_dir
     config.AUDIO_OUTPUT = audio_out
+    config.VECTOR_DATASET = "moviechat1k"
 
     ingest_main.VIDEO_INPUT = video_path
     ingest_main.USER_DESCRIPTION = query_text or ingest_main.USER_DESCRIPTION
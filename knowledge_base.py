@@ -1,25 +1,51 @@
-import clip
-import chromadb
-import torch
 import os
-from config import DB_PATH, CLIP_MODEL
-from PIL import Image
+import threading
+import answer_cache
+import clip_runtime
+import shard_router
+import vector_backends
+import vector_db
+import write_buffer
+from config import STORE_FUSED_FRAME_VECTORS, WRITE_BUFFER_ENABLED
 
-# Load model globally to avoid reloading in loops
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load(CLIP_MODEL, device=device)
+# CLIP and the Chroma collections are opened on first use (clip_runtime,
+# vector_db); call warmup() to load them ahead of the first store call.
+# Rows are written to the video's shard of each collection (shard_router).
 
-# Initialize Chroma Client globally to prevent re-opening connection in loops
-client = chromadb.PersistentClient(path=DB_PATH)
-col = client.get_or_create_collection("video_frames_v1")
-audio_col = client.get_or_create_collection("audio_segments_v1")
+def warmup(background=False):
+    if background:
+        thread = threading.Thread(target=warmup, name="kb-warmup", daemon=True)
+        thread.start()
+        return thread
+    clip_runtime.load()
+    vector_db.get_client()
+    if WRITE_BUFFER_ENABLED:
+        write_buffer.get_buffer()
 
-def store_audio_segments(segments, video_filename=None):
+def _upsert(base, video_filename, ids, embeddings, metadatas, documents=None, invalidate_answers=True):
+    # Queued in the write-behind buffer (written in large batches from a
+    # background thread) unless WRITE_BUFFER_ENABLED is off. invalidate_answers
+    # is False for lazy enrichment write-backs, which only fill in a frame's
+    # LONG/CAUSAL text and keep the video's cached answers.
+    collection_name = shard_router.shard_name(base, video_filename or "")
+    shard_router.register_video(video_filename)
+    if WRITE_BUFFER_ENABLED:
+        write_buffer.get_buffer().add(collection_name, ids, embeddings, metadatas, documents, invalidate_answers)
+    else:
+        # Sequence-stamped like buffered writes, so an older journal replay
+        # cannot overwrite these rows
+        seq = write_buffer.next_seq()
+        metadatas = [{**(m or {}), write_buffer.WRITE_SEQ_KEY: seq} for m in metadatas]
+        vector_db.upsert(collection_name, ids, embeddings, metadatas, documents)
+        vector_backends.invalidate(collection_name, [video_filename or ""])
+        if invalidate_answers:
+            answer_cache.invalidate([video_filename or ""])
+
+def store_audio_segments(segments, video_filename=None, batch_size=None):
     if not segments:
         return
 
     ids = []
-    embeddings = []
     metadatas = []
     documents = []
 
@@ -31,15 +57,8 @@ def store_audio_segments(segments, video_filename=None):
 
         formatted = text
 
-        text_token = clip.tokenize([formatted], truncate=True).to(device)
-        with torch.no_grad():
-            text_features = model.encode_text(text_token)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            vector = text_features.cpu().numpy().tolist()[0]
-
         vid = (video_filename or "unknown").replace(" ", "_")
         ids.append(f"audio_{vid}_{i:06d}")
-        embeddings.append(vector)
         metadatas.append({
             "start": start,
             "end": end,
@@ -48,48 +67,73 @@ def store_audio_segments(segments, video_filename=None):
         })
         documents.append(formatted)
 
-    audio_col.upsert(
-        ids=ids,
-        embeddings=embeddings,
-        metadatas=metadatas,
-        documents=documents
-    )
+    embeddings = clip_runtime.encode_texts(documents, batch_size).cpu().numpy().tolist()
+    _upsert(vector_db.AUDIO_COLLECTION, video_filename, ids, embeddings, metadatas, documents)
 
-def store_frame_embedding(short_cap, long_cap, causal_text, timestamp, frame_path, scene_start, scene_end, scene_duration, video_filename=None):
+def frame_document(short_cap, long_cap, causal_text, tier="full"):
+    # "short" tier frames (lazy ingest) only carry the SHORT caption until enriched
+    if tier == "short":
+        return f"SHORT: {short_cap}"
+    return f"SHORT: {short_cap} | LONG: {long_cap} | CAUSAL: {causal_text}"
+
+def store_frame_embeddings_batch(frames, video_filename=None, batch_size=None, invalidate_answers=True):
+    # frames: list of dicts with the store_frame_embedding arguments
+    # (short_cap, long_cap, causal_text, timestamp, frame_path, scene_start,
+    # scene_end, scene_duration, optional tier / user_desc).
+    if not frames:
+        return
+
     # 1-4. Text Components: Time, Short, Long, Causal
     # (Transcript is kept in metadata but excluded from embedding per request)
-    text_content = f"SHORT: {short_cap} | LONG: {long_cap} | CAUSAL: {causal_text}"
-    
-    # 5. Actual Frame Embedding (Visual)
-    image = preprocess(Image.open(frame_path)).unsqueeze(0).to(device)
-    
-    with torch.no_grad():
-        # Compute Text Embedding
-        text_token = clip.tokenize([text_content], truncate=True).to(device)
-        text_features = model.encode_text(text_token)
-        
-        # Compute Image Embedding
-        image_features = model.encode_image(image)
-        
-        # Fusion: Normalize and Average both vectors
-        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-        image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-        
-        fused_vector = (text_features + image_features) / 2.0
-        fused_vector = fused_vector / fused_vector.norm(dim=-1, keepdim=True)
-        
-        vector = fused_vector.cpu().numpy().tolist()[0]
-    
+    documents = [
+        frame_document(f["short_cap"], f["long_cap"], f["causal_text"], f.get("tier", "full"))
+        for f in frames
+    ]
+
+    # 5. Text + Visual embeddings, mini-batched over the whole video
+    text_features = clip_runtime.encode_texts(documents, batch_size)
+    image_features = clip_runtime.encode_images([f["frame_path"] for f in frames], batch_size)
+
     vid = (video_filename or "unknown").replace(" ", "_")
-    col.upsert(
-        ids=[f"frame_{vid}_{timestamp}"],
-        embeddings=[vector],
-        metadatas=[{
-            "timestamp": timestamp,
-            "scene_start": scene_start,
-            "scene_end": scene_end,
-            "scene_duration": scene_duration,
+    ids = []
+    metadatas = []
+    for f in frames:
+        metadata = {
+            "timestamp": f["timestamp"],
+            "scene_start": f["scene_start"],
+            "scene_end": f["scene_end"],
+            "scene_duration": f["scene_duration"],
             "video": video_filename or "",
-        }],
-        documents=[text_content]
-    )
+            "frame_path": f["frame_path"],
+            "tier": f.get("tier", "full"),
+            "short_caption": f["short_cap"],
+        }
+        if f.get("user_desc"):
+            metadata["user_desc"] = f["user_desc"]
+        ids.append(f"frame_{vid}_{f['timestamp']}")
+        metadatas.append(metadata)
+
+    # Text and image vectors go to their own collections (same ids) and are
+    # fused at query time; see RETRIEVAL_FUSION in config.
+    _upsert(vector_db.FRAME_TEXT_COLLECTION, video_filename, ids, text_features.cpu().numpy().tolist(), metadatas, documents, invalidate_answers)
+    _upsert(vector_db.FRAME_IMAGE_COLLECTION, video_filename, ids, image_features.cpu().numpy().tolist(), metadatas, None, invalidate_answers)
+
+    if STORE_FUSED_FRAME_VECTORS:
+        # Fusion: Average the normalized vectors and re-normalize
+        fused = (text_features + image_features) / 2.0
+        fused = fused / fused.norm(dim=-1, keepdim=True)
+        _upsert(vector_db.FRAME_COLLECTION, video_filename, ids, fused.cpu().numpy().tolist(), metadatas, documents, invalidate_answers)
+
+def store_frame_embedding(short_cap, long_cap, causal_text, timestamp, frame_path, scene_start, scene_end, scene_duration, video_filename=None, tier="full", user_desc=None, invalidate_answers=True):
+    store_frame_embeddings_batch([{
+        "short_cap": short_cap,
+        "long_cap": long_cap,
+        "causal_text": causal_text,
+        "timestamp": timestamp,
+        "frame_path": frame_path,
+        "scene_start": scene_start,
+        "scene_end": scene_end,
+        "scene_duration": scene_duration,
+        "tier": tier,
+        "user_desc": user_desc,
+    }], video_filename=video_filename, invalidate_answers=invalidate_answers)
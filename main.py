@@ -1,57 +1,91 @@
 import os
+import sys
 import time
-from config import VIDEO_INPUT, USER_DESCRIPTION
+import usage_tracker
+from config import VIDEO_INPUT, USER_DESCRIPTION, CAUSAL_MODE, INGEST_TIER, USAGE_REPORT_PER_VIDEO
 from audio_processing import extract_and_transcribe
 from video_processing import extract_keyframes
-from image_captioning import generate_captions
-from causal_analysis import get_causal_knowledge
-from knowledge_base import store_frame_embedding, store_audio_segments
+from image_captioning import generate_captions_batch
+from causal_analysis import get_causal_knowledge, get_causal_knowledge_batch
+from knowledge_base import store_frame_embeddings_batch, store_audio_segments, warmup
 
 def run_ingestion_pipeline():
     print("--- Starting Phase 1: Ingestion & Pre-processing ---")
     start_time = time.time()
+    video_name = os.path.basename(VIDEO_INPUT)
+    usage_tracker.set_video(video_name)
 
     # 1. Audio Processing
-    audio_result = extract_and_transcribe(return_segments=True)
+    with usage_tracker.track_stage("transcribe"):
+        audio_result = extract_and_transcribe(return_segments=True)
     transcript = audio_result["text"]
     audio_segments = audio_result.get("segments", [])
     print(f"Transcript generated: {transcript[:50]}...")
     if audio_segments:
         print(f"Generated {len(audio_segments)} audio segments.")
-        store_audio_segments(audio_segments, video_filename=os.path.basename(VIDEO_INPUT))
+        with usage_tracker.track_stage("audio_store"):
+            store_audio_segments(audio_segments, video_filename=video_name)
 
     # 2. Visual Extraction
-    frames_info = extract_keyframes() # returns list of dicts with path + timestamps
+    with usage_tracker.track_stage("keyframes"):
+        frames_info = extract_keyframes() # returns list of dicts with path + timestamps
     print(f"Extracted {len(frames_info)} keyframes.")
 
     print("\n--- Starting Phase 2: Reasoning & Fusion ---")
-    for frame in frames_info:
+    # 3. Multi-Level Captioning (CAPTION_ENGINE: remote VLM or local CPU model)
+    # Lazy tier: SHORT only; LONG + causal are produced on first retrieval hit.
+    lazy = INGEST_TIER == "lazy"
+    captions = generate_captions_batch([f["path"] for f in frames_info], short_only=lazy)
+
+    # 4. Causal Reasoning Module ("video" mode: all scenes in a few chunked requests)
+    causal_texts = None
+    if lazy:
+        causal_texts = [""] * len(frames_info)
+    elif CAUSAL_MODE == "video":
+        causal_texts = get_causal_knowledge_batch(
+            USER_DESCRIPTION,
+            [f"{short_cap}. {long_cap}" for short_cap, long_cap in captions],
+            scene_times=[f"{f['start_time']:.2f}-{f['end_time']:.2f}s" for f in frames_info],
+        )
+
+    records = []
+    for idx, frame in enumerate(frames_info):
         frame_path = frame["path"]
         timestamp = os.path.basename(frame_path).split('.')[0]
-        scene_times = f"{frame['start_time']:.2f}-{frame['end_time']:.2f}s"
-        
-        # 3. Multi-Level Captioning (VLM)
-        short_cap, long_cap = generate_captions(frame_path)
-        
-        # 4. Causal Reasoning Module
-        causal_text = get_causal_knowledge(USER_DESCRIPTION, f"{short_cap}. {long_cap}")
-        
-        # 5. Fusion & Vector Storage
-        store_frame_embedding(
-            short_cap,
-            long_cap,
-            causal_text,
-            timestamp,
-            frame_path,
-            frame["start_time"],
-            frame["end_time"],
-            frame["duration"],
-            video_filename=os.path.basename(VIDEO_INPUT)
-        )
-        print(f"Stored frame at {timestamp} (scene {scene_times}, duration {frame['duration']:.2f}s)")
+        short_cap, long_cap = captions[idx]
+
+        if causal_texts is not None:
+            causal_text = causal_texts[idx]
+        else:
+            causal_text = get_causal_knowledge(USER_DESCRIPTION, f"{short_cap}. {long_cap}")
+
+        records.append({
+            "short_cap": short_cap,
+            "long_cap": long_cap,
+            "causal_text": causal_text,
+            "timestamp": timestamp,
+            "frame_path": frame_path,
+            "scene_start": frame["start_time"],
+            "scene_end": frame["end_time"],
+            "scene_duration": frame["duration"],
+            "tier": "short" if lazy else "full",
+            "user_desc": USER_DESCRIPTION,
+        })
+
+    # 5. Fusion & Vector Storage (batched CLIP encoding, one bulk upsert per collection)
+    with usage_tracker.track_stage("embed_store"):
+        store_frame_embeddings_batch(records, video_filename=video_name)
+    for frame, record in zip(frames_info, records):
+        scene_times = f"{frame['start_time']:.2f}-{frame['end_time']:.2f}s"
+        print(f"Stored frame at {record['timestamp']} (scene {scene_times}, duration {frame['duration']:.2f}s)")
 
     total_time = time.time() - start_time
     print(f"\nPipeline execution finished in {total_time:.2f} seconds.")
+    if USAGE_REPORT_PER_VIDEO:
+        usage_tracker.write_report(os.path.splitext(video_name)[0], video=video_name)
 
 if __name__ == "__main__":
+    if "--warmup" in sys.argv[1:]:
+        # Load CLIP and open the vector store while audio is transcribed
+        warmup(background=True)
     run_ingestion_pipeline()
@@ -0,0 +1,84 @@
+import argparse
+from collections import defaultdict
+import shard_router
+import vector_db
+
+# Moves rows of existing collections into the shards the current config
+# (VECTOR_SHARDS / VECTOR_SHARD_BY_DATASET) routes them to. Rows are read in
+# pages from every existing shard of each logical collection, grouped by
+# their target shard and upserted there; with --delete-source the moved rows
+# are then removed from where they were. Safe to re-run: upserts are by id.
+
+LOGICAL_COLLECTIONS = [
+    vector_db.FRAME_TEXT_COLLECTION,
+    vector_db.FRAME_IMAGE_COLLECTION,
+    vector_db.FRAME_COLLECTION,
+    vector_db.AUDIO_COLLECTION,
+]
+
+
+def _as_list(value):
+    return value.tolist() if hasattr(value, "tolist") else list(value)
+
+
+def migrate_collection(base, dataset=None, page_size=1000, dry_run=False, delete_source=False):
+    moved = defaultdict(int)
+    for source in shard_router.existing_shards(base):
+        collection = vector_db.get_collection(source, create=False)
+        total = collection.count()
+        moved_ids = []
+        print(f"{source}: {total} rows")
+        for offset in range(0, total, page_size):
+            page = collection.get(limit=page_size, offset=offset, include=["embeddings", "metadatas", "documents"])
+            groups = defaultdict(lambda: {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+            documents = page.get("documents")
+            for i, row_id in enumerate(page["ids"]):
+                meta = page["metadatas"][i] or {}
+                video = meta.get("video", "")
+                label = dataset if dataset is not None else shard_router.ingest_dataset(video)
+                target = shard_router.shard_name(base, video, label)
+                if target == source:
+                    continue
+                if not dry_run:
+                    shard_router.register_video(video, label)
+                group = groups[target]
+                group["ids"].append(row_id)
+                group["embeddings"].append(_as_list(page["embeddings"][i]))
+                group["metadatas"].append(meta)
+                group["documents"].append(documents[i] if documents is not None else None)
+
+            for target, group in groups.items():
+                moved[target] += len(group["ids"])
+                moved_ids.extend(group["ids"])
+                if dry_run:
+                    continue
+                docs = group["documents"]
+                if all(d is None for d in docs):
+                    docs = None
+                vector_db.upsert(target, group["ids"], group["embeddings"], group["metadatas"], docs)
+
+        if delete_source and moved_ids and not dry_run:
+            for start in range(0, len(moved_ids), page_size):
+                collection.delete(ids=moved_ids[start:start + page_size])
+            print(f"  removed {len(moved_ids)} moved rows from {source}")
+
+    for target, count in sorted(moved.items()):
+        print(f"  {'would move' if dry_run else 'moved'} {count} rows -> {target}")
+    return dict(moved)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate Chroma collections into the configured shards")
+    parser.add_argument("--collections", nargs="+", default=LOGICAL_COLLECTIONS, help="Logical collections to migrate")
+    parser.add_argument("--dataset", default=None, help="Dataset label for every row (default: shard registry / VECTOR_DATASET)")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report where rows would go")
+    parser.add_argument("--delete-source", action="store_true", help="Remove moved rows from their old collection")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for base in args.collections:
+        migrate_collection(base, args.dataset, max(1, args.page_size), args.dry_run, args.delete_source)
+
\ No newline at end of file
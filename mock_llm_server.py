@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Nebius/Groq chat-completions endpoints.
+#
+#   python mock_llm_server.py --port 8765 --latency lognormal:-1.2,0.4 --rate-429 0.02
+#
+# then point the clients at it (my.env or environment):
+#   NEBIUS_BASE_URL=http://127.0.0.1:8765/v1
+#   GROQ_BASE_URL=http://127.0.0.1:8765
+#   NEBIUS_API_KEY=mock GROQ_API_KEY=mock
+#
+# Responses are deterministic for a given request body; only latency and
+# error injection use the (seeded) random generator. Requests with
+# "stream": true get server-sent events (one chunk per word, --token-interval
+# apart, usage on the last chunk) after the drawn latency.
+
+WORDS = (
+    "person", "room", "table", "window", "light", "door", "car", "street", "man", "woman",
+    "walks", "looks", "holds", "opens", "sits", "talks", "camera", "scene", "outdoor", "indoor",
+    "bright", "dark", "crowd", "screen", "chair", "phone", "bag", "tree", "building", "night",
+)
+
+# Caption requests are told apart by how the image_captioning prompts begin;
+# "SHORT:"/"LONG:" alone also occur in retrieved frame documents of answer prompts
+CAPTION_REQUEST = re.compile(r"(?:Describe this video frame|You are given \d+ keyframes from the same video)")
+
+
+def parse_latency(spec):
+    # fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MU,SIGMA (seconds)
+    kind, _, params = (spec or "fixed:0").partition(":")
+    values = [float(x) for x in params.split(",") if x.strip()] or [0.0]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _words(seed, count):
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    return " ".join(WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(count))
+
+
+def _flatten_messages(messages):
+    texts = []
+    images = 0
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+    return "\n".join(texts), images
+
+
+def canned_reply(body):
+    prompt, images = _flatten_messages(body.get("messages"))
+    seed = json.dumps(body.get("messages"), sort_keys=True)
+
+    if CAPTION_REQUEST.match(prompt):
+        # Only the labels the caption prompt asks for (SHORT:, LONG: or both)
+        labels = [(label, count) for label, count in (("SHORT", 12), ("LONG", 64)) if f"{label}:" in prompt]
+        def caption(tag):
+            return "\n".join(f"{label}: {_words(seed + tag + label, count)}" for label, count in labels)
+        if images > 1:
+            return "\n".join(f"[{i}]\n{caption(str(i))}" for i in range(1, images + 1))
+        return caption("")
+
+    scenes = re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)
+    if "cause and effect" in prompt.lower() and scenes:
+        return "\n".join(
+            f"[{n}] Cause: {_words(seed + n + 'c', 10)}. Effect: {_words(seed + n + 'e', 10)}." for n in scenes
+        )
+    if "cause and effect" in prompt.lower():
+        return f"Cause: {_words(seed + 'c', 20)}. Effect: {_words(seed + 'e', 20)}."
+    return _words(seed + "a", 30) + "."
+
+
+class MockState:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.error_rate = args.error_rate
+        self.rate_429 = args.rate_429
+        self.retry_after = args.retry_after
+        self.rpm = args.rpm
+        self.token_interval = args.token_interval
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.window = []
+        self.counts = {"requests": 0, "ok": 0, "429": 0, "500": 0}
+
+    def draw(self):
+        # Returns (latency_seconds, status_code) for the next request.
+        with self.lock:
+            self.counts["requests"] += 1
+            now = time.time()
+            if self.rpm:
+                self.window = [t for t in self.window if now - t < 60.0]
+                if len(self.window) >= self.rpm:
+                    self.counts["429"] += 1
+                    return 0.0, 429
+                self.window.append(now)
+            latency = self.latency(self.rng)
+            roll = self.rng.random()
+            if roll < self.rate_429:
+                self.counts["429"] += 1
+                return 0.0, 429
+            if roll < self.rate_429 + self.error_rate:
+                self.counts["500"] += 1
+                return latency, 500
+            self.counts["ok"] += 1
+            return latency, 200
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            elif self.path.rstrip("/") == "/stats":
+                with state.lock:
+                    self._send_json(200, dict(state.counts))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "invalid JSON"}})
+                return
+
+            latency, status = state.draw()
+            if status == 429:
+                self._send_json(
+                    429,
+                    {"error": {"message": "rate limit exceeded", "type": "rate_limit_error"}},
+                    headers={"Retry-After": str(state.retry_after)},
+                )
+                return
+            time.sleep(latency)
+            if status != 200:
+                self._send_json(status, {"error": {"message": "injected server error", "type": "server_error"}})
+                return
+
+            content = canned_reply(body)
+            prompt, images = _flatten_messages(body.get("messages"))
+            prompt_tokens = len(prompt.split()) + images * 256
+            completion_tokens = len(content.split())
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            if body.get("stream"):
+                self._send_stream(body, raw, content, usage)
+                return
+            self._send_json(200, {
+                "id": "chatcmpl-" + hashlib.md5(raw).hexdigest()[:12],
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        def _send_stream(self, body, raw, content, usage):
+            # Body ends when the connection closes (no Content-Length)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            base = {
+                "id": "chatcmpl-" + hashlib.md5(raw).hexdigest()[:12],
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+            }
+            words = content.split(" ")
+            try:
+                for i, word in enumerate(words):
+                    if i and state.token_interval:
+                        time.sleep(state.token_interval)
+                    delta = {"content": word if i == 0 else " " + word}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    self._send_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                last = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+                self._send_event(last)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._send_event({**base, "choices": [], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass # client stopped reading
+
+        def _send_event(self, payload):
+            self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.05", help="fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MU,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--rpm", type=int, default=0, help="Hard requests-per-minute cap (excess gets 429, 0 = off)")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Seconds between streamed words")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Mock LLM server listening on http://{args.host}:{args.port} (latency={args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stats: {state.counts}")
+
+
+if __name__ == "__main__":
+    main()
+
\ No newline at end of file
@@ -1,8 +1,11 @@
 import json
 import os
 import time
+import answer_cache
+import usage_tracker
 from output_json import create_output_json
-from retrieval import query_video_rag
+from config import RAG_BATCH_SIZE, MOVIECHAT_FPS, MOVIECHAT_TIME_WINDOW_SEC
+from retrieval import query_video_rag_batch, warmup
 
 
 def split_prediction_sections(prediction):
@@ -107,6 +110,26 @@ def extract_video_path(sample):
     )
 
 
+def extract_fps(sample):
+    info = sample.get("info") if isinstance(sample.get("info"), dict) else {}
+    try:
+        fps = float(info.get("fps") or 0)
+    except (TypeError, ValueError):
+        fps = 0.0
+    return fps if fps > 0 else MOVIECHAT_FPS
+
+
+def breakpoint_window(time_value, fps):
+    # (start_sec, end_sec) around a breakpoint frame index, or None
+    if time_value is None or not MOVIECHAT_TIME_WINDOW_SEC:
+        return None
+    try:
+        seconds = float(time_value) / fps
+    except (TypeError, ValueError):
+        return None
+    return (max(0.0, seconds - MOVIECHAT_TIME_WINDOW_SEC), seconds + MOVIECHAT_TIME_WINDOW_SEC)
+
+
 def build_queries(folder):
     json_files = list_json_files(folder)
     if not json_files:
@@ -128,6 +151,7 @@ def build_queries(folder):
         for sample_idx, sample in enumerate(iter_moviechat_samples(payload)):
             sample_count += 1
             video_value = extract_video_path(sample)
+            fps = extract_fps(sample)
 
             breakpoints = sample.get("breakpoint")
             if isinstance(breakpoints, list) and breakpoints:
@@ -147,6 +171,7 @@ def build_queries(folder):
                             "query": query_text,
                             "answer": answer_text,
                             "time": bp.get("time"),
+                            "time_window": breakpoint_window(bp.get("time"), fps),
                         }
                     )
                 continue
@@ -196,6 +221,8 @@ def build_queries(folder):
 
 
 def main():
+    # Load CLIP / Chroma / Groq while the folder is picked and queries are built
+    warmer = warmup(background=True)
     folder = select_project_folder()
     selected_folder_name = os.path.basename(os.path.normpath(folder))
     print(f"\nReading JSON files from: {folder}")
@@ -203,6 +230,7 @@ def main():
     if not rows:
         raise RuntimeError("No valid entries were found to build a query file.")
 
+    warmer.join()  # keep model loading out of the per-query latencies
     print("\nRunning retrieval on extracted entries...")
     success = 0
     failed = 0
@@ -210,60 +238,83 @@ def main():
     latencies_sec = []
     output_filename = f"{selected_folder_name}_output.json"
 
-    for i, row in enumerate(rows, start=1):
-        user_query = row.get("query", "")
-        video_filename = row.get("video", "")
-        expected_answer = normalize_text(row.get("answer"))
-        latency_sec = 0.0
-
-        if not user_query:
-            skipped += 1
-            print(f"\n[{i}] Skipped (empty query)")
-            output_text = "Skipped: empty query"
-        else:
-            start_time = time.perf_counter()
-            try:
-                prediction = query_video_rag(
-                    user_query=user_query,
-                    video_filename=video_filename,
-                    attach_images=False,
-                )
-                latency_sec = time.perf_counter() - start_time
-                latencies_sec.append(latency_sec)
-                success += 1
-
-                print()
-                print(f"Video: {video_filename}")
-                print(f"Query: {user_query}")
-                if expected_answer:
-                    print(f"Answer: {expected_answer}")
-
-                answer_text, evidence_text, citations_line = split_prediction_sections(prediction)
-                print(f"Output: {answer_text}")
-                print(f"Latency: {latency_sec:.3f}s")
-                print()
-                print(evidence_text)
-                print()
-                print(citations_line)
-                output_text = answer_text
-            except Exception as exc:
-                latency_sec = time.perf_counter() - start_time
-                failed += 1
-                print(f"Video: {video_filename}")
-                print(f"Query: {user_query}")
-                print(f"Latency: {latency_sec:.3f}s")
-                print(f"Retrieval failed: {exc}")
-                output_text = f"Retrieval failed: {exc}"
-
-        create_output_json(
-            video=video_filename,
-            query=user_query,
-            answer=expected_answer,
-            output=output_text,
-            latency=latency_sec,
-            filename=output_filename,
-            default_prefix=selected_folder_name,
-        )
+    for batch_start in range(0, len(rows), RAG_BATCH_SIZE):
+        batch = rows[batch_start:batch_start + RAG_BATCH_SIZE]
+        # One query_video_rag_batch call per batch (one CLIP batch, one vector
+        # query per video, concurrent answers). Latency is each question's
+        # own elapsed time; the batch wall time is printed as throughput
+        asked = [(row.get("query", ""), row.get("video", ""), row.get("time_window")) for row in batch]
+        asked = [(q, v, w) for q, v, w in asked if q]
+        timings = []
+        start_time = time.perf_counter()
+        try:
+            predictions = iter(query_video_rag_batch(
+                [q for q, _, _ in asked],
+                [v for _, v, _ in asked],
+                attach_images=False,
+                return_exceptions=True,
+                timings=timings,
+                time_windows=[w for _, _, w in asked],
+            ))
+        except Exception as exc:  # e.g. CLIP failed for the whole batch
+            predictions = iter([exc] * len(asked))
+        batch_sec = time.perf_counter() - start_time
+        if len(timings) != len(asked):
+            timings = [batch_sec] * len(asked)
+        question_latencies = iter(timings)
+        if asked:
+            print(f"\nBatch {batch_start + 1}-{batch_start + len(batch)}: {len(asked)} questions in {batch_sec:.3f}s ({len(asked) / max(batch_sec, 1e-9):.2f} questions/s)")
+
+        for i, row in enumerate(batch, start=batch_start + 1):
+            user_query = row.get("query", "")
+            video_filename = row.get("video", "")
+            expected_answer = normalize_text(row.get("answer"))
+            latency_sec = 0.0
+
+            if not user_query:
+                skipped += 1
+                print(f"\n[{i}] Skipped (empty query)")
+                output_text = "Skipped: empty query"
+            else:
+                latency_sec = next(question_latencies)
+                try:
+                    prediction = next(predictions)
+                    if isinstance(prediction, Exception):
+                        raise prediction
+                    latencies_sec.append(latency_sec)
+                    success += 1
+
+                    print()
+                    print(f"Video: {video_filename}")
+                    print(f"Query: {user_query}")
+                    if expected_answer:
+                        print(f"Answer: {expected_answer}")
+
+                    answer_text, evidence_text, citations_line = split_prediction_sections(prediction)
+                    print(f"Output: {answer_text}")
+                    print(f"Latency: {latency_sec:.3f}s")
+                    print()
+                    print(evidence_text)
+                    print()
+                    print(citations_line)
+                    output_text = answer_text
+                except Exception as exc:
+                    failed += 1
+                    print(f"Video: {video_filename}")
+                    print(f"Query: {user_query}")
+                    print(f"Latency: {latency_sec:.3f}s")
+                    print(f"Retrieval failed: {exc}")
+                    output_text = f"Retrieval failed: {exc}"
+
+            create_output_json(
+                video=video_filename,
+                query=user_query,
+                answer=expected_answer,
+                output=output_text,
+                latency=latency_sec,
+                filename=output_filename,
+                default_prefix=selected_folder_name,
+            )
 
     avg_latency_sec = (sum(latencies_sec) / len(latencies_sec)) if latencies_sec else 0.0
     max_latency_sec = max(latencies_sec) if latencies_sec else 0.0
@@ -271,6 +322,8 @@ def main():
         f"Done. total={len(rows)} success={success} skipped={skipped} failed={failed} "
         f"avg_latency={avg_latency_sec:.3f}s max_latency={max_latency_sec:.3f}s"
     )
+    answer_cache.print_stats()
+    usage_tracker.write_report(f"query_{selected_folder_name}")
 
 
 if __name__ == "__main__":
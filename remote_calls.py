@@ -0,0 +1,342 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+import usage_tracker
+from config import (
+    REMOTE_RATE_LIMITS,
+    RATE_LIMIT_STATE_PATH,
+    REMOTE_MAX_RETRIES,
+    REMOTE_BACKOFF_BASE,
+    REMOTE_BACKOFF_MAX,
+    REMOTE_REQUEST_TIMEOUT,
+    REMOTE_DEADLINE,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "InternalServerError", "RateLimitError"}
+
+
+class RemoteCallError(RuntimeError):
+    pass
+
+
+class CircuitOpenError(RemoteCallError):
+    pass
+
+
+class TokenBucket:
+    # Requests-per-minute limiter. With a state_path the bucket lives in a small
+    # SQLite file so every worker process sharing the path draws from one budget.
+    def __init__(self, name, rpm, burst, state_path=None):
+        self.name = name
+        self.rate = max(rpm, 1e-6) / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._blocked_until = 0.0
+        if state_path:
+            os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL, updated REAL, blocked_until REAL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, 0)",
+                (name, self.capacity, time.time()),
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.state_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _step(self, state, now, take, block_for):
+        # state = (tokens, updated, blocked_until); returns (new_state, wait_seconds)
+        tokens, updated, blocked_until = state
+        tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+        if block_for:
+            tokens = 0.0
+            blocked_until = max(blocked_until, now + block_for)
+        if not take:
+            return (tokens, now, blocked_until), 0.0
+        if blocked_until > now:
+            return (tokens, now, blocked_until), blocked_until - now
+        if tokens >= 1.0:
+            return (tokens - 1.0, now, blocked_until), 0.0
+        return (tokens, now, blocked_until), (1.0 - tokens) / self.rate
+
+    def _update(self, take, block_for=0.0):
+        now = time.time()
+        if not self.state_path:
+            with self._lock:
+                state, wait = self._step((self._tokens, self._updated, self._blocked_until), now, take, block_for)
+                self._tokens, self._updated, self._blocked_until = state
+            return wait
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, blocked_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone() or (self.capacity, now, 0.0)
+            state, wait = self._step(row, now, take, block_for)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)", (self.name,) + state
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, deadline=None):
+        while True:
+            wait = self._update(take=True)
+            if wait <= 0:
+                return
+            if deadline is not None and time.time() + wait > deadline:
+                raise RemoteCallError(f"{self.name}: rate limit wait exceeds request deadline")
+            time.sleep(wait + random.uniform(0, 0.05))
+
+    def block(self, seconds):
+        # Drain the bucket for everyone, e.g. after a 429 with Retry-After.
+        self._update(take=False, block_for=seconds)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def before_call(self):
+        # True when this call is the half-open trial
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.time() - self._opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(f"{self.name}: circuit open after {self._failures} consecutive failures")
+            # Half-open: let exactly one trial request through.
+            self._trial_running = True
+            return True
+
+    def release_trial(self):
+        # The trial never reached the provider (rate limit / deadline): let
+        # the next call be the trial, without counting an outcome
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial_running = False
+
+
+_registry_lock = threading.Lock()
+_buckets = {}
+_breakers = {}
+
+
+def get_bucket(provider):
+    with _registry_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            limits = REMOTE_RATE_LIMITS.get(provider, {})
+            bucket = TokenBucket(
+                provider,
+                limits.get("rpm", 60),
+                limits.get("burst", 1),
+                state_path=RATE_LIMIT_STATE_PATH,
+            )
+            _buckets[provider] = bucket
+        return bucket
+
+
+def get_breaker(provider):
+    with _registry_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(provider, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+            _breakers[provider] = breaker
+        return breaker
+
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter.
+    return random.uniform(0, min(REMOTE_BACKOFF_MAX, REMOTE_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _call_with_retry(provider, fn, args, kwargs, deadline, state):
+    bucket = get_bucket(provider)
+    breaker = get_breaker(provider)
+    deadline = time.time() + (deadline if deadline is not None else REMOTE_DEADLINE)
+
+    attempt = 0
+    while True:
+        trial = breaker.before_call()
+        try:
+            bucket.acquire(deadline=deadline)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RemoteCallError(f"{provider}: deadline exceeded before request")
+        except BaseException:
+            if trial:
+                breaker.release_trial()
+            raise
+        try:
+            result = fn(*args, timeout=min(REMOTE_REQUEST_TIMEOUT, remaining), **kwargs)
+        except Exception as exc:
+            status = _status_code(exc)
+            # Only transport errors and 5xx count towards opening the circuit;
+            # 4xx responses (including 429) mean the provider is up.
+            if status is not None and status < 500:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            if not is_retryable(exc) or attempt >= REMOTE_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            retry_after = _retry_after(exc)
+            if status == 429:
+                bucket.block(retry_after or delay)
+            if retry_after:
+                delay = max(delay, retry_after)
+            if time.time() + delay >= deadline:
+                raise
+            attempt += 1
+            state["retries"] = attempt
+            print(f"-> {provider} call failed ({exc.__class__.__name__}); retry {attempt}/{REMOTE_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def call_with_retry(provider, fn, *args, deadline=None, stage="remote", **kwargs):
+    # Run fn(*args, **kwargs) under the provider's rate limiter and circuit breaker,
+    # retrying transient failures until REMOTE_MAX_RETRIES or the deadline is hit.
+    # Usage, request bytes and latency are recorded under `stage` in usage_tracker.
+    state = {"retries": 0}
+    request_bytes = usage_tracker.payload_size(kwargs.get("messages"))
+    start = time.perf_counter()
+    try:
+        result = _call_with_retry(provider, fn, args, kwargs, deadline, state)
+    except Exception:
+        usage_tracker.record(
+            stage, provider, kwargs.get("model", ""), request_bytes=request_bytes,
+            latency_sec=time.perf_counter() - start, retries=state["retries"], error=True,
+        )
+        raise
+    usage_tracker.record(
+        stage, provider, kwargs.get("model", ""), usage=getattr(result, "usage", None),
+        request_bytes=request_bytes, latency_sec=time.perf_counter() - start, retries=state["retries"],
+    )
+    return result
+
+
+def _stream_usage(chunk):
+    # OpenAI sends usage on the last chunk (stream_options include_usage),
+    # Groq in chunk.x_groq.usage
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage
+
+
+def _has_content(chunk):
+    for choice in getattr(chunk, "choices", None) or []:
+        if getattr(getattr(choice, "delta", None), "content", None):
+            return True
+    return False
+
+
+def stream_with_retry(provider, fn, *args, deadline=None, stage="remote", **kwargs):
+    # call_with_retry for a stream=True request, as a generator of chunks.
+    # Opening the stream is rate limited and retried like any call; once
+    # chunks have been handed out, errors go to the caller. When the stream
+    # ends the call is recorded under `stage` (usage from the final chunk,
+    # latency to the last chunk) and the time to the first content chunk
+    # under `stage + "_ttft"`. A consumer that stops early (closes the
+    # generator) is recorded as aborted, without usage.
+    state = {"retries": 0}
+    request_bytes = usage_tracker.payload_size(kwargs.get("messages"))
+    model = kwargs.get("model", "")
+    start = time.perf_counter()
+    try:
+        stream = _call_with_retry(provider, fn, args, {**kwargs, "stream": True}, deadline, state)
+    except Exception:
+        usage_tracker.record(
+            stage, provider, model, request_bytes=request_bytes,
+            latency_sec=time.perf_counter() - start, retries=state["retries"], error=True,
+        )
+        raise
+
+    usage, first_token_sec, failed, aborted = None, None, False, False
+    try:
+        for chunk in stream:
+            if first_token_sec is None and _has_content(chunk):
+                first_token_sec = time.perf_counter() - start
+            usage = _stream_usage(chunk) or usage
+            yield chunk
+    except Exception:
+        failed = True
+        raise
+    except BaseException:
+        aborted = True # GeneratorExit / KeyboardInterrupt: the stream was not read to the end
+        raise
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        usage_tracker.record(
+            stage, provider, model, usage=None if aborted else usage, request_bytes=request_bytes,
+            latency_sec=time.perf_counter() - start, retries=state["retries"], error=failed, aborted=aborted,
+        )
+        if first_token_sec is not None:
+            usage_tracker.record(f"{stage}_ttft", provider, model, latency_sec=first_token_sec)
@@ -1,40 +1,306 @@
 import os
-import clip
-import torch
-import chromadb
+import sys
+import time
+import threading
 import base64
-import torch.nn.functional as F
-from config import DB_PATH, CLIP_MODEL, VLM_MODEL, GROQ_API_KEY, FRAME_DIR
-from groq import Groq
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import (
+    VLM_MODEL,
+    FRAME_DIR,
+    USER_DESCRIPTION,
+    LAZY_ENRICH_ON_RETRIEVAL,
+    LAZY_ENRICH_ENGINE,
+    LAZY_ENRICH_CACHE_SIZE,
+    RETRIEVAL_FUSION,
+    RETRIEVAL_TEXT_WEIGHT,
+    RETRIEVAL_IMAGE_WEIGHT,
+    RETRIEVAL_CANDIDATES,
+    RAG_ANSWER_WORKERS,
+    RETRIEVAL_IO_WORKERS,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_VERSION,
+)
+from clients import get_groq_client
+from remote_calls import call_with_retry, stream_with_retry
+import answer_cache
+import clip_runtime
+import vector_backends
+import vector_db
+import usage_tracker
 
-client_db = chromadb.PersistentClient(path=DB_PATH)
-frame_collection = client_db.get_collection("video_frames_v1")
-audio_collection = client_db.get_collection("audio_segments_v1")
-groq_client = Groq(api_key=GROQ_API_KEY)
-model, _ = clip.load(CLIP_MODEL, device="cpu")
-
-def query_video_rag(user_query, debug_raw=False, video_filename=None, frame_dir=None, attach_images=True):
-    # 1. CLIP Embed Query
-    text_token = clip.tokenize([user_query]).to("cpu")
-    with torch.no_grad():
-        text_features = model.encode_text(text_token)
-        text_features /= text_features.norm(dim=-1, keepdim=True)  # Normalize to match stored vectors
-        query_vector = text_features.numpy().tolist()[0]
+# CLIP, the Chroma collections and the Groq client are created on first use;
+# warmup() loads them up front so the first query does not pay for it.
 
-    # 2. Vector Search (frames + audio)
-    where_filter = {"video": video_filename} if video_filename else None
-    frame_results = frame_collection.query(
-        query_embeddings=[query_vector],
-        n_results=5,
-        include=["metadatas", "documents"],
-        where=where_filter
-    )
-    audio_results = audio_collection.query(
-        query_embeddings=[query_vector],
-        n_results=5,
-        include=["metadatas", "documents"],
-        where=where_filter
+def warmup(background=False):
+    if background:
+        thread = threading.Thread(target=warmup, name="rag-warmup", daemon=True)
+        thread.start()
+        return thread
+    clip_runtime.load()
+    backend = vector_backends.get_backend()
+    if not _late_fusion_collections():
+        backend.exists(vector_db.FRAME_COLLECTION)
+    backend.exists(vector_db.AUDIO_COLLECTION)
+    get_groq_client()
+
+# Vector searches and frame image reads of a query run concurrently on this
+# pool. Tasks submitted to it never wait on other tasks of the pool.
+_io_lock = threading.Lock()
+_io_executor = None
+
+def _io_pool():
+    global _io_executor
+    if _io_executor is None:
+        with _io_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_IO_WORKERS, thread_name_prefix="rag-io")
+    return _io_executor
+
+def _read_image(frame_path):
+    if not os.path.exists(frame_path):
+        return None
+    with open(frame_path, "rb") as f:
+        img_b64 = base64.b64encode(f.read()).decode('utf-8')
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}}
+
+# Frames ingested with INGEST_TIER="lazy" get their LONG caption and causal text
+# on the first retrieval hit; results are written back and cached here (LRU of
+# LAZY_ENRICH_CACHE_SIZE documents). A frame hit by several concurrent queries
+# is enriched once: the others wait on the first one's future.
+_enrich_lock = threading.Lock()
+_enriched_docs = OrderedDict()
+_enriching = {} # frame_id -> Future of the enrichment in progress
+
+def enrich_frame(frame_id, meta):
+    with _enrich_lock:
+        cached = _enriched_docs.get(frame_id)
+        if cached:
+            _enriched_docs.move_to_end(frame_id)
+            return cached
+        running = _enriching.get(frame_id)
+        if running is None:
+            future = _enriching[frame_id] = Future()
+    if running is not None:
+        return running.result()
+
+    try:
+        document = _enrich(meta)
+    except BaseException as e:
+        with _enrich_lock:
+            _enriching.pop(frame_id, None)
+        future.set_exception(e)
+        raise
+    with _enrich_lock:
+        _enriching.pop(frame_id, None)
+        if document:
+            _enriched_docs[frame_id] = document
+            while len(_enriched_docs) > LAZY_ENRICH_CACHE_SIZE:
+                _enriched_docs.popitem(last=False)
+    future.set_result(document)
+    return document
+
+def _enrich(meta):
+    frame_path = meta.get("frame_path")
+    if not frame_path or not os.path.exists(frame_path):
+        return None
+
+    from image_captioning import generate_captions
+    from causal_analysis import get_causal_knowledge
+    from knowledge_base import store_frame_embedding, frame_document
+
+    # Only the LONG caption is missing; the SHORT one was stored at ingest
+    short_cap = meta.get("short_caption")
+    if short_cap:
+        long_cap = generate_captions(frame_path, engine=LAZY_ENRICH_ENGINE, long_only=True)[1]
+    else:
+        short_cap, long_cap = generate_captions(frame_path, engine=LAZY_ENRICH_ENGINE)
+    user_desc = meta.get("user_desc") or USER_DESCRIPTION
+    causal_text = get_causal_knowledge(user_desc, f"{short_cap}. {long_cap}")
+    store_frame_embedding(
+        short_cap,
+        long_cap,
+        causal_text,
+        meta.get("timestamp"),
+        frame_path,
+        meta.get("scene_start"),
+        meta.get("scene_end"),
+        meta.get("scene_duration"),
+        video_filename=meta.get("video") or None,
+        tier="full",
+        user_desc=meta.get("user_desc"),
+        invalidate_answers=False,
     )
+    return frame_document(short_cap, long_cap, causal_text)
+
+def _enrich_top_frames(frame_ids, frame_metas, frame_docs, top_k):
+    pending = [
+        i for i in range(min(top_k, len(frame_metas)))
+        if frame_metas[i].get("tier") == "short" and i < len(frame_ids)
+    ]
+    if not pending:
+        return
+
+    def _run(i):
+        try:
+            return enrich_frame(frame_ids[i], frame_metas[i])
+        except Exception as e:
+            print(f"Lazy enrichment failed for {frame_ids[i]}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+        for i, document in zip(pending, pool.map(_run, pending)):
+            if document:
+                frame_docs[i] = document
+                frame_metas[i] = {**frame_metas[i], "tier": "full"}
+
+def _late_fusion_collections(video=None):
+    # False in "fused" mode or when the database predates the split collections
+    if RETRIEVAL_FUSION != "late":
+        return False
+    backend = vector_backends.get_backend()
+    return backend.exists(vector_db.FRAME_TEXT_COLLECTION, video) and backend.exists(vector_db.FRAME_IMAGE_COLLECTION, video)
+
+def _dot(a, b):
+    return float(np.dot(np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)))
+
+def _stored_text_vectors(frame_ids, video=None):
+    # Text-side CLIP vectors written at ingest (video_frames_text_v1), by id
+    if not frame_ids:
+        return {}
+    try:
+        got = vector_backends.get_backend().get(vector_db.FRAME_TEXT_COLLECTION, frame_ids, ["embeddings"], video)
+    except Exception:
+        return {}
+    embeddings = got.get("embeddings")
+    if embeddings is None:
+        return {}
+    return {fid: np.asarray(vec, dtype=np.float32) for fid, vec in zip(got.get("ids", []), embeddings)}
+
+def _one(results, q):
+    # Query q's part of a multi-query result, in single-query shape
+    return {key: [results[key][q]] for key in ("ids", "distances", "metadatas", "documents", "embeddings") if results.get(key) is not None}
+
+def _late_fusion_frames(query_arrays, video, n_results, windows=None):
+    # Search the text and image vectors separately, then rank the union of the
+    # candidates by RETRIEVAL_TEXT_WEIGHT * text_cos + RETRIEVAL_IMAGE_WEIGHT * image_cos.
+    # Scores are computed from the returned vectors, so they do not depend on
+    # the collection's distance metric. All queries go into one vector query
+    # per collection; returns (ids, metas, docs, raw) per query.
+    backend = vector_backends.get_backend()
+    collections = {"text": vector_db.FRAME_TEXT_COLLECTION, "image": vector_db.FRAME_IMAGE_COLLECTION}
+    weights = {"text": RETRIEVAL_TEXT_WEIGHT, "image": RETRIEVAL_IMAGE_WEIGHT}
+    active = [kind for kind in ("text", "image") if weights[kind]]
+    per_query = [({}, {}, {}, {}) for _ in query_arrays] # scores, metas, docs, raw
+
+    searches = {
+        kind: _io_pool().submit(backend.query_many, collections[kind], query_arrays, n_results, video, ["metadatas", "documents", "embeddings"], windows)
+        for kind in active
+    }
+    for kind in active:
+        results = searches[kind].result()
+        for q, (scores, metas, docs, raw) in enumerate(per_query):
+            raw[kind] = _one(results, q)
+            for i, fid in enumerate(results.get("ids", [])[q]):
+                scores.setdefault(fid, {})[kind] = _dot(query_arrays[q], results["embeddings"][q][i])
+                metas.setdefault(fid, results["metadatas"][q][i])
+                if kind == "text":
+                    docs[fid] = results["documents"][q][i]
+
+    # Candidates found by only one side: fetch the other vector (and the
+    # document, which only the text collection holds), once for all queries
+    for kind in active:
+        missing = sorted({fid for scores, _, _, _ in per_query for fid, s in scores.items() if kind not in s})
+        if not missing:
+            continue
+        include = ["embeddings", "documents"] if kind == "text" else ["embeddings"]
+        got = backend.get(collections[kind], missing, include, video)
+        vectors = dict(zip(got.get("ids", []), got["embeddings"]))
+        got_docs = dict(zip(got.get("ids", []), got.get("documents") or [])) if kind == "text" else {}
+        for q, (scores, _, docs, _) in enumerate(per_query):
+            for fid, s in scores.items():
+                if kind not in s and fid in vectors:
+                    s[kind] = _dot(query_arrays[q], vectors[fid])
+                    if fid in got_docs:
+                        docs[fid] = got_docs[fid]
+    if "text" not in active:
+        wanted = sorted({fid for scores, _, _, _ in per_query for fid in scores})
+        if wanted:
+            got = backend.get(collections["text"], wanted, ["documents"], video)
+            got_docs = dict(zip(got.get("ids", []), got.get("documents") or []))
+            for scores, _, docs, _ in per_query:
+                docs.update((fid, got_docs[fid]) for fid in scores if fid in got_docs)
+
+    out = []
+    for scores, metas, docs, raw in per_query:
+        fused = {fid: sum(weights[kind] * s.get(kind, 0.0) for kind in active) for fid, s in scores.items()}
+        order = sorted(fused, key=fused.get, reverse=True)[:n_results]
+        out.append((order, [metas[fid] for fid in order], [docs.get(fid) or "" for fid in order], raw))
+    return out
+
+def _search(query_arrays, video_filename, windows=None):
+    # Frame and audio candidates for queries that share a video filter, with
+    # one vector query per collection for all of them. windows: optional
+    # (start_sec, end_sec) or None per query, applied by the backend
+    backend = vector_backends.get_backend()
+    audio_search = _io_pool().submit(backend.query_many, vector_db.AUDIO_COLLECTION, query_arrays, 5, video_filename, vector_backends.DEFAULT_INCLUDE, windows)
+    late_fusion = _late_fusion_collections(video_filename)
+    hits = [{"late_fusion": late_fusion} for _ in query_arrays]
+    if late_fusion:
+        frames = _late_fusion_frames(query_arrays, video_filename, RETRIEVAL_CANDIDATES, windows)
+        for hit, (ids, metas, docs, raw) in zip(hits, frames):
+            hit.update(frame_ids=ids, frame_metas=metas, frame_docs=docs, frame_results=raw)
+    else:
+        results = backend.query_many(vector_db.FRAME_COLLECTION, query_arrays, RETRIEVAL_CANDIDATES, video_filename, vector_backends.DEFAULT_INCLUDE, windows)
+        for q, hit in enumerate(hits):
+            hit.update(
+                frame_ids=results.get("ids", [])[q],
+                frame_metas=results.get("metadatas", [])[q],
+                frame_docs=results.get("documents", [])[q],
+                frame_results=_one(results, q),
+            )
+        # Document vectors for the rerank, fetched once for the whole group
+        all_ids = sorted({fid for hit in hits for fid in hit["frame_ids"]})
+        doc_vectors = _stored_text_vectors(all_ids, video_filename)
+        for hit in hits:
+            hit["doc_vectors"] = {fid: doc_vectors[fid] for fid in hit["frame_ids"] if fid in doc_vectors}
+    audio = audio_search.result()
+    for q, hit in enumerate(hits):
+        hit["audio_results"] = _one(audio, q)
+    if windows:
+        # Nothing inside the window (e.g. times past the end of the video):
+        # those queries search the whole video instead
+        empty = [
+            q for q, hit in enumerate(hits)
+            if windows[q] and not hit["frame_ids"] and not hit["audio_results"].get("ids", [[]])[0]
+        ]
+        if empty:
+            for q, hit in zip(empty, _search(query_arrays[empty], video_filename)):
+                hits[q] = hit
+    return hits
+
+ANSWER_PROMPT = (
+    "You are a video RAG assistant. Answer the question using the provided context and image. "
+    "If the answer is not in the context, say you don't know. "
+    "Do not repeat yourself. Do not use LaTeX or boxed answers. "
+    "Be concise and direct.\n\n"
+    "Question: {question}\n"
+    "Frame Context:\n{frame_context}\n"
+    "Audio Context:\n{audio_context}\n"
+)
+# Part of every answer_cache scope: editing the prompt starts a fresh cache
+ANSWER_PROMPT_HASH = hashlib.sha1(ANSWER_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def _prepare(user_query, query_array, hit, frame_dir=None, attach_images=True, debug_raw=False):
+    # Rerank, lazy enrichment and prompt for one query's search hits;
+    # None when nothing matched
+    frame_ids = list(hit["frame_ids"])
+    frame_metas = list(hit["frame_metas"])
+    frame_docs = list(hit["frame_docs"])
+    frame_results = hit["frame_results"]
+    audio_results = hit["audio_results"]
 
     if debug_raw:
         print("\n[RAW] Frame Results:")
@@ -42,41 +308,55 @@ def query_video_rag(user_query, debug_raw=False, video_filename=None, frame_dir=
         print("\n[RAW] Audio Results:")
         print(audio_results)
 
-    frame_metas = frame_results.get("metadatas", [[]])[0]
-    frame_docs = frame_results.get("documents", [[]])[0]
-    frame_ids = frame_results.get("ids", [[]])[0]
     audio_metas = audio_results.get("metadatas", [[]])[0]
     audio_docs = audio_results.get("documents", [[]])[0]
     audio_ids = audio_results.get("ids", [[]])[0]
 
     if not frame_metas and not audio_metas:
-        return "No matches."
+        return None
 
-    # Build text list for reranking frames (use documents)
-    def _cap(text, limit=400):
-        text = (text or "").strip()
-        return text[:limit]
+    # Averaged vectors: rerank frames by the query's CLIP similarity to their
+    # documents. (Late fusion already ranks with the stored text vectors.)
+    if not hit["late_fusion"]:
+        # Build text list for reranking frames (use documents)
+        def _cap(text, limit=400):
+            text = (text or "").strip()
+            return text[:limit]
 
-    frame_texts = [_cap(d, 800) for d in frame_docs]
+        # Document vectors come from the text collection written at ingest;
+        # only frames without one (older databases) are encoded with CLIP.
+        doc_vectors = dict(hit.get("doc_vectors") or {})
+        missing = [i for i, fid in enumerate(frame_ids) if fid not in doc_vectors]
+        if missing:
+            encoded = clip_runtime.encode_texts([_cap(frame_docs[i], 800) for i in missing]).cpu().float().numpy()
+            for i, vector in zip(missing, encoded):
+                doc_vectors[frame_ids[i]] = vector
 
-    # Encode metadata texts with CLIP for reranking
-    ranked_indices = list(range(len(frame_metas)))
-    if frame_texts:
-        text_tokens = clip.tokenize(frame_texts, truncate=True).to("cpu")
-        with torch.no_grad():
-            meta_features = model.encode_text(text_tokens)
-            meta_features /= meta_features.norm(dim=-1, keepdim=True)
+        # Cosine similarity between query and documents (both normalized)
+        ranked_indices = list(range(len(frame_metas)))
+        if doc_vectors:
+            sims = np.stack([doc_vectors[fid] for fid in frame_ids]) @ query_array
+            ranked_indices = np.argsort(-sims, kind="stable").tolist()
 
-        # Cosine similarity between query and metadata
-        sims = F.cosine_similarity(meta_features, text_features)
-        ranked_indices = torch.argsort(sims, descending=True).tolist()
-
-    # Reorder frames by similarity
-    frame_metas = [frame_metas[i] for i in ranked_indices]
-    frame_docs = [frame_docs[i] for i in ranked_indices]
-    frame_ids = [frame_ids[i] for i in ranked_indices] if frame_ids else []
+        # Reorder frames by similarity
+        frame_metas = [frame_metas[i] for i in ranked_indices]
+        frame_docs = [frame_docs[i] for i in ranked_indices]
+        frame_ids = [frame_ids[i] for i in ranked_indices] if frame_ids else []
 
     top_k = 3
+    # Read the top-k frame images while frames are enriched and the prompt is
+    # built (the order is final here; enrichment only changes documents)
+    image_reads = []
+    if attach_images:
+        use_frame_dir = frame_dir or FRAME_DIR
+        image_reads = [
+            _io_pool().submit(_read_image, os.path.join(use_frame_dir, f"{m.get('timestamp')}.jpg"))
+            for m in frame_metas[:top_k] if m.get("timestamp")
+        ]
+
+    if LAZY_ENRICH_ON_RETRIEVAL:
+        _enrich_top_frames(frame_ids, frame_metas, frame_docs, top_k)
+
     frame_context_lines = []
     for i, (m, d, fid) in enumerate(zip(frame_metas[:top_k], frame_docs[:top_k], frame_ids[:top_k]), start=1):
         scene_start = m.get("scene_start")
@@ -95,67 +375,217 @@ def query_video_rag(user_query, debug_raw=False, video_filename=None, frame_dir=
         )
 
     # 3. Final VLM Reasoning
-    # Attach top-k images (optional)
-    image_contents = []
     evidence_lines = []
-    if attach_images:
-        use_frame_dir = frame_dir or FRAME_DIR
-        for m in frame_metas[:top_k]:
-            ts_i = m.get("timestamp")
-            if not ts_i:
-                continue
-            frame_path = os.path.join(use_frame_dir, f"{ts_i}.jpg")
-            if os.path.exists(frame_path):
-                with open(frame_path, "rb") as f:
-                    img_b64 = base64.b64encode(f.read()).decode('utf-8')
-                image_contents.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}})
-            scene_start = m.get("scene_start")
-            scene_end = m.get("scene_end")
-            scene_range = ""
-            if scene_start is not None and scene_end is not None:
-                scene_range = f"{scene_start:.2f}-{scene_end:.2f}s"
-            evidence_lines.append(f"- frame {ts_i} {scene_range}".strip())
-    else:
-        for m in frame_metas[:top_k]:
-            ts_i = m.get("timestamp")
-            if not ts_i:
-                continue
-            scene_start = m.get("scene_start")
-            scene_end = m.get("scene_end")
-            scene_range = ""
-            if scene_start is not None and scene_end is not None:
-                scene_range = f"{scene_start:.2f}-{scene_end:.2f}s"
-            evidence_lines.append(f"- frame {ts_i} {scene_range}".strip())
+    for m in frame_metas[:top_k]:
+        ts_i = m.get("timestamp")
+        if not ts_i:
+            continue
+        scene_start = m.get("scene_start")
+        scene_end = m.get("scene_end")
+        scene_range = ""
+        if scene_start is not None and scene_end is not None:
+            scene_range = f"{scene_start:.2f}-{scene_end:.2f}s"
+        evidence_lines.append(f"- frame {ts_i} {scene_range}".strip())
 
     for i, (m, aid) in enumerate(zip(audio_metas[:top_k], audio_ids[:top_k]), start=1):
         evidence_lines.append(
             f"- audio {aid} {m.get('start',0.0):.2f}-{m.get('end',0.0):.2f}s"
         )
 
-    prompt = (
-        "You are a video RAG assistant. Answer the question using the provided context and image. "
-        "If the answer is not in the context, say you don't know. "
-        "Do not repeat yourself. Do not use LaTeX or boxed answers. "
-        "Be concise and direct.\n\n"
-        f"Question: {user_query}\n"
-        "Frame Context:\n" + "\n".join(frame_context_lines) + "\n"
-        "Audio Context:\n" + "\n".join(audio_context_lines) + "\n"
-    )
-    
-    response = groq_client.chat.completions.create(
-        model=VLM_MODEL,
-        messages=[{
-            "role": "user",
-            "content": [{"type": "text", "text": prompt}] + image_contents
-        }]
+    prompt = ANSWER_PROMPT.format(
+        question=user_query,
+        frame_context="\n".join(frame_context_lines),
+        audio_context="\n".join(audio_context_lines),
     )
+
+    # Attach top-k images (optional)
+    image_contents = [content for content in (read.result() for read in image_reads) if content]
+
     evidence_text = "Evidence:\n" + "\n".join(evidence_lines) if evidence_lines else "Evidence: (no frames found)"
     frame_citations = [m.get("timestamp","") for m in frame_metas[:top_k] if m.get("timestamp")]
     audio_citations = [aid for aid in audio_ids[:top_k] if aid]
-    citations = ", ".join(frame_citations + audio_citations)
-    return f"{response.choices[0].message.content}\n\n{evidence_text}\n\n[Citations: {citations}]"
+    return {
+        "query": user_query,
+        "query_vector": query_array,
+        "prompt": prompt,
+        "image_contents": image_contents,
+        "evidence_text": evidence_text,
+        "citations": ", ".join(frame_citations + audio_citations),
+    }
+
+def _messages(prepared):
+    return [{
+        "role": "user",
+        "content": [{"type": "text", "text": prepared["prompt"]}] + prepared["image_contents"]
+    }]
+
+def _footer(prepared):
+    return f"\n\n{prepared['evidence_text']}\n\n[Citations: {prepared['citations']}]"
+
+def _cache_args(prepared, video):
+    # (video, question, evidence ids, query vector, scope) for answer_cache
+    scope = f"v{ANSWER_CACHE_VERSION}|{VLM_MODEL}|prompt={ANSWER_PROMPT_HASH}|images={int(bool(prepared['image_contents']))}"
+    return video, prepared["query"], prepared["citations"], prepared["query_vector"], scope
+
+def _cached_answer(prepared, video):
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    video, query, evidence, query_vector, scope = _cache_args(prepared, video)
+    text = answer_cache.get_cache().lookup(video, query, evidence, query_vector, scope)
+    if text is not None:
+        usage_tracker.record("answer_cache", provider="cache")
+    return text
+
+def _remember_answer(prepared, video, text):
+    if ANSWER_CACHE_ENABLED and text:
+        video, query, evidence, query_vector, scope = _cache_args(prepared, video)
+        answer_cache.get_cache().store(video, query, evidence, text, query_vector, scope)
+
+def _answer(prepared, video=None):
+    text = _cached_answer(prepared, video)
+    if text is None:
+        response = call_with_retry(
+            "groq",
+            get_groq_client().chat.completions.create,
+            stage="answer",
+            model=VLM_MODEL,
+            messages=_messages(prepared)
+        )
+        text = response.choices[0].message.content
+        _remember_answer(prepared, video, text)
+    return f"{text}{_footer(prepared)}"
+
+def query_video_rag(user_query, debug_raw=False, video_filename=None, frame_dir=None, attach_images=True, time_window=None):
+    # time_window=(start_sec, end_sec) limits frames and audio to that part of
+    # the video (falls back to the whole video when nothing is inside it)
+    retrieve_start = time.perf_counter()
+    # 1. CLIP Embed Query
+    query_array = clip_runtime.encode_texts([user_query]).cpu().float().numpy()[0]  # Normalized to match stored vectors
+
+    # 2. Vector Search (frames + audio)
+    hit = _search(np.asarray([query_array]), video_filename, [time_window])[0]
+    prepared = _prepare(user_query, query_array, hit, frame_dir, attach_images, debug_raw)
+    if prepared is None:
+        return "No matches."
+
+    usage_tracker.record("retrieve", latency_sec=time.perf_counter() - retrieve_start)
+    return _answer(prepared, video_filename)
+
+def query_video_rag_stream(user_query, debug_raw=False, video_filename=None, frame_dir=None, attach_images=True, metrics=None, time_window=None):
+    # query_video_rag for interactive use: yields the answer text as the model
+    # generates it, then the evidence/citations block (the pieces joined are
+    # what query_video_rag returns). If a metrics dict is given it gets
+    # retrieve_sec, ttft_sec (question -> first answer token) and total_sec.
+    metrics = metrics if metrics is not None else {}
+    start = time.perf_counter()
+    query_array = clip_runtime.encode_texts([user_query]).cpu().float().numpy()[0]
+    hit = _search(np.asarray([query_array]), video_filename, [time_window])[0]
+    prepared = _prepare(user_query, query_array, hit, frame_dir, attach_images, debug_raw)
+    metrics["retrieve_sec"] = time.perf_counter() - start
+    if prepared is None:
+        metrics["total_sec"] = metrics["retrieve_sec"]
+        yield "No matches."
+        return
+
+    usage_tracker.record("retrieve", latency_sec=metrics["retrieve_sec"])
+    cached = _cached_answer(prepared, video_filename)
+    if cached is not None:
+        metrics["ttft_sec"] = time.perf_counter() - start
+        yield cached
+    else:
+        chunks = stream_with_retry(
+            "groq",
+            get_groq_client().chat.completions.create,
+            stage="answer",
+            model=VLM_MODEL,
+            messages=_messages(prepared)
+        )
+        pieces = []
+        for chunk in chunks:
+            for choice in chunk.choices or []:
+                text = getattr(choice.delta, "content", None)
+                if text:
+                    metrics.setdefault("ttft_sec", time.perf_counter() - start)
+                    pieces.append(text)
+                    yield text
+        _remember_answer(prepared, video_filename, "".join(pieces))
+    yield _footer(prepared)
+    metrics["total_sec"] = time.perf_counter() - start
+
+def query_video_rag_batch(queries, videos=None, frame_dir=None, attach_images=False, max_workers=RAG_ANSWER_WORKERS, return_exceptions=False, time_windows=None, timings=None):
+    # query_video_rag for many questions: one CLIP batch for all of them, one
+    # vector query per collection for each video filter (time windows are
+    # applied per question inside it),
+    # then enrichment and answers in a thread pool. Returns answers in input
+    # order; with return_exceptions a failed question gives its exception
+    # instead of raising. If a timings list is given it receives each
+    # question's elapsed seconds: the CLIP batch, its group's vector search
+    # and its own rerank/enrichment/answer (not time spent queued behind
+    # other questions).
+    queries = list(queries)
+    videos = list(videos) if videos is not None else [None] * len(queries)
+    time_windows = list(time_windows) if time_windows is not None else [None] * len(queries)
+    if len(videos) != len(queries) or len(time_windows) != len(queries):
+        raise ValueError("queries, videos and time_windows must have the same length")
+    if not queries:
+        return []
+    results = [None] * len(queries)
+
+    retrieve_start = time.perf_counter()
+    query_arrays = clip_runtime.encode_texts(queries).cpu().float().numpy()
+    elapsed = [time.perf_counter() - retrieve_start] * len(queries)
+    groups = {}
+    for i, video in enumerate(videos):
+        groups.setdefault(video or None, []).append(i)
+    hits = {}
+    for video, members in groups.items():
+        group_start = time.perf_counter()
+        try:
+            for i, hit in zip(members, _search(query_arrays[members], video, [time_windows[i] for i in members])):
+                hits[i] = hit
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            for i in members:
+                results[i] = e
+        for i in members:
+            elapsed[i] += time.perf_counter() - group_start
+    search_share = (time.perf_counter() - retrieve_start) / len(queries)
+
+    def _run(i):
+        with usage_tracker.video_context(videos[i]):
+            start = time.perf_counter()
+            try:
+                prepared = _prepare(queries[i], query_arrays[i], hits[i], frame_dir, attach_images)
+                if prepared is None:
+                    return "No matches."
+                usage_tracker.record("retrieve", latency_sec=search_share + time.perf_counter() - start)
+                return _answer(prepared, videos[i])
+            finally:
+                elapsed[i] += time.perf_counter() - start
+
+    pending = sorted(hits)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1))) as pool:
+        futures = {i: pool.submit(_run, i) for i in pending}
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[i] = e
+    if timings is not None:
+        timings[:] = elapsed
+    return results
 
 if __name__ == "__main__":
+    if "--warmup" in sys.argv[1:]:
+        warmup(background=True)  # loads while the question is typed
     q = input("Question: ")
     debug_raw = os.getenv("RAG_DEBUG", "0") == "1"
-    print(query_video_rag(q, debug_raw=debug_raw))
+    metrics = {}
+    for piece in query_video_rag_stream(q, debug_raw=debug_raw, metrics=metrics):
+        print(piece, end="", flush=True)
+    print()
+    if "ttft_sec" in metrics:
+        print(f"(first token after {metrics['ttft_sec']:.2f}s, retrieval {metrics['retrieve_sec']:.2f}s, total {metrics['total_sec']:.2f}s)")
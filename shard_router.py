@@ -0,0 +1,171 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+import vector_db
+from config import VECTOR_SHARDS, VECTOR_SHARD_BY_DATASET, SHARD_REGISTRY_PATH
+
+# Routes each video to a physical Chroma collection ("shard") of a logical
+# collection such as video_frames_text_v1:
+#   <base>                         VECTOR_SHARDS = 1, no dataset sharding
+#   <base>__<dataset>              VECTOR_SHARD_BY_DATASET
+#   <base>__s03 / <base>__<dataset>__s03   VECTOR_SHARDS > 1 (hash of the video name)
+# Ingest writes through shard_name(); queries for one video open only that
+# video's shard, queries without a video fan out over every shard.
+# With dataset sharding the dataset label of each video is kept in a small
+# SQLite registry so that queries, which only know the video, find its shard.
+
+SEPARATOR = "__"
+
+_lock = threading.Lock()
+_registry = None
+_video_datasets = {}
+
+
+def _safe(label):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in label).strip("_")
+
+
+def _hash_shard(video):
+    digest = hashlib.sha1((video or "").encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % VECTOR_SHARDS
+
+
+def shard_name(base, video, dataset=None):
+    name = base
+    if VECTOR_SHARD_BY_DATASET:
+        dataset = _safe(dataset if dataset is not None else ingest_dataset(video))
+        if dataset:
+            name += f"{SEPARATOR}{dataset}"
+    if VECTOR_SHARDS > 1:
+        name += f"{SEPARATOR}s{_hash_shard(video):02d}"
+    return name
+
+
+# -- registry (video -> dataset) -------------------------------------------
+
+def _db():
+    global _registry
+    if _registry is None:
+        os.makedirs(os.path.dirname(SHARD_REGISTRY_PATH) or ".", exist_ok=True)
+        _registry = sqlite3.connect(SHARD_REGISTRY_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        _registry.execute("CREATE TABLE IF NOT EXISTS videos (video TEXT PRIMARY KEY, dataset TEXT NOT NULL)")
+    return _registry
+
+
+def ingest_dataset(video):
+    # Label of the running ingest; writes without one (e.g. lazy enrichment
+    # from a query process) go back to the dataset the video is registered under
+    return config.VECTOR_DATASET or video_dataset(video) or ""
+
+
+def register_video(video, dataset=None):
+    if not VECTOR_SHARD_BY_DATASET or not video:
+        return
+    dataset = _safe(dataset if dataset is not None else ingest_dataset(video))
+    with _lock:
+        if _video_datasets.get(video) == dataset:
+            return
+        _db().execute("INSERT OR REPLACE INTO videos (video, dataset) VALUES (?, ?)", (video, dataset))
+        _video_datasets[video] = dataset
+
+
+def video_dataset(video):
+    # None when the video was never registered
+    if not video:
+        return None
+    with _lock:
+        if video in _video_datasets:
+            return _video_datasets[video]
+        row = _db().execute("SELECT dataset FROM videos WHERE video = ?", (video,)).fetchone()
+        if row:
+            _video_datasets[video] = row[0]
+        return row[0] if row else None
+
+
+# -- shard discovery -------------------------------------------------------
+
+def existing_shards(base):
+    names = [getattr(c, "name", c) for c in vector_db.get_client().list_collections()]
+    return sorted(n for n in names if n == base or n.startswith(base + SEPARATOR))
+
+
+def shards_for(base, video=None):
+    # Shards a query has to search: the video's own shard when it can be
+    # routed, otherwise every shard of the logical collection
+    if video and (not VECTOR_SHARD_BY_DATASET or video_dataset(video) is not None):
+        dataset = video_dataset(video) if VECTOR_SHARD_BY_DATASET else None
+        return [shard_name(base, video, dataset)]
+    return existing_shards(base)
+
+
+class FanOutCollection:
+    # query()/get() over several shards, merged as if they were one collection
+    def __init__(self, collections):
+        self.collections = collections
+
+    def _each(self, fn):
+        if len(self.collections) == 1:
+            return [fn(self.collections[0])]
+        with ThreadPoolExecutor(max_workers=min(8, len(self.collections))) as pool:
+            return list(pool.map(fn, self.collections))
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None):
+        include = list(include or ["metadatas", "documents", "distances"])
+        fields = include + (["distances"] if "distances" not in include else [])
+        parts = self._each(lambda c: c.query(
+            query_embeddings=query_embeddings, n_results=n_results, include=fields, where=where
+        ))
+        # Shards created with different hnsw:space are merged on the cosine scale
+        scales = [vector_db.distance_scale(c) for c in self.collections]
+        merged = {key: [] for key in ["ids"] + include}
+        for q in range(len(query_embeddings)):
+            rows = []
+            for part, scale in zip(parts, scales):
+                for i, row_id in enumerate(part["ids"][q]):
+                    rows.append((part["distances"][q][i] * scale, row_id, {key: part[key][q][i] for key in include}))
+            rows.sort(key=lambda row: row[0])
+            rows = rows[:n_results]
+            merged["ids"].append([row[1] for row in rows])
+            for key in include:
+                merged[key].append([row[2][key] for row in rows])
+        return merged
+
+    def get(self, ids=None, include=None, where=None, limit=None):
+        include = list(include or ["metadatas", "documents"])
+        parts = self._each(lambda c: c.get(ids=ids, include=include, where=where, limit=limit))
+        merged = {key: [] for key in ["ids"] + include}
+        for part in parts:
+            merged["ids"].extend(part["ids"])
+            for key in include:
+                values = part.get(key)
+                merged[key].extend(list(values) if values is not None else [None] * len(part["ids"]))
+        return merged
+
+    def count(self):
+        return sum(self._each(lambda c: c.count()))
+
+
+def _open(names):
+    collections = []
+    for name in names:
+        try:
+            collections.append(vector_db.get_collection(name, create=False))
+        except Exception:
+            continue
+    return collections
+
+
+def open_collection(base, video=None):
+    # Read-side handle for a logical collection; raises if no shard exists
+    collections = _open(shards_for(base, video))
+    if not collections and video:
+        collections = _open(existing_shards(base)) # routed shard missing (not migrated yet)
+    if not collections:
+        raise ValueError(f"No shards of collection '{base}'" + (f" for video '{video}'" if video else ""))
+    if len(collections) == 1:
+        return collections[0]
+    return FanOutCollection(collections)
+
\ No newline at end of file
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import flat_store
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(flat_store, "FLAT_IVF_LISTS", 0)
+    return flat_store.FlatClient(str(tmp_path))
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_upsert_overwrite_tombstones_old_row(client):
+    collection = client.get_or_create_collection("c", metadata={"hnsw:space": "cosine"})
+    vectors = _vectors(3)
+    collection.upsert(["a", "b", "c"], vectors, [{"video": "v", "n": i} for i in range(3)], ["d0", "d1", "d2"])
+    collection.upsert(["b"], vectors[:1], [{"video": "v", "n": 10}], ["new"])
+
+    assert collection.count() == 3
+    assert int(collection._info("rows")) == 4 # the old "b" row is kept but dead
+    got = collection.get(ids=["b"], include=["metadatas", "documents", "embeddings"])
+    assert got["ids"] == ["b"]
+    assert got["metadatas"] == [{"video": "v", "n": 10}]
+    assert got["documents"] == ["new"]
+    np.testing.assert_allclose(got["embeddings"][0], vectors[0] / np.linalg.norm(vectors[0]), rtol=1e-6)
+
+    # A query for the old vector of "b" must not return the tombstoned row
+    hit = collection.query([vectors[1]], n_results=3, include=["metadatas"])
+    assert sorted(hit["ids"][0]) == ["a", "b", "c"]
+    assert {m["n"] for m in hit["metadatas"][0]} == {0, 2, 10}
+
+    collection.delete(ids=["a"])
+    assert collection.count() == 2
+    assert collection.get(ids=["a"])["ids"] == []
+
+
+def test_where_filters(client):
+    collection = client.get_or_create_collection("c")
+    metas = [{"video": f"v{i % 3}", "start": float(i), "kind": "frame" if i % 2 else "audio"} for i in range(12)]
+    collection.upsert([f"r{i}" for i in range(12)], _vectors(12), metas)
+
+    def ids(where):
+        return sorted(collection.get(where=where, include=[])["ids"], key=lambda r: int(r[1:]))
+
+    assert ids({"video": "v1"}) == ["r1", "r4", "r7", "r10"]
+    assert ids({"video": {"$in": ["v0", "v2"]}}) == ["r0", "r2", "r3", "r5", "r6", "r8", "r9", "r11"]
+    assert ids({"kind": {"$nin": ["frame"]}}) == ["r0", "r2", "r4", "r6", "r8", "r10"]
+    assert ids({"$and": [{"start": {"$gte": 3.0}}, {"start": {"$lt": 7.0}}]}) == ["r3", "r4", "r5", "r6"]
+    assert ids({"$and": [{"video": "v0"}, {"start": {"$gt": 2.0}}, {"kind": {"$ne": "audio"}}]}) == ["r3", "r9"]
+    assert ids({"$or": [{"start": {"$lte": 1.0}}, {"start": {"$eq": 11.0}}]}) == ["r0", "r1", "r11"]
+
+    # A filtered query only scores the matching rows
+    hit = collection.query(_vectors(1, seed=1), n_results=10, where={"video": "v2"}, include=["metadatas"])
+    assert sorted(hit["ids"][0], key=lambda r: int(r[1:])) == ["r2", "r5", "r8", "r11"]
+    with pytest.raises(ValueError):
+        ids({"start": {"$regex": "1"}})
+
+
+@pytest.mark.parametrize("space", ["cosine", "l2"])
+def test_distances_match_chroma_scale(client, space):
+    # Chroma reports 1 - cosine similarity for "cosine" and squared L2 for "l2"
+    collection = client.get_or_create_collection(space, metadata={"hnsw:space": space})
+    vectors = _vectors(50)
+    collection.upsert([f"r{i}" for i in range(50)], vectors)
+    query = _vectors(1, seed=2)[0]
+
+    if space == "cosine":
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = 1.0 - unit @ (query / np.linalg.norm(query))
+    else:
+        expected = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(expected)[:5]
+
+    hit = collection.query([query], n_results=5, include=["distances"])
+    assert hit["ids"][0] == [f"r{i}" for i in order]
+    np.testing.assert_allclose(hit["distances"][0], expected[order], rtol=1e-4, atol=1e-5)
+
+
+def test_ivf_recall_after_training(client, monkeypatch):
+    monkeypatch.setattr(flat_store, "FLAT_IVF_PROBES", 4)
+    collection = client.get_or_create_collection("ivf", metadata={"hnsw:space": "cosine"})
+    rng = np.random.default_rng(3)
+    centers = rng.normal(size=(16, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, 16, size=4000)] + 0.3 * rng.normal(size=(4000, 32)).astype(np.float32)
+    collection.upsert([f"r{i}" for i in range(4000)], vectors)
+    queries = centers[rng.integers(0, 16, size=20)] + 0.3 * rng.normal(size=(20, 32)).astype(np.float32)
+
+    exact = collection.query(queries, n_results=10, include=[])["ids"]
+    assert collection.train_ivf(n_lists=16) == 16
+    approx = collection.query(queries, n_results=10, include=[])["ids"]
+
+    recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(approx, exact)])
+    assert recall >= 0.9
+    # Rows written after training are assigned to a list and still found
+    collection.upsert(["late"], queries[:1])
+    assert collection.query(queries[:1], n_results=1, include=[])["ids"] == [["late"]]
+
\ No newline at end of file
@@ -0,0 +1,43 @@
+import time
+import pytest
+import remote_calls
+
+
+class _Bucket:
+    def __init__(self, fail):
+        self.fail = fail
+
+    def acquire(self, deadline=None):
+        if self.fail:
+            raise remote_calls.RemoteCallError("rate limit wait exceeds request deadline")
+
+    def block(self, seconds):
+        pass
+
+
+def test_half_open_trial_released_when_deadline_hit(monkeypatch):
+    breaker = remote_calls.CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()  # open; reset_timeout 0 makes the next call the half-open trial
+    bucket = _Bucket(fail=True)
+    monkeypatch.setattr(remote_calls, "get_breaker", lambda provider: breaker)
+    monkeypatch.setattr(remote_calls, "get_bucket", lambda provider: bucket)
+
+    with pytest.raises(remote_calls.RemoteCallError):
+        remote_calls._call_with_retry("test", lambda timeout=None: "ok", (), {}, 5.0, {"retries": 0})
+
+    # The trial never reached the provider, so the next call is let through
+    bucket.fail = False
+    assert remote_calls._call_with_retry("test", lambda timeout=None: "ok", (), {}, 5.0, {"retries": 0}) == "ok"
+    assert breaker.before_call() is False  # closed again after the successful trial
+
+
+def test_half_open_allows_single_trial():
+    breaker = remote_calls.CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    time.sleep(0.001)
+    assert breaker.before_call() is True
+    with pytest.raises(remote_calls.CircuitOpenError):
+        breaker.before_call()
+    breaker.release_trial()
+    assert breaker.before_call() is True
+
\ No newline at end of file
@@ -0,0 +1,141 @@
+import argparse
+import random
+import statistics
+import time
+import numpy as np
+import vector_db
+from config import HNSW_SPACE, HNSW_CONSTRUCTION_EF
+
+# HNSW tuning for a stored collection. Vectors are read from the collection,
+# a sample of them is used as queries, and exact top-k neighbours are
+# computed by brute force (dot product of unit vectors). Each (M, search_ef)
+# setting is then built into a scratch in-memory Chroma collection and
+# reported as recall@k against the exact result plus p50/p99 query latency.
+# Pick the cheapest setting that meets the recall target and put it in
+# config (HNSW_M / HNSW_SEARCH_EF) before (re-)creating collections.
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def load_vectors(name, max_vectors, page_size=2000):
+    collection = vector_db.get_collection(name, create=False)
+    total = min(collection.count(), max_vectors) if max_vectors else collection.count()
+    chunks = []
+    for offset in range(0, total, page_size):
+        page = collection.get(limit=min(page_size, total - offset), offset=offset, include=["embeddings"])
+        chunks.append(np.asarray(page["embeddings"], dtype=np.float32))
+    if not chunks:
+        raise SystemExit(f"Collection '{name}' is empty")
+    vectors = np.concatenate(chunks)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(vectors, queries, k):
+    latencies = []
+    truth = []
+    for q in queries:
+        start = time.perf_counter()
+        sims = vectors @ q
+        top = np.argpartition(-sims, min(k, len(sims) - 1))[:k]
+        truth.append(set(top[np.argsort(-sims[top])].tolist()))
+        latencies.append(time.perf_counter() - start)
+    return truth, latencies
+
+
+def _build(client, vectors, space, m, construction_ef, search_ef, batch=5000):
+    name = f"tune_{m}_{search_ef}_{random.randrange(1 << 30)}"
+    collection = client.create_collection(name, metadata=vector_db.hnsw_metadata(space, m, construction_ef, search_ef))
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch):
+        chunk = vectors[i:i + batch]
+        collection.add(ids=[str(j) for j in range(i, i + len(chunk))], embeddings=chunk.tolist())
+    return collection, time.perf_counter() - start
+
+
+def evaluate(collection, queries, truth, k):
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        found = {int(i) for i in result["ids"][0]}
+        recalls.append(len(found & expected) / len(expected))
+    return statistics.mean(recalls), latencies
+
+
+def run(name, ms, efs, k, sample, max_vectors, space, construction_ef, target_recall, seed):
+    import chromadb
+
+    random.seed(seed)
+    vectors = load_vectors(name, max_vectors)
+    rows = random.sample(range(len(vectors)), min(sample, len(vectors)))
+    queries = vectors[rows]
+    k = min(k, len(vectors))
+    truth, exact_latencies = brute_force(vectors, queries, k)
+    print(
+        f"{name}: {len(vectors)} vectors, dim={vectors.shape[1]}, {len(queries)} queries, k={k}, space={space}\n"
+        f"brute force: p50={_percentile(exact_latencies, 50) * 1000:.2f}ms p99={_percentile(exact_latencies, 99) * 1000:.2f}ms"
+    )
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for m in ms:
+        for ef in sorted(efs):
+            if ef < k:
+                continue
+            # search_ef is fixed at creation (not reliably modifiable across
+            # Chroma versions), so every setting gets its own build
+            collection, build_sec = _build(client, vectors, space, m, construction_ef, ef)
+            recall, latencies = evaluate(collection, queries, truth, k)
+            client.delete_collection(collection.name)
+            p50, p99 = _percentile(latencies, 50), _percentile(latencies, 99)
+            results.append((m, ef, recall, p50, p99))
+            print(
+                f"  M={m:<3} search_ef={ef:<5} recall@{k}={recall:.4f} "
+                f"p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms build={build_sec:.1f}s"
+            )
+
+    passing = [r for r in results if r[2] >= target_recall]
+    if passing:
+        m, ef, recall, p50, p99 = min(passing, key=lambda r: (r[4], r[0]))
+        print(f"Suggested: HNSW_M = {m}, HNSW_SEARCH_EF = {ef} (recall@{k}={recall:.4f}, p99={p99 * 1000:.2f}ms)")
+    else:
+        print(f"No setting reached recall@{k} >= {target_recall}; try larger M / search_ef or exact search.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep HNSW M / search_ef: recall@k vs brute force and latency")
+    parser.add_argument("--collection", default=vector_db.FRAME_TEXT_COLLECTION, help="Physical collection to sample")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--construction-ef", type=int, default=HNSW_CONSTRUCTION_EF)
+    parser.add_argument("--space", default=HNSW_SPACE, choices=["cosine", "ip", "l2"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=200, help="Stored vectors used as queries")
+    parser.add_argument("--max-vectors", type=int, default=50000, help="Use only the first N vectors (0 = all)")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(
+        args.collection,
+        args.m,
+        args.search_ef,
+        args.k,
+        args.sample,
+        args.max_vectors,
+        args.space,
+        args.construction_ef,
+        args.target_recall,
+        args.seed,
+    )
+
\ No newline at end of file
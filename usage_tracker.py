@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import USAGE_REPORT_DIR, MODEL_PRICES_PER_MTOK
+
+# Token, byte, latency and cost accounting for every pipeline stage.
+# Counters are aggregated per (video, stage, provider, model) as calls are
+# recorded, so memory stays flat over long batch runs.
+
+COUNTER_FIELDS = (
+    "calls",
+    "errors",
+    "aborted",
+    "retries",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "request_bytes",
+    "latency_sec",
+    "cost_usd",
+)
+
+_lock = threading.Lock()
+_local = threading.local()
+_default_video = ""
+_aggregates = {}
+_run_started = time.time()
+
+
+def set_video(video):
+    # Default video for records made by any thread without its own context.
+    global _default_video
+    _default_video = video or ""
+
+
+@contextmanager
+def video_context(video):
+    # Per-thread video label, for concurrent workers handling different videos.
+    previous = getattr(_local, "video", None)
+    _local.video = video or ""
+    try:
+        yield
+    finally:
+        _local.video = previous
+
+
+def current_video():
+    video = getattr(_local, "video", None)
+    return _default_video if video is None else video
+
+
+def payload_size(payload):
+    try:
+        return len(json.dumps(payload, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _usage_value(usage, name):
+    if usage is None:
+        return 0
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+def _cost(model, prompt_tokens, completion_tokens):
+    prices = MODEL_PRICES_PER_MTOK.get(model)
+    if not prices:
+        return 0.0
+    return (prompt_tokens * prices.get("prompt", 0.0) + completion_tokens * prices.get("completion", 0.0)) / 1e6
+
+
+def record(stage, provider="local", model="", usage=None, request_bytes=0, latency_sec=0.0, retries=0, error=False, video=None, aborted=False):
+    # aborted: a streamed call the consumer stopped reading (counted, no usage)
+    prompt_tokens = _usage_value(usage, "prompt_tokens")
+    completion_tokens = _usage_value(usage, "completion_tokens")
+    total_tokens = _usage_value(usage, "total_tokens") or prompt_tokens + completion_tokens
+    key = (current_video() if video is None else video, stage, provider, model or "")
+
+    with _lock:
+        agg = _aggregates.get(key)
+        if agg is None:
+            agg = dict.fromkeys(COUNTER_FIELDS, 0)
+            agg["latency_sec"] = 0.0
+            agg["cost_usd"] = 0.0
+            agg["max_latency_sec"] = 0.0
+            _aggregates[key] = agg
+        agg["calls"] += 1
+        agg["errors"] += 1 if error else 0
+        agg["aborted"] += 1 if aborted else 0
+        agg["retries"] += retries
+        agg["prompt_tokens"] += prompt_tokens
+        agg["completion_tokens"] += completion_tokens
+        agg["total_tokens"] += total_tokens
+        agg["request_bytes"] += request_bytes
+        agg["latency_sec"] += latency_sec
+        agg["cost_usd"] += _cost(model, prompt_tokens, completion_tokens)
+        agg["max_latency_sec"] = max(agg["max_latency_sec"], latency_sec)
+
+
+@contextmanager
+def track_stage(stage, video=None):
+    # Time a local (non-remote) stage such as transcription or vector storage.
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record(stage, latency_sec=time.perf_counter() - start, error=failed, video=video)
+
+
+def _merge(target, agg):
+    for field in COUNTER_FIELDS:
+        target[field] = target.get(field, 0) + agg[field]
+    target["max_latency_sec"] = max(target.get("max_latency_sec", 0.0), agg["max_latency_sec"])
+
+
+def summarize(video=None):
+    with _lock:
+        items = [(k, dict(v)) for k, v in _aggregates.items() if video is None or k[0] == video]
+
+    totals, by_stage, by_model, by_video = {}, {}, {}, {}
+    for (vid, stage, provider, model), agg in items:
+        _merge(totals, agg)
+        _merge(by_stage.setdefault(stage, {}), agg)
+        if provider != "local":
+            _merge(by_model.setdefault(f"{provider}:{model}", {}), agg)
+        video_entry = by_video.setdefault(vid, {"totals": {}, "by_stage": {}})
+        _merge(video_entry["totals"], agg)
+        _merge(video_entry["by_stage"].setdefault(stage, {}), agg)
+
+    for entry in list(by_stage.values()) + list(by_model.values()):
+        entry["avg_latency_sec"] = entry["latency_sec"] / entry["calls"] if entry["calls"] else 0.0
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "run_wall_sec": time.time() - _run_started,
+        "totals": totals,
+        "by_stage": by_stage,
+        "by_model": by_model,
+        "by_video": by_video,
+    }
+
+
+def reset():
+    global _run_started
+    with _lock:
+        _aggregates.clear()
+    _run_started = time.time()
+
+
+def _safe_name(text):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in text) or "run"
+
+
+def write_report(label, video=None, report_dir=None):
+    report = summarize(video=video)
+    report["label"] = label
+    report["video"] = video
+    out_dir = report_dir or USAGE_REPORT_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"usage_{_safe_name(label)}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    stages = sorted(report["by_stage"].items(), key=lambda kv: kv[1]["latency_sec"], reverse=True)
+    if stages:
+        print(f"Usage report: {path}")
+        for stage, agg in stages:
+            print(
+                f"  {stage:<16} calls={agg['calls']:<6} tokens={agg['total_tokens']:<8} "
+                f"bytes={agg['request_bytes']:<10} latency={agg['latency_sec']:.1f}s cost=${agg['cost_usd']:.4f}"
+            )
+    return path
+
\ No newline at end of file
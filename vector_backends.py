@@ -0,0 +1,414 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+import numpy as np
+import shard_router
+import vector_db
+from config import VECTOR_BACKEND, VECTOR_MEMORY_MAX_VIDEOS, VECTOR_NPY_DIR
+
+# Read-side vector backends used by retrieval.py. Both answer query()/get()
+# for a logical collection (vector_db.*_COLLECTION) with Chroma-shaped results:
+#   query(): {"ids": [[...]], "distances": [[...]], "metadatas": [[...]], ...}
+#            (query_many(): one inner list per query vector)
+#   get():   {"ids": [...], "embeddings": [...], ...}
+#
+#   "chroma"  search in the vector store (shard_router.open_collection):
+#             Chroma's HNSW, or flat_store.py with VECTOR_STORE = "flat"
+#   "memory"  exact search for queries scoped to one video: the video's rows
+#             are loaded once into a float32 matrix and ranked with a matmul.
+#             With VECTOR_NPY_DIR the matrix and its rows are also saved as
+#             one <video>.npz (written aside and renamed into place), which
+#             later processes load instead of Chroma. Queries without a video
+#             are passed on to Chroma.
+# Writers call invalidate() after rows of a video reach Chroma; it bumps the
+# video's invalidation generation (<video>.gen and an in-process counter),
+# drops the cached matrix and deletes the snapshot, so the next query
+# reloads. Other processes notice the deleted snapshot (its mtime is checked
+# on every query); without VECTOR_NPY_DIR only writes made in this process
+# invalidate. A load whose generation changed while it read Chroma may hold
+# rows from before the write: it is served once, but neither cached nor saved.
+# Videos with no rows yet are never cached.
+#
+# query() takes an optional window=(start_sec, end_sec), query_many() one
+# window per query vector (windows=[...], None = no window): only rows whose
+# time range (WINDOW_FIELDS) overlaps it are candidates. Chroma applies it as
+# a metadata filter, one call per distinct window; "memory" keeps a per-video
+# interval index (rows sorted by start time) and ranks only the rows found by
+# binary search, so queries with different windows still share one load.
+
+DEFAULT_INCLUDE = ("metadatas", "documents")
+WINDOW_FIELDS = {vector_db.AUDIO_COLLECTION: ("start", "end")}
+FRAME_WINDOW_FIELDS = ("scene_start", "scene_end")
+
+
+def window_fields(base):
+    return WINDOW_FIELDS.get(base, FRAME_WINDOW_FIELDS)
+
+
+def _where(base, video, window):
+    clauses = [{"video": video}] if video else []
+    if window:
+        start_key, end_key = window_fields(base)
+        clauses += [{start_key: {"$lte": float(window[1])}}, {end_key: {"$gte": float(window[0])}}]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _window_groups(windows, count):
+    # {window or None: [query positions]}
+    groups = {}
+    for q in range(count):
+        window = windows[q] if windows is not None else None
+        groups.setdefault(tuple(window) if window else None, []).append(q)
+    return groups
+
+
+class ChromaBackend:
+    name = "chroma"
+
+    def exists(self, base, video=None):
+        try:
+            shard_router.open_collection(base, video)
+            return True
+        except Exception:
+            return False
+
+    def query(self, base, query_vector, n_results, video=None, include=DEFAULT_INCLUDE, window=None):
+        return self.query_many(base, [query_vector], n_results, video, include, [window])
+
+    def query_many(self, base, query_vectors, n_results, video=None, include=DEFAULT_INCLUDE, windows=None):
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        groups = _window_groups(windows, len(queries))
+        parts = {}
+        for window, members in groups.items():
+            parts[window] = shard_router.open_collection(base, video).query(
+                query_embeddings=queries[members].tolist(),
+                n_results=n_results,
+                include=list(include),
+                where=_where(base, video, window)
+            )
+        if len(parts) == 1:
+            return next(iter(parts.values()))
+        # One result per query, back in input order
+        result = {}
+        for window, members in groups.items():
+            for key, lists in parts[window].items():
+                if key not in ("ids", "distances", "metadatas", "documents", "embeddings") or lists is None:
+                    continue
+                slots = result.setdefault(key, [None] * len(queries))
+                for pos, q in enumerate(members):
+                    slots[q] = lists[pos]
+        return result
+
+    def get(self, base, ids, include=DEFAULT_INCLUDE, video=None):
+        if not ids:
+            return {"ids": [], **{key: [] for key in include}}
+        return shard_router.open_collection(base, video).get(ids=list(ids), include=list(include))
+
+    def drop(self, base, video):
+        pass
+
+
+class _Intervals:
+    # Rows with a numeric (start, end), sorted by start. Rows overlapping
+    # [lo, hi] start within [lo - longest, hi]: two binary searches give that
+    # slice and only its end times are checked.
+    def __init__(self, metadatas, start_key, end_key):
+        rows = []
+        for i, meta in enumerate(metadatas):
+            start, end = meta.get(start_key), meta.get(end_key)
+            if isinstance(start, (int, float)) and isinstance(end, (int, float)):
+                rows.append((float(start), max(float(start), float(end)), i))
+        rows.sort()
+        self.starts = [row[0] for row in rows]
+        self.ends = [row[1] for row in rows]
+        self.positions = [row[2] for row in rows]
+        self.longest = max((end - start for start, end, _ in rows), default=0.0)
+
+    def overlapping(self, lo, hi):
+        first = bisect.bisect_left(self.starts, lo - self.longest)
+        last = bisect.bisect_right(self.starts, hi)
+        return [self.positions[j] for j in range(first, last) if self.ends[j] >= lo]
+
+
+class _VideoIndex:
+    def __init__(self, ids, matrix, metadatas, documents, stamp=None):
+        self.ids = ids
+        self.matrix = matrix # (rows, dim) float32, unit rows
+        self.metadatas = metadatas
+        self.documents = documents
+        self.positions = {row_id: i for i, row_id in enumerate(ids)}
+        self.stamp = stamp # mtime of the .npz snapshot it was read from or saved to
+        self.intervals = {} # (start_key, end_key) -> _Intervals, built on first use
+
+    def window(self, lo, hi, fields):
+        # Row positions whose time range overlaps [lo, hi]
+        intervals = self.intervals.get(fields)
+        if intervals is None:
+            intervals = self.intervals[fields] = _Intervals(self.metadatas, *fields)
+        return intervals.overlapping(float(lo), float(hi))
+
+    def rows(self, positions, include):
+        result = {"ids": [self.ids[i] for i in positions]}
+        for key in include:
+            if key == "embeddings":
+                result[key] = [np.asarray(self.matrix[i]) for i in positions]
+            elif key == "metadatas":
+                result[key] = [self.metadatas[i] for i in positions]
+            elif key == "documents":
+                result[key] = [self.documents[i] for i in positions]
+        return result
+
+
+def snapshot_paths(base, video, npy_dir=VECTOR_NPY_DIR):
+    # (<video>.npz snapshot, <video>.gen generation) of one video's rows of a logical collection
+    digest = hashlib.sha1(video.encode("utf-8")).hexdigest()[:12]
+    stem = "".join(c if c.isalnum() or c in "-_." else "_" for c in video)[:80]
+    folder = os.path.join(npy_dir, base)
+    return os.path.join(folder, f"{stem}_{digest}.npz"), os.path.join(folder, f"{stem}_{digest}.gen")
+
+
+def _read_generation(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _bump_generation(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}")
+    os.replace(tmp, path)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class MemoryBackend(ChromaBackend):
+    name = "memory"
+
+    def __init__(self, max_videos=VECTOR_MEMORY_MAX_VIDEOS, npy_dir=VECTOR_NPY_DIR):
+        self.max_videos = max(1, max_videos)
+        self.npy_dir = npy_dir
+        self._lock = threading.Lock()
+        self._videos = OrderedDict() # (base, video) -> _VideoIndex
+        self._drops = {} # (base, video) -> drop() count, the in-process generation
+        self.loads = 0
+
+    # -- snapshots ---------------------------------------------------------
+
+    def _paths(self, base, video):
+        return snapshot_paths(base, video, self.npy_dir)
+
+    def _stamp(self, base, video):
+        if not self.npy_dir:
+            return None
+        try:
+            return os.path.getmtime(self._paths(base, video)[0])
+        except OSError:
+            return None
+
+    def _generation(self, base, video):
+        # Changes whenever invalidate() runs for the video, in any process
+        on_disk = _read_generation(self._paths(base, video)[1]) if self.npy_dir else None
+        return self._drops.get((base, video), 0), on_disk
+
+    def _read_snapshot(self, base, video):
+        path = self._paths(base, video)[0]
+        try:
+            stamp = os.path.getmtime(path)
+            with np.load(path, allow_pickle=False) as data:
+                matrix = data["matrix"]
+                rows = json.loads(data["rows"].tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        if matrix.shape[0] != len(rows["ids"]):
+            return None
+        return _VideoIndex(rows["ids"], matrix, rows["metadatas"], rows["documents"], stamp)
+
+    def _write_snapshot(self, base, video, index):
+        # Vectors and rows in one file, renamed into place: readers never pair
+        # the metadata of one load with the matrix of another
+        path = self._paths(base, video)[0]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows = json.dumps({"ids": index.ids, "metadatas": index.metadatas, "documents": index.documents})
+        tmp = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                matrix=np.ascontiguousarray(index.matrix, dtype=np.float32),
+                rows=np.frombuffer(rows.encode("utf-8"), dtype=np.uint8),
+            )
+        os.replace(tmp, path)
+        return os.path.getmtime(path)
+
+    # -- loading -----------------------------------------------------------
+
+    def _load(self, base, video, generation):
+        # generation: self._generation() taken before Chroma is read
+        if self.npy_dir:
+            index = self._read_snapshot(base, video)
+            if index is not None:
+                return index
+        got = shard_router.open_collection(base, video).get(
+            where={"video": video}, include=["embeddings", "metadatas", "documents"]
+        )
+        ids = list(got.get("ids") or [])
+        embeddings = got.get("embeddings")
+        documents = got.get("documents")
+        if ids:
+            matrix = _normalize(np.asarray(embeddings, dtype=np.float32))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        index = _VideoIndex(
+            ids,
+            matrix,
+            [m or {} for m in (got.get("metadatas") or [{}] * len(ids))],
+            [d or "" for d in documents] if documents is not None else [""] * len(ids),
+        )
+        self.loads += 1
+        if self.npy_dir and ids and self._generation(base, video) == generation:
+            try:
+                index.stamp = self._write_snapshot(base, video, index)
+            except OSError as e:
+                print(f"-> Could not write vector snapshot for {video}: {e}")
+            if index.stamp is not None and self._generation(base, video) != generation:
+                # A writer invalidated between the check and the rename
+                if self._stamp(base, video) == index.stamp:
+                    try:
+                        os.remove(self._paths(base, video)[0])
+                    except OSError:
+                        pass
+                index.stamp = None
+        return index
+
+    def _index(self, base, video):
+        key = (base, video)
+        with self._lock:
+            index = self._videos.get(key)
+            if index is not None:
+                # Another process invalidated (deleted) or rewrote the snapshot
+                if self.npy_dir and index.stamp is not None and self._stamp(base, video) != index.stamp:
+                    del self._videos[key]
+                    index = None
+                else:
+                    self._videos.move_to_end(key)
+                    return index
+        generation = self._generation(base, video)
+        index = self._load(base, video, generation)
+        if not index.ids:
+            # Not cached: rows may still arrive from another process, whose
+            # invalidate() does not reach this one and leaves no snapshot to check
+            return index
+        with self._lock:
+            if self._generation(base, video) != generation:
+                # Invalidated while loading: these rows may predate the write
+                return index
+            self._videos[key] = index
+            self._videos.move_to_end(key)
+            while len(self._videos) > self.max_videos:
+                self._videos.popitem(last=False)
+        return index
+
+    # -- backend -----------------------------------------------------------
+
+    def query_many(self, base, query_vectors, n_results, video=None, include=DEFAULT_INCLUDE, windows=None):
+        if not video:
+            return super().query_many(base, query_vectors, n_results, None, include, windows)
+        index = self._index(base, video)
+        fields = [key for key in include if key != "distances"]
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        result = {key: [[] for _ in queries] for key in ["ids", "distances"] + fields}
+        for window, members in _window_groups(windows, len(queries)).items():
+            candidates = None # row positions inside the window (None = all rows)
+            if window and index.ids:
+                candidates = np.asarray(index.window(window[0], window[1], window_fields(base)), dtype=np.int64)
+            count = len(index.ids) if candidates is None else len(candidates)
+            if not count or n_results <= 0:
+                continue
+            matrix = index.matrix if candidates is None else index.matrix[candidates]
+            all_sims = matrix @ queries[members].T # (rows, queries of this window)
+            k = min(n_results, count)
+            for col, q in enumerate(members):
+                sims = all_sims[:, col]
+                top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+                top = top[np.argsort(-sims[top], kind="stable")]
+                positions = (top if candidates is None else candidates[top]).tolist()
+                rows = index.rows(positions, fields)
+                result["ids"][q] = rows["ids"]
+                result["distances"][q] = [float(1.0 - sims[i]) for i in top]
+                for key in fields:
+                    result[key][q] = rows[key]
+        return result
+
+    def get(self, base, ids, include=DEFAULT_INCLUDE, video=None):
+        if not video:
+            return super().get(base, ids, include, None)
+        index = self._index(base, video)
+        positions = [index.positions[i] for i in ids if i in index.positions]
+        return index.rows(positions, include)
+
+    def drop(self, base, video):
+        key = (base, video)
+        with self._lock:
+            self._videos.pop(key, None)
+            self._drops[key] = self._drops.get(key, 0) + 1
+
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "memory": MemoryBackend,
+}
+
+_backend_lock = threading.Lock()
+_backend = None
+
+
+def get_backend():
+    global _backend
+
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is None:
+            if VECTOR_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}' (expected one of {sorted(BACKENDS)})")
+            _backend = BACKENDS[VECTOR_BACKEND]()
+    return _backend
+
+
+def invalidate(collection_name, videos):
+    # Called after rows of these videos were written to a physical collection
+    base = collection_name.split(shard_router.SEPARATOR)[0]
+    backend = _backend
+    for video in set(videos):
+        if not video:
+            continue
+        if backend is not None:
+            backend.drop(base, video)
+        if VECTOR_NPY_DIR:
+            # Generation first: a reader that already read the old rows sees
+            # it change and does not save them
+            snapshot_path, generation_path = snapshot_paths(base, video)
+            try:
+                _bump_generation(generation_path)
+            except OSError as e:
+                print(f"-> Could not bump vector snapshot generation for {video}: {e}")
+            try:
+                os.remove(snapshot_path)
+            except OSError:
+                pass
+
\ No newline at end of file
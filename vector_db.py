@@ -0,0 +1,128 @@
+import threading
+from config import (
+    DB_PATH,
+    VECTOR_STORE,
+    CHROMA_UPSERT_BATCH,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+)
+
+# One vector store client per process, opened on first use and shared by
+# ingest (knowledge_base) and query (retrieval) code. The store is Chroma or,
+# with VECTOR_STORE = "flat", flat_store.FlatClient; both provide the same
+# client calls (get_collection / create_collection / list_collections /
+# delete_collection) and collection calls (upsert / query / get / delete /
+# count, Chroma-style where filters), so nothing else depends on which is used.
+
+FRAME_COLLECTION = "video_frames_v1" # averaged (text+image)/2 vectors
+FRAME_TEXT_COLLECTION = "video_frames_text_v1"
+FRAME_IMAGE_COLLECTION = "video_frames_image_v1"
+AUDIO_COLLECTION = "audio_segments_v1"
+
+_lock = threading.Lock()
+_client = None
+_collections = {}
+
+
+def get_client():
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _lock:
+        if _client is None:
+            if VECTOR_STORE == "flat":
+                import flat_store
+                _client = flat_store.FlatClient()
+            elif VECTOR_STORE == "chroma":
+                import chromadb
+                _client = chromadb.PersistentClient(path=DB_PATH)
+            else:
+                raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE}' (expected 'chroma' or 'flat')")
+    return _client
+
+
+def hnsw_metadata(space=HNSW_SPACE, m=HNSW_M, construction_ef=HNSW_CONSTRUCTION_EF, search_ef=HNSW_SEARCH_EF):
+    # Index settings Chroma reads from the collection metadata at creation
+    return {
+        "hnsw:space": space,
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    }
+
+
+def distance_scale(collection):
+    # Factor that puts a collection's distances on the cosine scale (1 - cos):
+    # for unit vectors squared l2 is 2 * (1 - cos), ip and cosine are 1 - cos
+    space = (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+    return 0.5 if space == "l2" else 1.0
+
+
+def _get_or_create(client, name):
+    # HNSW metadata only for a new collection: get_or_create_collection would
+    # pass it to an existing one too, and some Chroma versions overwrite the
+    # stored metadata with it
+    try:
+        return client.get_collection(name)
+    except Exception:
+        pass
+    try:
+        return client.create_collection(name, metadata=hnsw_metadata())
+    except Exception:
+        return client.get_collection(name) # created by another process meanwhile
+
+
+def get_collection(name, create=True):
+    # create=False raises if the collection does not exist (query-only tools)
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+
+    client = get_client()
+    with _lock:
+        collection = _collections.get(name)
+        if collection is None:
+            if create:
+                collection = _get_or_create(client, name)
+            else:
+                collection = client.get_collection(name)
+            _collections[name] = collection
+    return collection
+
+
+def upsert(name, ids, embeddings, metadatas, documents=None):
+    # One upsert per CHROMA_UPSERT_BATCH rows (Chroma caps the batch size)
+    collection = get_collection(name)
+    for start in range(0, len(ids), CHROMA_UPSERT_BATCH):
+        end = start + CHROMA_UPSERT_BATCH
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end],
+            documents=documents[start:end] if documents is not None else None
+        )
+
+
+def delete(name, ids=None, where=None):
+    get_collection(name, create=False).delete(ids=ids, where=where)
+
+
+def get_frame_collection(create=True):
+    return get_collection(FRAME_COLLECTION, create=create)
+
+
+def get_frame_text_collection(create=True):
+    return get_collection(FRAME_TEXT_COLLECTION, create=create)
+
+
+def get_frame_image_collection(create=True):
+    return get_collection(FRAME_IMAGE_COLLECTION, create=create)
+
+
+def get_audio_collection(create=True):
+    return get_collection(AUDIO_COLLECTION, create=create)
+
\ No newline at end of file
@@ -0,0 +1,322 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+import answer_cache
+import usage_tracker
+import vector_backends
+import vector_db
+from config import (
+    WRITE_BUFFER_MAX_ROWS,
+    WRITE_BUFFER_FLUSH_INTERVAL,
+    WRITE_BUFFER_JOURNAL_DIR,
+    WRITE_BUFFER_FSYNC,
+)
+
+# Write-behind buffer for Chroma upserts. Ingest threads only append rows to
+# a journal and an in-memory queue; a background thread writes the queue in
+# large per-collection batches once WRITE_BUFFER_MAX_ROWS rows are pending or
+# every WRITE_BUFFER_FLUSH_INTERVAL seconds, and once more at exit.
+#
+# Durability: every add() is appended to a JSONL journal segment before it
+# returns. A segment is deleted only after its rows are in Chroma. Segments
+# left behind by a crashed process (not touched for a while; the owner
+# touches its open segment and the segments of a failed flush on every
+# wake-up) are replayed on the next start.
+#
+# Ordering: every add() gets a sequence number (next_seq(): nanosecond clock,
+# strictly increasing per process) that is journaled with its rows and written
+# into their metadata as WRITE_SEQ_KEY; knowledge_base stamps direct writes
+# (buffer off) from the same clock. Of two queued versions of an id the higher
+# sequence wins, and a replayed row is dropped when the stored row already
+# carries the same or a higher sequence, so a leftover segment cannot roll
+# back a newer write of the same id.
+#
+# add(..., invalidate_answers=False) (lazy enrichment write-backs) keeps the
+# answer_cache entries of the rows' videos; the flag is journaled with them.
+
+_PENDING_LIMIT_FACTOR = 4 # add() blocks while this many batches are queued
+WRITE_SEQ_KEY = "write_seq"
+_SEQ_LOOKUP_BATCH = 500 # ids per get() when checking replayed rows
+
+_seq_lock = threading.Lock()
+_last_seq = 0
+
+
+def next_seq():
+    global _last_seq
+
+    with _seq_lock:
+        _last_seq = max(_last_seq + 1, time.time_ns())
+        return _last_seq
+
+
+def _json_default(value):
+    # numpy scalars in metadata
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class WriteBuffer:
+    def __init__(self, max_rows=WRITE_BUFFER_MAX_ROWS, interval=WRITE_BUFFER_FLUSH_INTERVAL, journal_dir=WRITE_BUFFER_JOURNAL_DIR):
+        self.max_rows = max(1, max_rows)
+        self.interval = max(0.1, interval)
+        self.journal_dir = journal_dir
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending = {} # collection -> {id: (embedding, metadata, document, seq, invalidate_answers)}
+        self._rows = 0
+        self._closed = False
+        self._journal = None
+        self._journal_path = None
+        self._carried_segments = [] # segments whose rows are back in _pending
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+            self._replay_orphans()
+        self._thread = threading.Thread(target=self._run, name="chroma-writer", daemon=True)
+        self._thread.start()
+
+    # -- journal -----------------------------------------------------------
+
+    def _stale_after(self):
+        return max(60.0, 5 * self.interval)
+
+    def _replay_orphans(self):
+        now = time.time()
+        replayed = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "journal_*.jsonl"))):
+            try:
+                if now - os.path.getmtime(path) < self._stale_after():
+                    continue # probably owned by a running process
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue # torn last line from a crash
+                        self._queue(entry["c"], entry["ids"], entry["e"], entry["m"], entry.get("d"), entry.get("s", 0), entry.get("a", True))
+            except OSError:
+                continue
+            replayed.append(path)
+        if not replayed:
+            return
+        skipped = self._drop_superseded()
+        print(
+            f"-> Replaying {self._rows} rows from {len(replayed)} unflushed write journal(s)"
+            + (f" ({skipped} already stored in a newer version)..." if skipped else "...")
+        )
+        self._carried_segments.extend(replayed)
+
+    @staticmethod
+    def _stored_seqs(name, ids):
+        # {id: WRITE_SEQ_KEY of the stored row} (-1 for rows written without one)
+        try:
+            collection = vector_db.get_collection(name, create=False)
+        except Exception:
+            return {} # collection not created yet: nothing stored
+        seqs = {}
+        for start in range(0, len(ids), _SEQ_LOOKUP_BATCH):
+            got = collection.get(ids=ids[start:start + _SEQ_LOOKUP_BATCH], include=["metadatas"])
+            for row_id, meta in zip(got.get("ids") or [], got.get("metadatas") or []):
+                seqs[row_id] = (meta or {}).get(WRITE_SEQ_KEY, -1)
+        return seqs
+
+    def _drop_superseded(self):
+        # Replayed rows whose stored version is as new or newer
+        skipped = 0
+        for name, rows in self._pending.items():
+            stored = self._stored_seqs(name, list(rows))
+            for row_id, seq in stored.items():
+                if row_id in rows and seq >= rows[row_id][3]:
+                    del rows[row_id]
+                    skipped += 1
+        self._rows -= skipped
+        return skipped
+
+    def _append_journal(self, entry):
+        if not self.journal_dir:
+            return
+        if self._journal is None:
+            name = f"journal_{os.getpid()}_{uuid.uuid4().hex[:8]}.jsonl"
+            self._journal_path = os.path.join(self.journal_dir, name)
+            self._journal = open(self._journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(entry, default=_json_default) + "\n")
+        self._journal.flush()
+        if WRITE_BUFFER_FSYNC:
+            os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        # Close the open segment; its rows are the batch being written
+        path = self._journal_path
+        if self._journal is not None:
+            self._journal.close()
+        self._journal, self._journal_path = None, None
+        return path
+
+    @staticmethod
+    def _touch(paths):
+        # Heartbeat: segments still owned by this process are not orphans
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # -- queue -------------------------------------------------------------
+
+    def _queue(self, name, ids, embeddings, metadatas, documents, seq, invalidate_answers=True):
+        rows = self._pending.setdefault(name, {})
+        before = len(rows)
+        for i, row_id in enumerate(ids):
+            queued = rows.pop(row_id, None)
+            if queued is not None and queued[3] > seq:
+                rows[row_id] = queued # a replayed segment older than the queued row
+                continue
+            rows[row_id] = (embeddings[i], metadatas[i], documents[i] if documents is not None else None, seq, invalidate_answers)
+        added = len(rows) - before
+        self._rows += added
+        return added
+
+    def add(self, collection_name, ids, embeddings, metadatas, documents=None, invalidate_answers=True):
+        if not ids:
+            return
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write buffer is closed")
+            while self._rows >= _PENDING_LIMIT_FACTOR * self.max_rows:
+                self._cond.wait() # back-pressure: the writer is behind
+            seq = next_seq()
+            entry = {"c": collection_name, "ids": ids, "e": embeddings, "m": metadatas, "d": documents, "s": seq}
+            if not invalidate_answers:
+                entry["a"] = False
+            self._append_journal(entry)
+            self._queue(collection_name, ids, embeddings, metadatas, documents, seq, invalidate_answers)
+            if self._rows >= self.max_rows:
+                self._cond.notify_all()
+
+    # -- writing -----------------------------------------------------------
+
+    @staticmethod
+    def _write_collection(name, rows):
+        ids = list(rows)
+        embeddings = [rows[i][0] for i in ids]
+        metadatas = [{**(rows[i][1] or {}), WRITE_SEQ_KEY: rows[i][3]} for i in ids]
+        documents = [rows[i][2] for i in ids]
+        if all(d is None for d in documents):
+            documents = None
+        else:
+            documents = [d or "" for d in documents]
+        vector_db.upsert(name, ids, embeddings, metadatas, documents)
+        videos = [(m or {}).get("video") for m in metadatas]
+        vector_backends.invalidate(name, videos)
+        answer_cache.invalidate([video for video, i in zip(videos, ids) if rows[i][4]])
+
+    def flush(self):
+        # Write everything queued so far; returns the number of rows written
+        with self._write_lock:
+            with self._cond:
+                if not self._rows:
+                    return 0
+                batch, self._pending, self._rows = self._pending, {}, 0
+                segments = self._carried_segments + [p for p in [self._rotate_journal()] if p]
+                self._carried_segments = []
+                self._cond.notify_all()
+
+            self._touch(segments) # a slow write must not look like a crash
+            count = sum(len(rows) for rows in batch.values())
+            start = time.perf_counter()
+            try:
+                for name, rows in batch.items():
+                    self._write_collection(name, rows)
+            except Exception as e:
+                self.errors += 1
+                print(f"-> Write buffer flush of {count} rows failed ({e}); will retry.")
+                with self._cond:
+                    for name, rows in batch.items():
+                        newer = self._pending.get(name, {})
+                        merged = dict(rows)
+                        for row_id, row in newer.items():
+                            if row_id not in merged or row[3] >= merged[row_id][3]:
+                                merged.pop(row_id, None)
+                                merged[row_id] = row
+                        self._pending[name] = merged
+                    self._rows = sum(len(rows) for rows in self._pending.values())
+                    self._carried_segments.extend(segments)
+                usage_tracker.record("db_flush", latency_sec=time.perf_counter() - start, error=True)
+                return 0
+
+            self._remove(segments)
+            self.flushes += 1
+            self.rows_written += count
+            usage_tracker.record("db_flush", latency_sec=time.perf_counter() - start)
+            return count
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._rows >= self.max_rows, timeout=self.interval)
+                if self._closed:
+                    return
+                self._touch(self._carried_segments + [p for p in [self._journal_path] if p])
+            errors = self.errors
+            self.flush()
+            if self.errors != errors:
+                time.sleep(self.interval) # database unavailable: back off
+
+    def pending_rows(self):
+        with self._cond:
+            return self._rows
+
+    def close(self):
+        # Stop the writer and write what is left (registered with atexit)
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+        with self._cond:
+            if not self._rows:
+                self._remove([p for p in [self._rotate_journal()] if p])
+
+
+_buffer_lock = threading.Lock()
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+
+    if _buffer is not None:
+        return _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBuffer()
+            atexit.register(_buffer.close)
+    return _buffer
+
+
+def flush():
+    # Make queued rows visible to readers in this process (no-op if unused)
+    if _buffer is not None:
+        return _buffer.flush()
+    return 0
+
\ No newline at end of file